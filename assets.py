@@ -1,23 +1,104 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Request, Response, request, jsonify, send_file, send_from_directory, abort, g
 import os
 import json
 import re
+import hashlib
+import base64
+import io
+import math
+import uuid
+from datetime import datetime, timezone
 from werkzeug.utils import secure_filename
+from werkzeug.security import safe_join
+from werkzeug.exceptions import RequestEntityTooLarge
 from flask_cors import CORS
+from scanner import ORDER_MANIFEST, read_order, scan_category, scan_tree, scan_fingerprint
+from transcode import transcode_to_webp
+from PIL import Image
 import shutil
 import zipfile
 
 
+# --- Streaming multipart uploads ---
+# Werkzeug normally spools each uploaded part to memory or an anonymous temp
+# file, and FileStorage.save() then copies it a second time. Instead every
+# part streams straight into its own file under UPLOAD_STAGING_DIR (kept on
+# the same filesystem as static/), so committing an upload is a rename. The
+# per-request cap is MAX_CONTENT_LENGTH; the per-file cap is enforced while
+# the part is being written. Parts a route never committed are removed when
+# the request ends.
+UPLOAD_STAGING_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'upload_staging')
+MAX_UPLOAD_FILE_BYTES = int(os.environ.get("MAX_UPLOAD_FILE_BYTES", str(50 * 1024 * 1024)))
+MAX_UPLOAD_REQUEST_BYTES = int(os.environ.get("MAX_UPLOAD_REQUEST_BYTES", str(1024 * 1024 * 1024)))
+
+
+class StagedUploadFile(io.FileIO):
+    def __init__(self, path, limit):
+        super().__init__(path, 'x+')
+        self.staged_path = path
+        self.limit = limit
+        self.written = 0
+
+    def write(self, data):
+        self.written += len(data)
+        if self.written > self.limit:
+            raise RequestEntityTooLarge(f"Each file must be at most {self.limit} bytes.")
+        return super().write(data)
+
+
+class StagingRequest(Request):
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        os.makedirs(UPLOAD_STAGING_DIR, exist_ok=True)
+        stream = StagedUploadFile(
+            os.path.join(UPLOAD_STAGING_DIR, f"{uuid.uuid4().hex}.part"), MAX_UPLOAD_FILE_BYTES
+        )
+        g.setdefault("staged_uploads", []).append(stream.staged_path)
+        return stream
+
+
 app = Flask(__name__)
+app.request_class = StagingRequest
+app.config["MAX_CONTENT_LENGTH"] = MAX_UPLOAD_REQUEST_BYTES
 CORS(app, resources={r"/*": {"origins": "*"}})
 
 
+@app.before_request
+def parse_uploads_early():
+    # Parse multipart bodies before the view runs, so an oversized file is a
+    # 413 from Flask rather than an exception inside a route's try/except.
+    if request.mimetype == "multipart/form-data":
+        request.files
+
+
+@app.teardown_request
+def discard_staged_uploads(exc):
+    for path in g.pop("staged_uploads", []):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass  # Committed (renamed into place)
+
+
+def commit_upload(file, path):
+    # Moves a staged upload into place; anything else falls back to a copy
+    staged_path = getattr(file.stream, "staged_path", None)
+    if staged_path and os.path.exists(staged_path):
+        try:
+            os.replace(staged_path, path)
+            return
+        except OSError:
+            pass  # Different filesystem: copy below
+    file.stream.seek(0)
+    file.save(path)
+
+
 # --- Configurable Paths ---
 BASE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'Imagine-New')
 
 JSON_FOLDER = os.path.join(BASE_PATH, "Json_Files")
 STATIC_URL_PATH = "/static/Imagine-New"
 UPLOAD_FOLDER = BASE_PATH
+IMAGINE_IMAGE_EXTENSIONS = ('.jpg', '.png')
 
 
 
@@ -26,6 +107,442 @@ def sanitize_name(name):
     return re.sub(r'[^a-zA-Z0-9_-]', '_', name.strip())
 
 
+# --- Conditional GET helpers (ETag / If-None-Match, Last-Modified / If-Modified-Since) ---
+def _is_not_modified(etag, last_modified):
+    # If-None-Match wins over If-Modified-Since when both are sent (RFC 9110)
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    if request.if_modified_since and last_modified:
+        return last_modified.replace(microsecond=0) <= request.if_modified_since
+    return False
+
+
+def conditional_response(etag, last_modified, build_response):
+    # build_response() is only called when the client's copy is stale
+    if _is_not_modified(etag, last_modified):
+        response = app.response_class(status=304)
+    else:
+        response = app.make_response(build_response())
+    response.set_etag(etag)
+    if last_modified:
+        response.last_modified = last_modified
+    response.headers["Cache-Control"] = "no-cache"  # cache, but revalidate every time
+    return response
+
+
+# --- Logical image order ---
+# A category folder may hold an ORDER_MANIFEST listing its image files in
+# display order. Position p is then published as f"{p}{ext}" (the N.webp /
+# template_number addressing clients already use) whatever the file is called
+# on disk, so inserting, deleting or reordering rewrites this one small file
+# instead of renaming every image after the affected position. Files stored
+# in a folder with a manifest get stable ids (new_image_id()) that never
+# change. A folder without one keeps the legacy layout: numbered files whose
+# public name is their file name.
+class OrderError(ValueError):
+    # A legacy folder whose numbered files are not exactly 0..n-1, one file each
+    pass
+
+
+def load_order(folder, extensions):
+    # The manifest order, or the legacy one (numbered files by number) for a
+    # folder about to get a manifest. Raises OrderError rather than guess at
+    # positions when legacy numbers collide (4.jpg and 4.png) or skip one.
+    order = read_order(folder)
+    if order is None:
+        numbered = {}
+        for name in os.listdir(folder):
+            stem = os.path.splitext(name)[0]
+            if name.lower().endswith(extensions) and stem.isdigit():
+                numbered.setdefault(int(stem), []).append(name)
+        duplicates = sorted(n for n, names in numbered.items() if len(names) > 1)
+        if duplicates:
+            raise OrderError(f"image numbers used by more than one file: {', '.join(map(str, duplicates))}")
+        missing = sorted(set(range(len(numbered))) - set(numbered))
+        if missing:
+            raise OrderError(f"missing image numbers: {', '.join(map(str, missing))}")
+        order = [numbered[n][0] for n in sorted(numbered)]
+    return order
+
+
+def save_order(folder, order, journal=None):
+    path = os.path.join(folder, ORDER_MANIFEST)
+    if journal:
+        journal_write_json(journal, path, {"order": order}, indent=None)
+    else:
+        write_json_file(path, {"order": order}, indent=None)
+
+
+def new_image_id(ext):
+    return f"i{uuid.uuid4().hex[:12]}{ext}"
+
+
+def order_map(folder):
+    # {public name: file name} for a folder with a manifest, None for a legacy folder
+    order = read_order(folder)
+    if order is None:
+        return None
+    return {f"{position}{os.path.splitext(name)[1]}": name for position, name in enumerate(order)}
+
+
+def resolve_image(folder, name, names=False):
+    # Path of the file published as `name`, or None if no position maps to it.
+    # `names` is the folder's order_map() when the caller already has it
+    if names is False:
+        names = order_map(folder)
+    if names is None:
+        return os.path.join(folder, name)
+    physical = names.get(name)
+    return os.path.join(folder, physical) if physical else None
+
+
+def store_position(folder, order, position, ext):
+    # Where new content for `position` goes: N{ext} in a legacy folder (order
+    # None), otherwise a fresh id that takes over the slot in `order`
+    if order is None:
+        return os.path.join(folder, secure_filename(f"{position}{ext}"))
+    name = secure_filename(new_image_id(ext))
+    if position < len(order):
+        order[position] = name
+    else:
+        order.append(name)
+    return os.path.join(folder, name)
+
+
+def permute_order(order, requested):
+    # `requested` names every current position once ("3.webp" or "3"), in the
+    # new order. Returns (new order, {old position: new position} of the
+    # images that move); raises ValueError for anything but a permutation.
+    positions = []
+    for name in requested:
+        stem = os.path.splitext(str(name))[0]
+        if not stem.isdigit():
+            raise ValueError(f"Invalid image name '{name}'")
+        positions.append(int(stem))
+    if sorted(positions) != list(range(len(order))):
+        raise ValueError(f"order must list each of the {len(order)} images exactly once")
+    return [order[p] for p in positions], {old: new for new, old in enumerate(positions) if old != new}
+
+
+def permute_json(json_data, moves):
+    # Moves ImageN entries of a positional category JSON along with their images
+    moved = {new: json_data.get(f"Image{old}") for old, new in moves.items()}
+    for new, entry in moved.items():
+        if entry is None:
+            json_data.pop(f"Image{new}", None)
+        else:
+            entry["Name"] = str(new)
+            json_data[f"Image{new}"] = entry
+    return json_data
+
+
+# --- Cursor pagination helpers ---
+# Cursors are opaque base64 JSON holding the catalog version they were issued
+# for and the sort key of the last item returned. Keying on names instead of
+# offsets keeps a cursor valid when items are added or removed before it.
+PAGE_PARAMS = ('limit', 'cursor', 'category', 'sub_category', 'include_images')
+MAX_PAGE_LIMIT = 500
+
+
+class CursorError(ValueError):
+    # A well-formed cursor that does not fit the listing it was sent to
+    pass
+
+
+def encode_cursor(data):
+    raw = json.dumps(data, separators=(",", ":")).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip("=")
+
+
+def decode_cursor(cursor):
+    padded = cursor + "=" * (-len(cursor) % 4)
+    data = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    if not isinstance(data, dict):
+        raise ValueError("Malformed cursor")
+    # Image and Imagine category pages resume after a name, IBGC category pages after [main, sub]
+    after = data.get("after")
+    if not (after is None or isinstance(after, str) or
+            (isinstance(after, list) and len(after) == 2 and all(isinstance(part, str) for part in after))):
+        raise ValueError("Malformed cursor")
+    return data
+
+
+def get_page_args():
+    # Returns (limit, cursor_state, main_filter, sub_filter, include_images); raises ValueError on bad input
+    limit = request.args.get('limit')
+    if limit is not None:
+        limit = int(limit)
+        if limit < 1 or limit > MAX_PAGE_LIMIT:
+            raise ValueError(f"limit must be between 1 and {MAX_PAGE_LIMIT}")
+    cursor = request.args.get('cursor')
+    state = decode_cursor(cursor) if cursor else {}
+    include_images = request.args.get('include_images', 'true').lower() != 'false'
+    return limit, state, request.args.get('category'), request.args.get('sub_category'), include_images
+
+
+def paginate_after(items, key, after, limit):
+    start = 0
+    if after is not None:
+        if items and isinstance(key(items[0]), list) != isinstance(after, list):
+            raise CursorError("cursor belongs to a different listing")
+        start = next((i for i, item in enumerate(items) if key(item) > after), len(items))
+    page = items[start:start + limit] if limit else items[start:]
+    has_more = start + len(page) < len(items)
+    return page, has_more
+
+
+def query_fingerprint():
+    query = "&".join(f"{k}={v}" for k, v in sorted(request.args.items(multi=True)))
+    return hashlib.sha1(query.encode('utf-8')).hexdigest()[:12]
+
+
+# --- Downscaled renditions (thumbnails) generated at ingest ---
+# Renditions are keyed by the sha256 of the source bytes, not by its path:
+# renumbering, swapping or snapshotting an image keeps its renditions, and
+# replacing the source yields new URLs, so a stale tile can never be served.
+RENDITION_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'Renditions')
+RENDITION_URL_PATH = "/static/Renditions"
+RENDITION_SIZES = tuple(
+    int(size) for size in os.environ.get("RENDITION_SIZES", "128,256,512").split(",") if size.strip()
+)
+RENDITION_QUALITY = int(os.environ.get("RENDITION_QUALITY", "80"))
+
+_digest_cache = {}  # (st_dev, st_ino, st_size, st_mtime_ns) -> sha256 of the file
+
+
+def image_digest(path, st=None):
+    st = st or os.stat(path)
+    key = (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+    digest = _digest_cache.get(key)
+    if digest is None:
+        digest = file_digest(path)
+        _digest_cache[key] = digest
+    return digest
+
+
+def rendition_path(digest, size):
+    return os.path.join(RENDITION_DIR, str(size), digest[:2], f"{digest}.webp")
+
+
+def image_renditions(path, st=None):
+    # {"128": url, ...} for an image whose renditions exist, otherwise {}
+    if not RENDITION_SIZES:
+        return {}
+    digest = image_digest(path, st)
+    if not os.path.exists(rendition_path(digest, RENDITION_SIZES[-1])):
+        return {}
+    return {str(size): f"{RENDITION_URL_PATH}/{size}/{digest[:2]}/{digest}.webp" for size in RENDITION_SIZES}
+
+
+def generate_renditions(path):
+    # Never fails the upload: a file Pillow cannot read simply gets no renditions
+    digest = image_digest(path)
+    missing = [size for size in RENDITION_SIZES if not os.path.exists(rendition_path(digest, size))]
+    if not missing:
+        return digest
+
+    try:
+        with Image.open(path) as img:
+            img.load()
+            if img.mode not in ("RGB", "RGBA"):
+                img = img.convert("RGBA" if "transparency" in img.info or "A" in img.getbands() else "RGB")
+            # Smallest first, so the largest one (the completeness marker image_renditions checks) lands last
+            for size in sorted(missing):
+                rendition = img.copy()
+                rendition.thumbnail((size, size), Image.LANCZOS)
+                buffer = io.BytesIO()
+                rendition.save(buffer, "WEBP", quality=RENDITION_QUALITY)
+                write_bytes_file(rendition_path(digest, size), buffer.getvalue())
+    except Exception as e:
+        print(f"Failed to build renditions for {path}: {e}")
+    return digest
+
+
+# --- Fingerprinted image URLs ---
+# Catalog URLs carry ?v=<first 16 hex of the file's sha256>. The static handler
+# marks a response immutable only when that fingerprint still matches the
+# bytes on disk, so a reorder or replace can never pin the wrong content in a
+# client or CDN cache; a stale fingerprint is served with no-cache instead.
+FINGERPRINT_LENGTH = 16
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+def fingerprinted_url(url, path, st=None):
+    return f"{url}?v={image_digest(path, st)[:FINGERPRINT_LENGTH]}"
+
+
+def _fingerprint_cache_control(response, path):
+    if request.args.get('v'):
+        try:
+            current = image_digest(path)[:FINGERPRINT_LENGTH]
+        except OSError:
+            current = None
+        response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL if request.args['v'] == current else "no-cache"
+
+
+@app.after_request
+def cache_fingerprinted_static(response):
+    if request.endpoint != 'static' or response.status_code not in (200, 206, 304):
+        return response
+
+    filename = (request.view_args or {}).get('filename', '')
+    if filename.startswith(('Renditions/', 'Sprites_IBGC/')):
+        # Rendition and atlas paths are already named after their content
+        response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+    else:
+        _fingerprint_cache_control(response, os.path.join(app.static_folder, filename))
+    return response
+
+
+# Catalog images are requested by public name; this maps them onto the file
+# that currently holds that position (see ORDER_MANIFEST) before serving.
+@app.route('/static/Assets_IBGC/<path:filename>', defaults={'root': 'Assets_IBGC'})
+@app.route('/static/Imagine-New/<path:filename>', defaults={'root': 'Imagine-New'})
+def catalog_image(root, filename):
+    requested = safe_join(os.path.join(app.static_folder, root), filename)
+    path = resolve_image(*os.path.split(requested)) if requested else None
+    if not path or not os.path.isfile(path):
+        abort(404)
+
+    response = send_from_directory(app.static_folder, os.path.relpath(path, app.static_folder))
+    if response.status_code in (200, 206, 304):
+        _fingerprint_cache_control(response, path)
+    return response
+
+
+# --- Intrinsic image metadata (dimensions, bytes, format, hash, placeholder) ---
+# Recorded once per distinct content at ingest, keyed by sha256 like the
+# renditions, so renumbering or swapping files never invalidates it. The
+# record also holds the LQIP: a ~20px blurred-looking webp as a data: URI
+# that clients paint while the real image loads.
+IMAGE_META_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'image_meta')
+LQIP_SIZE = int(os.environ.get("LQIP_SIZE", "20"))
+LQIP_QUALITY = int(os.environ.get("LQIP_QUALITY", "40"))
+_image_meta_cache = {}  # sha256 -> metadata dict
+
+
+def image_meta_path(digest):
+    return os.path.join(IMAGE_META_DIR, digest[:2], f"{digest}.json")
+
+
+def lqip_data_uri(img):
+    img.draft("RGB", (LQIP_SIZE, LQIP_SIZE))  # JPEG: decode at reduced scale; no-op otherwise
+    if img.mode not in ("RGB", "RGBA"):
+        img = img.convert("RGBA" if img.has_transparency_data else "RGB")
+    placeholder = img.copy()
+    placeholder.thumbnail((LQIP_SIZE, LQIP_SIZE), Image.BILINEAR)
+    buffer = io.BytesIO()
+    placeholder.save(buffer, "WEBP", quality=LQIP_QUALITY)
+    return "data:image/webp;base64," + base64.b64encode(buffer.getvalue()).decode('ascii')
+
+
+def record_image_meta(path):
+    digest = image_digest(path)
+    meta_path = image_meta_path(digest)
+    if "lqip" in (get_image_meta(path) or {}):
+        return digest  # Complete record (older ones predate the placeholder)
+
+    # Never fails the upload: an unreadable image or a failed write just leaves no record
+    try:
+        with Image.open(path) as img:
+            width, height, image_format = img.width, img.height, img.format
+            lqip = lqip_data_uri(img)
+
+        meta = {
+            "width": width,
+            "height": height,
+            "bytes": os.path.getsize(path),
+            "format": image_format.lower() if image_format else None,
+            "hash": f"sha256:{digest}",
+            "lqip": lqip
+        }
+        write_json_file(meta_path, meta, indent=None)
+    except Exception as e:
+        print(f"Failed to record image metadata for {path}: {e}")
+        return digest
+
+    _image_meta_cache[digest] = meta
+    return digest
+
+
+def get_image_meta(path, st=None):
+    # Metadata recorded for this file's content, or None if it was never ingested/backfilled
+    digest = image_digest(path, st)
+    meta = _image_meta_cache.get(digest)
+    if meta is None:
+        try:
+            with open(image_meta_path(digest), 'r') as f:
+                meta = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        _image_meta_cache[digest] = meta
+    return meta
+
+
+def image_catalog_fields(path, st=None):
+    # Derived per-image fields every catalog response carries
+    meta = get_image_meta(path, st)
+    lqip = None
+    if meta is not None:
+        meta = dict(meta)
+        lqip = meta.pop("lqip", None)
+    return {"renditions": image_renditions(path, st), "meta": meta, "lqip": lqip}
+
+
+def ingest_image(path):
+    # Everything derived from a newly stored image; never fails the upload
+    record_image_meta(path)
+    generate_renditions(path)
+
+
+def catalog_image_sources():
+    for root in (BASE_PATH, CURRENT_DIR, BACKUP_DIR):
+        for dir_path, dirs, files in os.walk(root):
+            for name in files:
+                if name.lower().endswith(IMAGE_EXTENSIONS):
+                    yield os.path.join(dir_path, name)
+
+
+@app.cli.command("renditions-build")
+def renditions_build_command():
+    # Backfill renditions for every image and drop the ones nothing points at anymore
+    referenced = {generate_renditions(path) for path in catalog_image_sources()}
+
+    removed = 0
+    for dir_path, dirs, files in os.walk(RENDITION_DIR):
+        size = os.path.relpath(dir_path, RENDITION_DIR).split(os.sep)[0]
+        for name in files:
+            digest = os.path.splitext(name)[0]
+            if digest not in referenced or not size.isdigit() or int(size) not in RENDITION_SIZES:
+                os.remove(os.path.join(dir_path, name))
+                removed += 1
+    refresh_catalog_payload()
+    print(f"Renditions ready for {len(referenced)} image(s), removed {removed} stale file(s).")
+
+
+def refresh_catalog_payload():
+    # Backfills change what the current version's catalog lists without a new version.
+    # The payload's ETag carries its digest, so clients holding the old bytes refetch;
+    # workers serve the new file at once (paged views after a restart).
+    if os.path.exists(CURRENT_DIR):
+        version_lock = ibgc_version_lock()  # Not while a writer is publishing
+        try:
+            version_info = get_current_version()
+            write_catalog_payload(version_info.get("current_version", 0), get_catalog_index(version_info))
+        finally:
+            release_locks([version_lock])
+
+
+@app.cli.command("image-meta-backfill")
+def image_meta_backfill_command():
+    # Record metadata (and placeholders) for images stored before they were captured at ingest
+    before = sum(len(files) for _, _, files in os.walk(IMAGE_META_DIR))
+    digests = {record_image_meta(path) for path in catalog_image_sources()}
+    after = sum(len(files) for _, _, files in os.walk(IMAGE_META_DIR))
+    refresh_catalog_payload()
+    print(f"Metadata present for {len(digests)} image(s), {after - before} newly recorded.")
+
+
 
                 ########  **** ( IMAGINE APP ) **** ########
 # ----- Login Function -----
@@ -87,6 +604,8 @@ def add_category():
     else:
         json_data = {}
 
+    order = read_order(image_folder)
+
     # --- Process all images ---
     index = 0
     for key in sorted(image_keys):  
@@ -102,9 +621,12 @@ def add_category():
         actual_ext = f'.{user_ext}'
 
         # --- Save file ---
-        filename = f"{index}{actual_ext}"
-        filepath = os.path.join(image_folder, secure_filename(filename))
-        file.save(filepath)
+        replaced = order[index] if order is not None and index < len(order) else None
+        filepath = store_position(image_folder, order, index, actual_ext)
+        commit_upload(file, filepath)
+        ingest_image(filepath)
+        if replaced:
+            os.remove(os.path.join(image_folder, replaced))
 
         # --- Metadata ---
         prem_str = request.form.get(f'prem_{index}', 'false')
@@ -123,6 +645,9 @@ def add_category():
         json_data[f"Image{index}"] = entry
         index += 1
 
+    if order is not None:
+        save_order(image_folder, order)
+
     with open(json_file_path, 'w') as f:
         json.dump(json_data, f, indent=4)
 
@@ -133,75 +658,123 @@ def add_category():
         ################## --- GET Categories and Subcategories with Images and Metadata ( For Delete & Update Category Action ) ---#################
 @app.route('/get-categories', methods=['GET'])
 def get_categories():
-    all_categories = []
-
     if not os.path.exists(BASE_PATH):
         return jsonify({"categories": []}), 200
 
-    for main_cat in os.listdir(BASE_PATH):
-        main_cat_path = os.path.join(BASE_PATH, main_cat)
+    tree = scan_tree(BASE_PATH, IMAGINE_IMAGE_EXTENSIONS)
+    fingerprint, last_modified = scan_fingerprint(tree, JSON_FOLDER)
+    if any(param in request.args for param in PAGE_PARAMS):
+        try:
+            page_args = get_page_args()
+        except ValueError as e:
+            return jsonify({"error": f"Invalid pagination parameters: {e}"}), 400
+        try:
+            return conditional_response(
+                f"imagine-{fingerprint}-q{query_fingerprint()}",
+                last_modified,
+                lambda: _build_get_categories_page(tree, fingerprint[:16], *page_args)
+            )
+        except CursorError as e:
+            return jsonify({"error": f"Invalid pagination parameters: {e}"}), 400
+
+    return conditional_response(
+        f"imagine-{fingerprint}", last_modified,
+        lambda: jsonify({"categories": _collect_get_categories(tree)})
+    )
 
-        if not os.path.isdir(main_cat_path) or main_cat == "Json_Files":
-            continue
 
-        sub_cats = []
-        found_sub = False
+# ---- Paged / per-category variant of /get-categories ----
+def _build_get_categories_page(tree, tree_version, limit, state, main_filter, sub_filter, include_images):
+    response = {
+        "version": tree_version,
+        "version_changed": "v" in state and state["v"] != tree_version
+    }
 
-        for sub in os.listdir(main_cat_path):
-            sub_path = os.path.join(main_cat_path, sub)
-            if not os.path.isdir(sub_path):
-                continue
+    if main_filter:
+        categories = _collect_get_categories([c for c in tree if c.name == main_filter])
+        if not categories:
+            return jsonify({"error": f"Category '{main_filter}' not found."}), 404
+        sub_cats = categories[0]["sub_categories"]
+        if sub_filter:
+            sub_cats = [sc for sc in sub_cats if sc["name"] == sub_filter]
+            if not sub_cats:
+                return jsonify({"error": f"Sub category '{sub_filter}' not found in '{main_filter}'."}), 404
+
+        if len(sub_cats) == 1:
+            # Single (sub)category: page through its images, with only their metadata
+            sub_cat = sub_cats[0]
+            images = sub_cat["images"]
+            page, has_more = paginate_after(images, lambda img: img["name"], state.get("after"), limit)
+            page_keys = {f"Image{os.path.splitext(img['name'])[0]}" for img in page}
+            response.update({
+                "main_category": main_filter,
+                "sub_category": sub_cat["name"],
+                "total_images": len(images),
+                "images": page,
+                "json": {k: v for k, v in sub_cat["json"].items() if k in page_keys}
+            })
+            next_after = page[-1]["name"] if page else None
+        else:
+            categories[0]["sub_categories"] = sub_cats
+            page, has_more = categories, False
+            response["categories"] = page
+            next_after = None
+    else:
+        page_tree, has_more = paginate_after(tree, lambda c: c.name, state.get("after"), limit)
+        page = _collect_get_categories(page_tree)
+        response["categories"] = page
+        next_after = page[-1]["main_category"] if page else None
+
+    if not include_images:
+        for category in response.get("categories", []):
+            for sub_cat in category["sub_categories"]:
+                sub_cat["total_images"] = len(sub_cat.pop("images"))
+                sub_cat.pop("json", None)
+
+    response["next_cursor"] = encode_cursor({"v": tree_version, "after": next_after}) if has_more else None
+    return jsonify(response)
+
+
+def _imagine_image(img, url_prefix):
+    st = img.stat()
+    entry = {
+        "name": img.name,
+        "url": fingerprinted_url(f"{url_prefix}/{img.name}", img.path, st)
+    }
+    entry.update(image_catalog_fields(img.path, st))
+    return entry
 
-            found_sub = True
 
-            images = []
-            for img_file in os.listdir(sub_path):
-                if img_file.endswith('.jpg') or img_file.endswith('.png'):
-                    image_url = f"{STATIC_URL_PATH}/{sanitize_name(main_cat)}/{sanitize_name(sub)}/{img_file}"
-                    images.append({
-                        "url": image_url,
-                        "name": img_file
-                    })
+def _read_imagine_json(json_path):
+    try:
+        with open(json_path, 'r') as jf:
+            return json.load(jf)
+    except:
+        return {}
 
-            json_path = os.path.join(JSON_FOLDER, main_cat, f"{sub}.json")
-            json_data = {}
-            if os.path.exists(json_path):
-                try:
-                    with open(json_path, 'r') as jf:
-                        json_data = json.load(jf)
-                except:
-                    json_data = {}
 
+def _collect_get_categories(tree):
+    all_categories = []
+
+    for category in tree:
+        main_cat = category.name
+        url_prefix = f"{STATIC_URL_PATH}/{sanitize_name(main_cat)}"
+        sub_cats = []
+
+        for sub in category.sub_categories:
+            sub_prefix = f"{url_prefix}/{sanitize_name(sub.name)}"
             sub_cats.append({
-                "name": sub,
-                "images": images,
-                "json": json_data
+                "name": sub.name,
+                "images": [_imagine_image(img, sub_prefix) for img in sub.images],
+                "json": _read_imagine_json(os.path.join(JSON_FOLDER, main_cat, f"{sub.name}.json"))
             })
 
         # Handle case where no subfolders (images directly under main_cat)
-        if not found_sub:
-            images = []
-            for img_file in os.listdir(main_cat_path):
-                if img_file.endswith('.jpg') or img_file.endswith('.png'):
-                    image_url = f"{STATIC_URL_PATH}/{sanitize_name(main_cat)}/{img_file}"
-                    images.append({
-                        "url": image_url,
-                        "name": img_file
-                    })
-
-            json_path = os.path.join(JSON_FOLDER, main_cat, f"{main_cat}.json")
-            json_data = {}
-            if os.path.exists(json_path):
-                try:
-                    with open(json_path, 'r') as jf:
-                        json_data = json.load(jf)
-                except:
-                    json_data = {}
-
+        if not category.sub_categories:
             sub_cats.append({
                 "name": None,
-                "images": images,
-                "json": json_data
+                "images": [_imagine_image(img, url_prefix) for img in category.images],
+                "json": _read_imagine_json(os.path.join(JSON_FOLDER, main_cat, f"{main_cat}.json"))
             })
 
         all_categories.append({
@@ -209,7 +782,7 @@ def get_categories():
             "sub_categories": sub_cats
         })
 
-    return jsonify({"categories": all_categories}), 200
+    return all_categories
 
 
 #####################################################  UPDATE ANY SUB-CATEGORY ( ACTION ) ##########################################################
@@ -256,16 +829,22 @@ def update_image_meta():
     new_image = request.files.get('new_image')
     if new_image:
         new_ext = os.path.splitext(new_image.filename)[1]  # e.g., '.png'
-        new_filename = f"{image_index}{new_ext}"
-        new_image_path = os.path.join(image_folder, new_filename)
+        order = read_order(image_folder)
+        position = int(image_index)
 
-        old_ext = os.path.splitext(image_name)[1]
-        old_filename = f"{image_index}{old_ext}"
-        old_image_path = os.path.join(image_folder, old_filename)
-        if os.path.exists(old_image_path):
+        if order is None:
+            old_ext = os.path.splitext(image_name)[1]
+            old_image_path = os.path.join(image_folder, f"{image_index}{old_ext}")
+        else:
+            old_image_path = os.path.join(image_folder, order[position]) if position < len(order) else None
+        if old_image_path and os.path.exists(old_image_path):
             os.remove(old_image_path)
 
-        new_image.save(new_image_path)
+        new_image_path = store_position(image_folder, order, position, new_ext)
+        commit_upload(new_image, new_image_path)
+        ingest_image(new_image_path)
+        if order is not None:
+            save_order(image_folder, order)
 
         json_data[key]['Name'] = image_index  
 
@@ -308,50 +887,25 @@ def delete_image():
     if key_to_delete not in json_data:
         return jsonify({"error": f"No metadata found for image {image_name}"}), 404
 
-    deleted = False
-    deleted_ext = None
-    for ext in ['.jpg', '.jpeg', '.png', '.webp']:
-        path = os.path.join(image_dir, f"{image_index}{ext}")
-        if os.path.exists(path):
-            os.remove(path)
-            deleted = True
-            deleted_ext = ext
-            break
-
-    if not deleted:
+    # Later images move up one position through the order manifest; no file is renamed
+    try:
+        order = load_order(image_dir, IMAGINE_IMAGE_EXTENSIONS)
+    except OrderError as e:
+        return jsonify({"error": f"Cannot reorder this folder: {e}"}), 409
+    if image_index >= len(order) or not os.path.exists(os.path.join(image_dir, order[image_index])):
         return jsonify({"error": "Image file not found."}), 404
 
-    del json_data[key_to_delete]
-
-    image_files = []
-    for file in os.listdir(image_dir):
-        name, ext = os.path.splitext(file)
-        if ext.lower() in ['.jpg', '.jpeg', '.png', '.webp']:
-            try:
-                idx = int(name)
-                image_files.append((idx, file))
-            except ValueError:
-                continue
+    os.remove(os.path.join(image_dir, order.pop(image_index)))
+    save_order(image_dir, order)
 
-    image_files.sort(key=lambda x: x[0])
+    del json_data[key_to_delete]
 
-    for idx, file in image_files:
+    for idx in sorted(int(k[len("Image"):]) for k in list(json_data) if k[len("Image"):].isdigit()):
         if idx > image_index:
-            old_path = os.path.join(image_dir, file)
             new_index = idx - 1
-            ext = os.path.splitext(file)[1]
-            new_filename = f"{new_index}{ext}"
-            new_path = os.path.join(image_dir, new_filename)
-
-            os.rename(old_path, new_path)
-
-            old_key = f"Image{idx}"
-            new_key = f"Image{new_index}"
-
-            if old_key in json_data:
-                metadata = json_data.pop(old_key)
-                metadata['Name'] = str(new_index)
-                json_data[new_key] = metadata
+            metadata = json_data.pop(f"Image{idx}")
+            metadata['Name'] = str(new_index)
+            json_data[f"Image{new_index}"] = metadata
 
     with open(json_file_path, 'w') as f:
         json.dump(json_data, f, indent=4)
@@ -392,6 +946,7 @@ def update_subcategory():
 
     existing_keys = [int(k.replace("Image", "")) for k in json_data.keys() if k.startswith("Image")]
     next_index = max(existing_keys, default=-1) + 1
+    order = read_order(new_img_folder)
 
     upload_index = 0
     while f'image_{upload_index}' in request.files:
@@ -399,9 +954,9 @@ def update_subcategory():
         if not file.content_type.startswith("image/"):
             return jsonify({"error": f"File image_{upload_index} is not a valid image type."}), 400
 
-        filename = f"{next_index}.jpg"
-        filepath = os.path.join(new_img_folder, secure_filename(filename))
-        file.save(filepath)
+        filepath = store_position(new_img_folder, order, next_index, ".jpg")
+        commit_upload(file, filepath)
+        ingest_image(filepath)
 
         prem_str = request.form.get(f'prem_{upload_index}', 'false')
         prem = prem_str.lower() == 'true'
@@ -418,6 +973,9 @@ def update_subcategory():
         next_index += 1
         upload_index += 1
 
+    if order is not None:
+        save_order(new_img_folder, order)
+
     with open(new_json_path, 'w') as jf:
         json.dump(json_data, jf, indent=4)
 
@@ -457,69 +1015,41 @@ def delete_subcategory():
     ################## ----- View All Category  ----- #################                   
 @app.route('/get-category-structure', methods=['GET'])
 def get_category_structure():
-    categories = []
-
     if not os.path.exists(BASE_PATH):
         return jsonify({"categories": []}), 200
 
-    for main_cat in sorted(os.listdir(BASE_PATH)):
-        main_cat_path = os.path.join(BASE_PATH, main_cat)
-
-        if not os.path.isdir(main_cat_path) or main_cat == "Json_Files":
-            continue
-
-        has_sub_category = False
-
-        # Handle subcategories
-        for sub in sorted(os.listdir(main_cat_path)):
-            sub_path = os.path.join(main_cat_path, sub)
-
-            if not os.path.isdir(sub_path):
-                continue
+    tree = scan_tree(BASE_PATH, IMAGINE_IMAGE_EXTENSIONS)
+    fingerprint, last_modified = scan_fingerprint(tree, JSON_FOLDER)
+    return conditional_response(
+        f"imagine-{fingerprint}", last_modified,
+        lambda: _build_category_structure(tree)
+    )
 
-            has_sub_category = True
 
-            image_files = sorted([
-                f for f in os.listdir(sub_path)
-                if f.lower().endswith(('.jpg', '.png'))
-            ])
+def _build_category_structure(tree):
+    categories = []
 
-            images = [
-                {
-                    "name": img_file,
-                    "url": f"{STATIC_URL_PATH}/{sanitize_name(main_cat)}/{sanitize_name(sub)}/{img_file}"
-                }
-                for img_file in image_files
-            ]
+    for category in tree:
+        url_prefix = f"{STATIC_URL_PATH}/{sanitize_name(category.name)}"
 
+        # Handle subcategories
+        for sub in category.sub_categories:
+            sub_prefix = f"{url_prefix}/{sanitize_name(sub.name)}"
             categories.append({
-                "main_category": main_cat,
-                "sub_category": sub,
-                "images": images
+                "main_category": category.name,
+                "sub_category": sub.name,
+                "images": [_imagine_image(img, sub_prefix) for img in sub.images]
             })
 
         # If no sub-categories exist, treat main category as flat
-        if not has_sub_category:
-            image_files = sorted([
-                f for f in os.listdir(main_cat_path)
-                if f.lower().endswith(('.jpg', '.png'))
-            ])
-
-            images = [
-                {
-                    "name": img_file,
-                    "url": f"{STATIC_URL_PATH}/{sanitize_name(main_cat)}/{img_file}"
-                }
-                for img_file in image_files
-            ]
-
+        if not category.sub_categories:
             categories.append({
-                "main_category": main_cat,
+                "main_category": category.name,
                 "sub_category": None,
-                "images": images
+                "images": [_imagine_image(img, url_prefix) for img in category.images]
             })
 
-    return jsonify({"categories": categories}), 200
+    return jsonify({"categories": categories})
 
 
         ########## ------------  Rearrange Images ----------- ##########
@@ -539,15 +1069,22 @@ def swap_images():
     sub_folder = os.path.join(BASE_PATH, main_category, sub_category)
     json_path = os.path.join(JSON_FOLDER, main_category, f"{sub_category}.json")
 
-    img1_path = os.path.join(sub_folder, image1_name)
-    img2_path = os.path.join(sub_folder, image2_name)
+    img1_path = resolve_image(sub_folder, image1_name)
+    img2_path = resolve_image(sub_folder, image2_name)
 
-    if not (os.path.exists(img1_path) and os.path.exists(img2_path)):
+    if not (img1_path and img2_path and os.path.exists(img1_path) and os.path.exists(img2_path)):
         return jsonify({"error": "One or both images do not exist"}), 404
 
     if not os.path.exists(json_path):
         return jsonify({"error": "Subcategory JSON file not found"}), 404
 
+    try:
+        order = load_order(sub_folder, IMAGINE_IMAGE_EXTENSIONS)
+    except OrderError as e:
+        return jsonify({"error": f"Cannot reorder this folder: {e}"}), 409
+    if os.path.basename(img1_path) not in order or os.path.basename(img2_path) not in order:
+        return jsonify({"error": "One or both images do not exist"}), 404
+
     with open(json_path, 'r') as jf:
         data = json.load(jf)
     index1 = os.path.splitext(image1_name)[0]  # '0'
@@ -567,18 +1104,61 @@ def swap_images():
     with open(json_path, 'w') as jf:
         json.dump(data, jf, indent=4)
 
-    temp_path = os.path.join(sub_folder, "__temp_swap__.jpg")
-    os.rename(img1_path, temp_path)
-    os.rename(img2_path, img1_path)
-    os.rename(temp_path, img2_path)
+    # Swap the two positions in the order manifest; the files stay where they are
+    position1, position2 = order.index(os.path.basename(img1_path)), order.index(os.path.basename(img2_path))
+    order[position1], order[position2] = order[position2], order[position1]
+    save_order(sub_folder, order)
 
     return jsonify({"message": "Images swapped successfully."}), 200
 
 
+    # ---- Reorder a whole sub category in one call ----
+    # Form: main_category, sub_category, order (repeated, the current image
+    # names in their new order, e.g. order=3.jpg&order=0.jpg&...)
+@app.route('/reorder-images', methods=['POST'])
+def reorder_images():
+    main_category = sanitize_name(request.form.get('main_category') or '')
+    sub_category = sanitize_name(request.form.get('sub_category') or '')
+    requested = request.form.getlist('order')
+
+    if not main_category or not sub_category or not requested:
+        return jsonify({"error": "main_category, sub_category and order are required"}), 400
+
+    sub_folder = os.path.join(BASE_PATH, main_category, sub_category)
+    json_path = os.path.join(JSON_FOLDER, main_category, f"{sub_category}.json")
+
+    if not os.path.isdir(sub_folder):
+        return jsonify({"error": "Subcategory folder not found"}), 404
+    if not os.path.exists(json_path):
+        return jsonify({"error": "Subcategory JSON file not found"}), 404
+
+    try:
+        order = load_order(sub_folder, IMAGINE_IMAGE_EXTENSIONS)
+    except OrderError as e:
+        return jsonify({"error": f"Cannot reorder this folder: {e}"}), 409
+    try:
+        order, moves = permute_order(order, requested)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    with open(json_path, 'r') as jf:
+        data = json.load(jf)
+
+    with open(json_path, 'w') as jf:
+        json.dump(permute_json(data, moves), jf, indent=4)
+    save_order(sub_folder, order)
+
+    return jsonify({"message": f"{len(moves)} image(s) moved."}), 200
+
+
                         ########  **** ( IBGC APP ) **** ########
 import json
 import os
-from datetime import datetime
+import fcntl
+import threading
+import gzip
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 
 # === Paths ===
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -588,6 +1168,30 @@ BACKUP_DIR = os.path.join(STATIC_DIR, "Assets_IBGC_Last")
 CURRENT_JSON_DIR = os.path.join(CURRENT_DIR, "Json_Files")
 BACKUP_JSON_DIR = os.path.join(BACKUP_DIR, "Json_Files_Last")
 VERSION_FILE = os.path.join(STATIC_DIR, "version_IBGC.json")
+CHANGELOG_FILE = os.path.join(STATIC_DIR, "changes_IBGC.json")
+CHANGELOG_KEEP = int(os.environ.get("IBGC_CHANGELOG_KEEP", "50"))  # versions a client may lag behind before a full resync
+JOURNAL_DIR = os.path.join(BASE_DIR, "ibgc_journal")  # kept outside static/ so it is never served
+LOCK_DIR = os.path.join(BASE_DIR, "ibgc_locks")  # flock files shared by all worker processes
+
+# === Optional content-addressed storage (IBGC_BLOB_STORE=true) ===
+BLOB_STORE_ENABLED = os.environ.get("IBGC_BLOB_STORE", "false").lower() == "true"
+BLOB_DIR = os.path.join(BASE_DIR, "ibgc_blobs")
+BLOB_MANIFEST_DIR = os.path.join(BLOB_DIR, "manifests")
+BLOB_MANIFESTS_KEEP = int(os.environ.get("IBGC_BLOB_MANIFESTS_KEEP", "20"))
+
+# === Pre-serialized /view-category_IBGC payloads (raw + gzip), one pair per version ===
+CATALOG_PAYLOAD_DIR = os.path.join(BASE_DIR, "ibgc_catalog")
+
+# === Optional per-category sprite atlases (IBGC_SPRITES=true) ===
+SPRITES_ENABLED = os.environ.get("IBGC_SPRITES", "false").lower() == "true"
+SPRITE_DIR = os.path.join(STATIC_DIR, "Sprites_IBGC")
+SPRITE_TILE_SIZE = int(os.environ.get("IBGC_SPRITE_TILE_SIZE", "128"))
+
+# === Optional staged builds + atomic publish (IBGC_STAGED_PUBLISH=true) ===
+# Assets_IBGC becomes a symlink to ibgc_versions/<version>; see publish_stage()
+STAGED_PUBLISH_ENABLED = os.environ.get("IBGC_STAGED_PUBLISH", "false").lower() == "true"
+VERSIONS_DIR = os.path.join(BASE_DIR, "ibgc_versions")
+VERSIONS_KEEP = max(1, int(os.environ.get("IBGC_VERSIONS_KEEP", "5")))  # published trees /rollback_IBGC can return to
 
 
 
@@ -607,8 +1211,55 @@ def get_current_version():
         "previous_version_date": None
     }
 
+# === Last-Modified for anything keyed on the IBGC version ===
+def version_last_modified(version_info):
+    version_date = version_info.get("current_version_date")
+    if not version_date:
+        return None
+    return datetime.fromisoformat(version_date).astimezone(timezone.utc)
+
+
+# === Per-version change log (written together with the version bump) ===
+def get_change_log():
+    if os.path.exists(CHANGELOG_FILE):
+        with open(CHANGELOG_FILE, 'r') as f:
+            return json.load(f)
+    return {"versions": []}
+
+
+def change_entry(change_type, main_category, sub_category=None, **fields):
+    entry = {
+        "type": change_type,  # added / removed / replaced / reordered / prem_changed / renamed
+        "main_category": main_category,
+        "sub_category": sub_category or None
+    }
+    entry.update(fields)
+    return entry
+
+
 # === Increment Version on Successful Update
-def increment_version():
+# `changes` is the list of change_entry() dicts this update made; None means
+# "unknown" and forces clients older than this version into a full resync.
+def increment_version(journal=None, changes=None):
+    # Atlases are packed from the writer's own tree (its staging copy with
+    # IBGC_STAGED_PUBLISH) before the version lock: a Pillow job never holds up
+    # other writers, and atlases are named after their contents, so one left
+    # by a rolled back update is harmless
+    if SPRITES_ENABLED:
+        build_sprites(_changed_main_categories(changes), journal["root"] if journal else CURRENT_DIR)
+    version_lock = ibgc_version_lock()
+    if journal:
+        # Released by journal_commit()/journal_rollback(), so a rolled back
+        # update restores the counter before the next writer can read it
+        journal["locks"].append(version_lock)
+    try:
+        return _publish_version(journal, changes)
+    finally:
+        if not journal:
+            release_locks([version_lock])
+
+
+def _publish_version(journal, changes):
     data = get_current_version()
 
     # Shift current to previous
@@ -619,434 +1270,1581 @@ def increment_version():
     data["current_version"] = data.get("current_version", 0) + 1
     data["current_version_date"] = datetime.now().isoformat()
 
-    with open(VERSION_FILE, 'w') as f:
-        json.dump(data, f, indent=2)
+    # The new tree goes live before the version that announces it
+    if journal and journal.get("stage"):
+        publish_stage(journal, data["current_version"])
+    if STAGED_PUBLISH_ENABLED:
+        data["tree"] = os.path.basename(os.path.realpath(CURRENT_DIR))  # See version_root()
+    else:
+        data.pop("tree", None)
+
+    change_log = get_change_log()
+    change_log["versions"].append({
+        "version": data["current_version"],
+        "date": data["current_version_date"],
+        "changes": changes
+    })
+    change_log["versions"] = change_log["versions"][-CHANGELOG_KEEP:]
+
+    # Everything the new version serves is in place before the version file
+    # announces it: a reader that sees version N finds catalog_vN.json
+    if journal:
+        journal_write_json(journal, CHANGELOG_FILE, change_log, indent=2)
+        if BLOB_STORE_ENABLED:
+            manifest = next_blob_manifest(journal, data["previous_version"])
+            journal_write_json(journal, blob_manifest_path(data["current_version"]), manifest)
+    else:
+        write_json_file(CHANGELOG_FILE, change_log, indent=2)
+
+    # Publish-time materialization: readers never encode the catalog themselves
+    write_catalog_payload(data["current_version"], get_catalog_index(data), journal)
+
+    if journal:
+        journal_write_json(journal, VERSION_FILE, data, indent=2)
+    else:
+        write_json_file(VERSION_FILE, data, indent=2)
 
     return data
 
 
-# === Add Category Route ===
-@app.route('/add-category_IBGC', methods=['POST'])
-def add_category_IBGC():
+# === Snapshot: Copy-on-write backup of CURRENT_DIR ===
+# Assets_IBGC_Last is built from hardlinks, so unchanged images share their
+# inode with Assets_IBGC and cost no data copy. Anything written inside
+# CURRENT_DIR must therefore go through write_json_file()/save_upload(),
+# which replace the directory entry instead of truncating the shared inode.
+def _link_or_copy(src, dst):
     try:
-        # === Get form data ===
-        category_name = request.form.get('category_name')  # main category
-        sub_category_name = request.form.get('sub_category_name')  # optional
-        images = request.files.getlist('images')
-        prem_list = request.form.getlist('prem')  # 'true'/'false'
-
-        if not category_name or not images:
-            return jsonify({"error": "Missing category_name or images"}), 400
+        os.link(src, dst)
+    except OSError:
+        # Cross-device or no hardlink support: fall back to a real copy
+        shutil.copy2(src, dst)
 
-        # === Step 1: Backup ===
-        if os.path.exists(BACKUP_DIR):
-            shutil.rmtree(BACKUP_DIR)
-        shutil.copytree(CURRENT_DIR, BACKUP_DIR)
 
-        # Rename Json_Files to Json_Files_Last inside the backup
-        json_dir_backup = os.path.join(BACKUP_DIR, "Json_Files")
-        if os.path.exists(json_dir_backup):
-            os.rename(json_dir_backup, BACKUP_JSON_DIR)
+def _sync_tree_links(src_root, dst_root, json_src_name, json_dst_name):
+    os.makedirs(dst_root, exist_ok=True)
+    keep = set()
 
-        # === Step 2: Create image save path ===
-        if sub_category_name:
-            category_path = os.path.join(CURRENT_DIR, category_name, sub_category_name)
+    for root, dirs, files in os.walk(src_root):
+        rel_root = os.path.relpath(root, src_root)
+        if rel_root == '.':
+            target_root = dst_root
         else:
-            category_path = os.path.join(CURRENT_DIR, category_name)
+            parts = rel_root.split(os.sep)
+            if parts[0] == json_src_name:
+                parts[0] = json_dst_name
+            target_root = os.path.join(dst_root, *parts)
+
+        os.makedirs(target_root, exist_ok=True)
+        keep.add(target_root)
+
+        for name in files:
+            src = os.path.join(root, name)
+            dst = os.path.join(target_root, name)
+            keep.add(dst)
+            if os.path.lexists(dst):
+                if os.path.samefile(src, dst):
+                    continue  # Untouched since last snapshot
+                os.remove(dst)
+            _link_or_copy(src, dst)
+
+    # Drop whatever no longer exists on the source side
+    for root, dirs, files in os.walk(dst_root, topdown=False):
+        for name in files:
+            path = os.path.join(root, name)
+            if path not in keep:
+                os.remove(path)
+        for name in dirs:
+            path = os.path.join(root, name)
+            if path not in keep:
+                shutil.rmtree(path)
+
+
+def _backup_path(path):
+    parts = os.path.relpath(path, CURRENT_DIR).split(os.sep)
+    if parts[0] == "Json_Files":
+        parts[0] = "Json_Files_Last"
+    return os.path.join(BACKUP_DIR, *parts)
+
+
+def _sync_path_links(src, dst):
+    # Mirror one file or directory of CURRENT_DIR into its backup location
+    if os.path.isdir(src):
+        if os.path.lexists(dst) and not os.path.isdir(dst):
+            os.remove(dst)
+        _sync_tree_links(src, dst, None, None)
+    elif os.path.lexists(src):
+        if os.path.isdir(dst):
+            shutil.rmtree(dst)
+        elif os.path.lexists(dst):
+            if os.path.samefile(src, dst):
+                return
+            os.remove(dst)
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        _link_or_copy(src, dst)
+    elif os.path.isdir(dst):
+        shutil.rmtree(dst)
+    elif os.path.lexists(dst):
+        os.remove(dst)
+
+
+def _scope_paths(scopes, root=CURRENT_DIR):
+    # Every file or directory under `root` a write to `scopes` may touch
+    paths = []
+    for main_category, sub_category in _normalize_scopes(scopes):
+        paths.extend(ibgc_paths(main_category, sub_category, root))
+        if not sub_category:
+            paths.append(os.path.join(root, "Json_Files", main_category))  # the sub-category JSONs
+    return paths
+
+
+def snapshot_current_to_backup(scopes=None):
+    # With scopes, only the locked categories are re-linked, so writers of
+    # other categories can snapshot at the same time
+    if STAGED_PUBLISH_ENABLED:
+        return  # The retained ibgc_versions/ trees are the backups
+    if scopes is None:
+        _sync_tree_links(CURRENT_DIR, BACKUP_DIR, "Json_Files", "Json_Files_Last")
+        return
+    for path in _scope_paths(scopes):
+        _sync_path_links(path, _backup_path(path))
+
+
+# === Utility: Write into CURRENT_DIR without touching the backup's inode ===
+def _replace_file(path, mode, write_fn):
+    # The temp name is unique per writer: with a shared one, concurrent writers
+    # of the same path would rename each other's temp file away
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}-{uuid.uuid4().hex[:8]}.tmp"
+    try:
+        with open(tmp_path, mode, **({} if 'b' in mode else {"encoding": 'utf-8'})) as f:
+            write_fn(f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.lexists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    if BLOB_STORE_ENABLED and _in_ibgc_tree(path):
+        blob_adopt(path)
 
-        os.makedirs(category_path, exist_ok=True)
 
-        # === Step 3: Create JSON path ===
-        if sub_category_name:
-            json_save_dir = os.path.join(CURRENT_JSON_DIR, category_name)
-            os.makedirs(json_save_dir, exist_ok=True)
-            category_json_file = os.path.join(json_save_dir, f"{sub_category_name}.json")
-        else:
-            os.makedirs(CURRENT_JSON_DIR, exist_ok=True)
-            category_json_file = os.path.join(CURRENT_JSON_DIR, f"{category_name}.json")
+def write_json_file(path, data, indent=4):
+    _replace_file(path, 'x', lambda jf: json.dump(data, jf, indent=indent))
 
-        # === Step 4: Save images and build JSON ===
-        image_json_data = {}
 
-        for idx, img in enumerate(images):
-            filename = f"{idx}.webp"
-            img_path = os.path.join(category_path, secure_filename(filename))
-            img.save(img_path)
+def write_bytes_file(path, data):
+    _replace_file(path, 'xb', lambda f: f.write(data))
 
-            prem_flag = False
-            if idx < len(prem_list):
-                prem_flag = prem_list[idx].lower() == 'true'
 
-            image_json_data[f"Image{idx}"] = {
-                "Name": str(idx),
-                "Prem": prem_flag,
-                "main_category": category_name,
-                "sub_category": sub_category_name if sub_category_name else None
-            }
+def save_upload(file, path):
+    if os.path.lexists(path):
+        os.remove(path)
+    commit_upload(file, path)
+    if BLOB_STORE_ENABLED and _in_ibgc_tree(path):
+        blob_adopt(path)
 
-        with open(category_json_file, 'w') as jf:
-            json.dump(image_json_data, jf, indent=4)
 
-        # === Step 5: Update version ===
-        version_info = increment_version()
+def _is_under(path, root):
+    return os.path.abspath(path).startswith(os.path.abspath(root) + os.sep)
 
-        return jsonify({
-            "message": f"Category '{category_name}' added successfully.",
-            "sub_category": sub_category_name if sub_category_name else None,
-            "new_version": version_info
-        })
 
-    except Exception as e:
-        # === Rollback on failure ===
-        try:
-            if os.path.exists(CURRENT_DIR):
-                shutil.rmtree(CURRENT_DIR)
-            if os.path.exists(BACKUP_DIR):
-                shutil.move(BACKUP_DIR, CURRENT_DIR)
-
-            # Restore Json_Files_Last back to Json_Files
-            backup_json_last = os.path.join(CURRENT_DIR, "Json_Files_Last")
-            restored_path = os.path.join(CURRENT_DIR, "Json_Files")
-            if os.path.exists(backup_json_last):
-                if os.path.exists(restored_path):
-                    shutil.rmtree(restored_path)
-                os.rename(backup_json_last, restored_path)
+def _in_ibgc_tree(path):
+    # The published tree, or a staged / published version of it
+    return _is_under(path, CURRENT_DIR) or _is_under(path, VERSIONS_DIR)
 
-        except Exception as rollback_error:
-            return jsonify({
-                "error": "Rollback failed.",
-                "details": str(rollback_error)
-            }), 500
 
-        return jsonify({
-            "error": "Something went wrong.",
-            "details": str(e)
-        }), 500
+# === Content-addressed blob store ===
+# With IBGC_BLOB_STORE=true every file written under CURRENT_DIR is a hardlink
+# to ibgc_blobs/<aa>/<sha256>, so identical bytes exist once no matter how many
+# categories, backups or reindexed names point at them. Each published version
+# gets a small manifest (relative path -> digest) instead of a copy of the tree,
+# derived from the previous one by re-reading only the categories the
+# publishing journal locked. Unreferenced blobs are collected out of band by
+# `flask ibgc-blob-gc` (run it from cron), never while a writer publishes.
+def file_digest(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(chunk)
+    return h.hexdigest()
 
-# --------- View Categories ---------
-@app.route('/view-category_IBGC', methods=['GET'])
-def view_category_IBGC():
-    try:
-        categories = []
 
-        if not os.path.exists(CURRENT_DIR):
-            return jsonify({"error": "Assets_IBGC directory not found."}), 404
+def blob_path(digest):
+    return os.path.join(BLOB_DIR, digest[:2], digest)
 
-        for main_cat in sorted(os.listdir(CURRENT_DIR)):
-            if main_cat == "Json_Files":
-                continue
 
-            main_cat_path = os.path.join(CURRENT_DIR, main_cat)
-
-            # === Case 1: Main + Subcategories ===
-            if os.path.isdir(main_cat_path):
-                subcategories_exist = False
-
-                for subcat in sorted(os.listdir(main_cat_path)):
-                    subcat_path = os.path.join(main_cat_path, subcat)
-
-                    if os.path.isdir(subcat_path):
-                        subcategories_exist = True
-                        json_path = os.path.join(CURRENT_JSON_DIR, main_cat, f"{subcat}.json")
-                        image_meta = {}
-
-                        if os.path.exists(json_path):
-                            with open(json_path, 'r') as f:
-                                try:
-                                    data = json.load(f)
-                                    for key, meta in data.items():
-                                        filename = meta.get("Name")
-                                        prem_value = meta.get("Prem", False)
-                                        if filename is not None:
-                                            for ext in ['.webp', '.jpg', '.jpeg', '.png']:
-                                                image_meta[f"{filename}{ext}"] = prem_value
-                                except Exception as e:
-                                    print(f"Failed to read JSON for {main_cat}/{subcat}: {e}")
-
-                        image_list = []
-                        for filename in sorted(os.listdir(subcat_path)):
-                            if filename.lower().endswith(('.webp', '.jpg', '.jpeg', '.png')):
-                                prem_value = image_meta.get(filename, False)
-                                image_list.append({
-                                    "filename": filename,
-                                    "url": f"/static/Assets_IBGC/{main_cat}/{subcat}/{filename}",
-                                    "prem": prem_value
-                                })
-
-                        categories.append({
-                            "main_category": main_cat,
-                            "sub_category": subcat,
-                            "images": image_list
-                        })
-
-                # === Case 2: Main category only (no subfolders) ===
-                if not subcategories_exist:
-                    json_path = os.path.join(CURRENT_JSON_DIR, f"{main_cat}.json")
-                    image_meta = {}
-
-                    if os.path.exists(json_path):
-                        with open(json_path, 'r') as f:
-                            try:
-                                data = json.load(f)
-                                for key, meta in data.items():
-                                    filename = meta.get("Name")
-                                    prem_value = meta.get("Prem", False)
-                                    if filename is not None:
-                                        for ext in ['.webp', '.jpg', '.jpeg', '.png']:
-                                            image_meta[f"{filename}{ext}"] = prem_value
-                            except Exception as e:
-                                print(f"Failed to read JSON for {main_cat}: {e}")
-
-                    image_list = []
-                    for filename in sorted(os.listdir(main_cat_path)):
-                        if filename.lower().endswith(('.webp', '.jpg', '.jpeg', '.png')):
-                            prem_value = image_meta.get(filename, False)
-                            image_list.append({
-                                "filename": filename,
-                                "url": f"/static/Assets_IBGC/{main_cat}/{filename}",
-                                "prem": prem_value
-                            })
-
-                    categories.append({
-                        "main_category": main_cat,
-                        "sub_category": None,
-                        "images": image_list
-                    })
-
-        return jsonify(categories)
+def blob_manifest_path(version):
+    return os.path.join(BLOB_MANIFEST_DIR, f"{version}.json")
 
-    except Exception as e:
-        return jsonify({
-            "error": "Something went wrong while reading categories.",
-            "details": str(e)
-        }), 500
 
-# ---- Delete Full Category ---
-@app.route('/delete-category_IBGC', methods=['POST'])
-def delete_category_IBGC():
-    try:
-        category_name = request.form.get('category_name')  # required
-        sub_category = request.form.get('sub_category')     # optional
+def blob_adopt(path):
+    digest = file_digest(path)
+    target = blob_path(digest)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
 
-        if not category_name:
-            return jsonify({"error": "Missing category_name"}), 400
+    for _ in range(2):
+        try:
+            os.link(path, target)  # First time these bytes are seen
+            return digest
+        except FileExistsError:
+            pass
+        if os.path.samefile(path, target):
+            return digest
+        try:
+            tmp_path = f"{path}.blob"
+            os.link(target, tmp_path)
+            os.replace(tmp_path, path)
+            return digest
+        except FileNotFoundError:
+            continue  # Blob was collected in between; link ours instead
+    return digest
+
+
+def _blob_inode_index():
+    index = {}
+    if not os.path.isdir(BLOB_DIR):
+        return index
+    for prefix in os.listdir(BLOB_DIR):
+        prefix_dir = os.path.join(BLOB_DIR, prefix)
+        if prefix_dir == BLOB_MANIFEST_DIR or not os.path.isdir(prefix_dir):
+            continue
+        for digest in os.listdir(prefix_dir):
+            st = os.stat(os.path.join(prefix_dir, digest))
+            index[(st.st_dev, st.st_ino)] = digest
+    return index
+
+
+def build_blob_manifest(root=CURRENT_DIR):
+    # Digests come from the blob inode index, so only files that are not
+    # linked into the store yet get read and hashed.
+    index = _blob_inode_index()
+    manifest = {}
+    for dir_path, dirs, files in os.walk(root):
+        for name in files:
+            path = os.path.join(dir_path, name)
+            st = os.stat(path)
+            digest = index.get((st.st_dev, st.st_ino)) or blob_adopt(path)
+            manifest[os.path.relpath(path, root).replace(os.sep, '/')] = digest
+    return manifest
+
+
+def update_blob_manifest(previous, paths, root=CURRENT_DIR):
+    # `previous` with everything under `paths` (absolute, under root) re-read.
+    # A file keeps its old digest while it still is that blob's inode, so only
+    # new or rewritten files are hashed: the cost follows what changed.
+    rel_paths = [os.path.relpath(path, root).replace(os.sep, '/') for path in paths]
+    manifest = {
+        rel: digest for rel, digest in previous.items()
+        if not any(rel == path or rel.startswith(path + '/') for path in rel_paths)
+    }
+    for path in paths:
+        if os.path.isdir(path):
+            files = [os.path.join(dir_path, name) for dir_path, dirs, names in os.walk(path) for name in names]
+        else:
+            files = [path] if os.path.isfile(path) else []
+        for file_path in files:
+            rel = os.path.relpath(file_path, root).replace(os.sep, '/')
+            known = previous.get(rel)
+            try:
+                if known and os.path.samefile(file_path, blob_path(known)):
+                    manifest[rel] = known
+                    continue
+            except FileNotFoundError:
+                pass
+            manifest[rel] = blob_adopt(file_path)
+    return manifest
 
-        # Step 1: Backup current version
-        if os.path.exists(BACKUP_DIR):
-            shutil.rmtree(BACKUP_DIR)
 
-        if os.path.exists(CURRENT_DIR):
-            # Backup Json_Files
-            current_json_folder = os.path.join(CURRENT_DIR, "Json_Files")
-            backup_json_folder = os.path.join(CURRENT_DIR, "Json_Files_Last")
-            if os.path.exists(current_json_folder):
-                if os.path.exists(backup_json_folder):
-                    shutil.rmtree(backup_json_folder)
-                os.rename(current_json_folder, backup_json_folder)
-
-            # Backup entire CURRENT_DIR
-            os.rename(CURRENT_DIR, BACKUP_DIR)
-
-        # Step 2: Copy backup to new CURRENT_DIR
-        shutil.copytree(BACKUP_DIR, CURRENT_DIR)
-
-        new_json_last = os.path.join(CURRENT_DIR, "Json_Files_Last")
-        new_json = os.path.join(CURRENT_DIR, "Json_Files")
-        if os.path.exists(new_json_last):
-            if os.path.exists(new_json):
-                shutil.rmtree(new_json)
-            os.rename(new_json_last, new_json)
+def next_blob_manifest(journal, previous_version):
+    # Manifest of the tree being published by `journal`
+    try:
+        with open(blob_manifest_path(previous_version), 'r') as f:
+            previous = json.load(f)
+    except FileNotFoundError:
+        previous = None
+    if previous is None or not journal["scopes"]:
+        return build_blob_manifest()  # First publish with the store, or nothing to narrow it to
+    return update_blob_manifest(previous, _scope_paths(journal["scopes"]))
+
+
+def blob_gc():
+    # Keep the newest manifests; a blob survives while any file in the tree,
+    # the backup, a journal stash or a kept manifest still references it.
+    referenced = set()
+    if os.path.isdir(BLOB_MANIFEST_DIR):
+        manifests = sorted(
+            (f for f in os.listdir(BLOB_MANIFEST_DIR) if f.endswith('.json')),
+            key=lambda f: int(os.path.splitext(f)[0])
+        )
+        expired = manifests[:-BLOB_MANIFESTS_KEEP] if BLOB_MANIFESTS_KEEP > 0 else manifests
+        for name in expired:
+            os.remove(os.path.join(BLOB_MANIFEST_DIR, name))
+        for name in manifests[len(expired):]:
+            with open(os.path.join(BLOB_MANIFEST_DIR, name), 'r') as f:
+                referenced.update(json.load(f).values())
+
+    removed = 0
+    for (dev, ino), digest in _blob_inode_index().items():
+        path = blob_path(digest)
+        if os.stat(path).st_nlink == 1 and digest not in referenced:
+            os.remove(path)
+            removed += 1
+    return removed
 
-        if sub_category:
-            category_path = os.path.join(CURRENT_DIR, category_name, sub_category)
-            json_file_path = os.path.join(CURRENT_JSON_DIR, category_name, f"{sub_category}.json")
-        else:
-            category_path = os.path.join(CURRENT_DIR, category_name)
-            json_file_path = os.path.join(CURRENT_JSON_DIR, f"{category_name}.json")
 
-        if os.path.exists(category_path) and os.path.isdir(category_path):
-            shutil.rmtree(category_path)
-        else:
-            raise FileNotFoundError(f"Category path '{category_path}' not found.")
+@app.cli.command("ibgc-blob-migrate")
+def blob_migrate_command():
+    # Fold the existing Assets_IBGC / Assets_IBGC_Last trees into the blob store
+    version_lock = ibgc_version_lock()
+    try:
+        before = _blob_inode_index()
+        for root in (CURRENT_DIR, BACKUP_DIR):
+            if os.path.isdir(root):
+                build_blob_manifest(root)
+        version = get_current_version().get("current_version", 0)
+        write_json_file(blob_manifest_path(version), build_blob_manifest())
+    finally:
+        release_locks([version_lock])
+    print(f"Blob store ready: {len(_blob_inode_index()) - len(before)} new blob(s), manifest for version {version}.")
+
+
+@app.cli.command("ibgc-blob-gc")
+def blob_gc_command():
+    version_lock = ibgc_version_lock()  # Same lock increment_version() collects under
+    try:
+        removed = blob_gc()
+    finally:
+        release_locks([version_lock])
+    print(f"Removed {removed} unreferenced blob(s).")
+
+
+# === Cross-process write locks for IBGC mutations ===
+# A writer locks the categories it touches with flock() on files in LOCK_DIR,
+# so the locks hold across gunicorn workers and vanish with a dead process.
+# A scope is (main_category, sub_category); sub_category None means the whole
+# main category. Editing a sub-category takes its main category's lock shared
+# and its own exclusive, so different sub-categories (and different main
+# categories) are edited in parallel while a main-level rename or delete
+# waits for all of them. Locks are always taken in one global order (main
+# categories, then sub-categories, then the version lock), which rules out
+# deadlocks. The version lock serializes only the version bump and what is
+# published with it. Readers never lock: every write lands with a rename.
+# Lock files are never deleted; unlinking a file another process may be
+# waiting on would let two writers hold "the same" lock.
+def _normalize_scopes(scopes):
+    # Scopes without a usable main category are dropped; the operation rejects them anyway
+    normalized = {
+        (main_category, sub_category if isinstance(sub_category, str) and sub_category else None)
+        for main_category, sub_category in scopes
+        if isinstance(main_category, str) and main_category
+    }
+    return sorted(normalized, key=lambda scope: (scope[0], scope[1] or ""))
 
-        if os.path.exists(json_file_path):
-            os.remove(json_file_path)
 
-            if sub_category:
-                json_subdir = os.path.dirname(json_file_path)
-                if os.path.exists(json_subdir) and not os.listdir(json_subdir):
-                    os.rmdir(json_subdir)
+def _lock_file(key, mode):
+    os.makedirs(LOCK_DIR, exist_ok=True)
+    name = hashlib.sha1(json.dumps(key).encode('utf-8')).hexdigest()
+    lock_file = open(os.path.join(LOCK_DIR, f"{name}.lock"), 'a')
+    try:
+        fcntl.flock(lock_file, mode)
+    except BaseException:
+        lock_file.close()
+        raise
+    return lock_file
 
-        if sub_category:
-            main_category_dir = os.path.join(CURRENT_DIR, category_name)
-            if os.path.exists(main_category_dir) and not os.listdir(main_category_dir):
-                os.rmdir(main_category_dir)
 
-        # Step 4: Versioning
-        version_info = increment_version()
+def ibgc_lock(scopes):
+    scopes = _normalize_scopes(scopes)
+    whole_mains = {main_category for main_category, sub_category in scopes if not sub_category}
+    sub_scopes = [scope for scope in scopes if scope[1] and scope[0] not in whole_mains]
 
-        return jsonify({
-            "message": f"{'Sub-category' if sub_category else 'Category'} deleted successfully.",
-            "new_version": version_info
-        })
+    locks = []
+    try:
+        for main_category in sorted(whole_mains | {main_category for main_category, sub_category in sub_scopes}):
+            mode = fcntl.LOCK_EX if main_category in whole_mains else fcntl.LOCK_SH
+            locks.append(_lock_file(["main", main_category], mode))
+        for main_category, sub_category in sub_scopes:
+            locks.append(_lock_file(["sub", main_category, sub_category], fcntl.LOCK_EX))
+    except BaseException:
+        release_locks(locks)
+        raise
+    return locks
+
+
+def ibgc_version_lock():
+    return _lock_file(["version"], fcntl.LOCK_EX)
+
+
+def release_locks(locks):
+    # Newest first; closing the file drops its flock
+    for lock_file in reversed(locks):
+        lock_file.close()
+    del locks[:]
+
+
+# === Write-ahead journal for IBGC mutations ===
+# Every rename/write/delete a route performs is appended to its own log in
+# JOURNAL_DIR *before* it touches the tree. Overwritten or deleted entries are
+# parked in the journal's stash dir (a hardlink or a rename, never a copy), so
+# a rollback only replays the inverse of what actually happened. A live log is
+# held under flock; logs found unlocked at startup belong to a crashed request
+# and are rolled back by recover_journals().
+# journal_begin() takes the write locks of `scopes` (see ibgc_lock()) and the
+# journal holds them, plus the version lock once increment_version() ran,
+# until journal_commit()/journal_rollback(). Operations write under
+# journal["root"]: CURRENT_DIR itself, or with IBGC_STAGED_PUBLISH a staging
+# copy of just the locked categories that publish_stage() turns into a version.
+def _stage_path(journal_id):
+    return os.path.join(VERSIONS_DIR, f".stage-{journal_id}")
+
+
+def _is_staged_path(path):
+    return _is_under(path, VERSIONS_DIR) and os.path.relpath(path, VERSIONS_DIR).startswith(".stage-")
+
+
+def journal_begin(scopes=(), staged=True):
+    scopes = _normalize_scopes(scopes)
+    locks = ibgc_lock(scopes)
+    try:
+        os.makedirs(JOURNAL_DIR, exist_ok=True)
+        journal_id = f"{datetime.now().strftime('%Y%m%d%H%M%S%f')}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        log_path = os.path.join(JOURNAL_DIR, f"{journal_id}.log")
+        # Lock before the log becomes visible so recovery can never mistake it for a crashed one
+        log_file = open(f"{log_path}.new", 'a', encoding='utf-8')
+        fcntl.flock(log_file, fcntl.LOCK_EX)
+        os.rename(f"{log_path}.new", log_path)
+    except BaseException:
+        release_locks(locks)
+        raise
+    journal = {
+        "id": journal_id,
+        "log_path": log_path,
+        "log_file": log_file,
+        "stash_dir": os.path.join(JOURNAL_DIR, journal_id),
+        "seq": 0,
+        "locks": locks,
+        "scopes": scopes,
+        "root": CURRENT_DIR,
+        "stage": None
+    }
+    # Recovery re-takes these locks before undoing a crashed journal
+    _journal_append(journal, {"op": "begin", "scopes": scopes})
 
-    except Exception as e:
-        # Step 5: Rollback
+    if STAGED_PUBLISH_ENABLED and staged:
+        try:
+            # Hardlinks of the published files; every write replaces a directory entry
+            stage = _stage_path(journal_id)
+            os.makedirs(stage)
+            for path in _scope_paths(scopes):
+                _sync_path_links(path, os.path.join(stage, os.path.relpath(path, CURRENT_DIR)))
+        except BaseException:
+            journal_rollback(journal)
+            raise
+        journal["root"] = journal["stage"] = stage
+    return journal
+
+
+def _journal_append(journal, record):
+    journal["log_file"].write(json.dumps(record) + "\n")
+    journal["log_file"].flush()
+    os.fsync(journal["log_file"].fileno())
+
+
+def _journal_stash_path(journal):
+    os.makedirs(journal["stash_dir"], exist_ok=True)
+    journal["seq"] += 1
+    return os.path.join(journal["stash_dir"], str(journal["seq"]))
+
+
+def journal_makedirs(journal, path):
+    missing = []
+    while path and not os.path.exists(path):
+        missing.append(path)
+        path = os.path.dirname(path)
+    for dir_path in reversed(missing):
         try:
-            if os.path.exists(CURRENT_DIR):
-                shutil.rmtree(CURRENT_DIR)
+            os.mkdir(dir_path)
+        except FileExistsError:
+            continue  # Created meanwhile by a writer of a sibling sub-category; not ours to undo
+        _journal_append(journal, {"op": "mkdir", "path": dir_path})
 
-            if os.path.exists(BACKUP_DIR):
-                os.rename(BACKUP_DIR, CURRENT_DIR)
 
-                # Restore Json_Files_Last to Json_Files
-                restored_json_last = os.path.join(CURRENT_DIR, "Json_Files_Last")
-                restored_json = os.path.join(CURRENT_DIR, "Json_Files")
-                if os.path.exists(restored_json_last):
-                    if os.path.exists(restored_json):
-                        shutil.rmtree(restored_json)
-                    os.rename(restored_json_last, restored_json)
+def journal_rmdir(journal, path):
+    # Drops a directory only while it is empty. rmdir() checks that atomically,
+    # so a writer of a sibling sub-category (which holds the same shared main
+    # lock) filling it in the meantime just makes this a no-op.
+    try:
+        os.rmdir(path)
+    except OSError:
+        return  # Gone already, or no longer empty
+    _journal_append(journal, {"op": "rmdir", "path": path})
 
-        except Exception as rollback_error:
-            return jsonify({
-                "error": "Rollback failed.",
-                "details": str(rollback_error)
-            }), 500
 
-        return jsonify({
-            "error": "Something went wrong.",
-            "details": str(e)
-        }), 500
+def journal_remove(journal, path):
+    # Files and whole directories are parked in the stash with one rename
+    stash_path = _journal_stash_path(journal)
+    _journal_append(journal, {"op": "delete", "path": path, "stash": stash_path})
+    shutil.move(path, stash_path)
 
 
-  #########################  ***  Update Existing Category  *** #########################
-@app.route('/add-images-to-category', methods=['POST'])
-def add_images_to_category():
+def journal_rename(journal, src, dst):
+    if src == dst:
+        return
+    if os.path.lexists(dst):
+        journal_remove(journal, dst)
+    _journal_append(journal, {"op": "rename", "src": src, "dst": dst})
+    os.rename(src, dst)
+
+
+def _journal_replace(journal, path, write_fn):
+    stash_path = None
+    if os.path.lexists(path):
+        stash_path = _journal_stash_path(journal)
+        os.link(path, stash_path, follow_symlinks=False)
+    else:
+        journal_makedirs(journal, os.path.dirname(path))
+    _journal_append(journal, {"op": "write", "path": path, "stash": stash_path})
+    write_fn()
+
+
+def journal_write_json(journal, path, data, indent=4):
+    _journal_replace(journal, path, lambda: write_json_file(path, data, indent=indent))
+
+
+def journal_save_upload(journal, file, path):
+    _journal_replace(journal, path, lambda: save_upload(file, path))
+
+
+def journal_write_bytes(journal, path, data):
+    _journal_replace(journal, path, lambda: write_bytes_file(path, data))
+
+
+def _journal_undo(record):
+    if any(record.get(key) and _is_staged_path(record[key]) for key in ("path", "src", "dst")):
+        return  # A staging copy is dropped whole by _journal_close()
+    op = record.get("op")
+    if op == "rename":
+        if os.path.lexists(record["dst"]) and not os.path.lexists(record["src"]):
+            os.rename(record["dst"], record["src"])
+    elif op == "write":
+        if record.get("stash"):
+            if os.path.lexists(record["stash"]):
+                os.replace(record["stash"], record["path"])
+        elif os.path.lexists(record["path"]):
+            os.remove(record["path"])
+    elif op == "delete":
+        if os.path.lexists(record["stash"]) and not os.path.lexists(record["path"]):
+            os.makedirs(os.path.dirname(record["path"]), exist_ok=True)  # Parent may have gone with an unlogged rmdir
+            shutil.move(record["stash"], record["path"])
+    elif op == "mkdir":
+        if os.path.isdir(record["path"]) and not os.listdir(record["path"]):
+            os.rmdir(record["path"])
+    elif op == "rmdir":
+        os.makedirs(record["path"], exist_ok=True)
+
+
+def _journal_read(log_path):
+    records = []
+    with open(log_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                break  # Torn final line from a crash mid-append
+    return records
+
+
+def _journal_close(journal_id, log_path, log_file=None):
+    stash_dir = os.path.join(JOURNAL_DIR, journal_id)
+    if os.path.exists(stash_dir):
+        shutil.rmtree(stash_dir)
+    stage_dir = _stage_path(journal_id)
+    if os.path.exists(stage_dir):
+        shutil.rmtree(stage_dir)
+    if os.path.exists(log_path):
+        os.remove(log_path)
+    if log_file:
+        log_file.close()
+
+
+def journal_commit(journal):
     try:
-        category_name = request.form.get('category_name', '').strip()
-        sub_category = request.form.get('sub_category', '').strip() or None
+        _journal_append(journal, {"op": "commit"})
+        _journal_close(journal["id"], journal["log_path"], journal["log_file"])
+    finally:
+        release_locks(journal["locks"])
+
+
+def journal_rollback(journal):
+    try:
+        for record in reversed(_journal_read(journal["log_path"])):
+            _journal_undo(record)
+        _journal_close(journal["id"], journal["log_path"], journal["log_file"])
+    finally:
+        release_locks(journal["locks"])
+
+
+# === Crash recovery: roll back journals left behind by a dead process ===
+def recover_journals():
+    if not os.path.isdir(JOURNAL_DIR):
+        return []
+
+    recovered = []
+    for name in sorted(os.listdir(JOURNAL_DIR)):
+        if not name.endswith(".log"):
+            continue
+        log_path = os.path.join(JOURNAL_DIR, name)
+        with open(log_path, 'a', encoding='utf-8') as log_file:
+            try:
+                fcntl.flock(log_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                continue  # Still owned by a live request
+
+            records = _journal_read(log_path)
+            if not records or records[-1].get("op") != "commit":
+                # The dead writer's locks died with it; hold them again while undoing
+                scopes = records[0].get("scopes", []) if records and records[0].get("op") == "begin" else []
+                locks = ibgc_lock([tuple(scope) for scope in scopes])
+                locks.append(ibgc_version_lock())
+                try:
+                    for record in reversed(records):
+                        _journal_undo(record)
+                finally:
+                    release_locks(locks)
+                recovered.append(name[:-len(".log")])
+            _journal_close(name[:-len(".log")], log_path)
+
+    # Stash dirs whose log is already gone are leftovers of a finished request
+    for name in os.listdir(JOURNAL_DIR):
+        stash_dir = os.path.join(JOURNAL_DIR, name)
+        if os.path.isdir(stash_dir) and not os.path.exists(f"{stash_dir}.log"):
+            shutil.rmtree(stash_dir)
+
+    return recovered
+
+
+# Spawned transcode workers re-import the main module as __mp_main__, which is
+# this file when the dev server runs it as a script; recovery and the other
+# start-up steps below belong to the serving process only
+SERVING_PROCESS = multiprocessing.current_process().name == "MainProcess"
+if SERVING_PROCESS:
+    recover_journals()
+
+
+# === Staged build + atomic publish (IBGC_STAGED_PUBLISH=true) ===
+# Assets_IBGC is a symlink to ibgc_versions/<version>, a complete tree that
+# is never modified once published. A writer edits its staging copy of the
+# categories it locked; at publish time, under the version lock, the rest of
+# the tree is linked in from the published version, the stage is renamed to
+# ibgc_versions/<new version> and the symlink is swapped with one rename.
+# Readers see the old tree or the new one, never a half-applied mutation,
+# without taking any lock. The newest IBGC_VERSIONS_KEEP trees stay on disk
+# and /rollback_IBGC points the symlink back at one of them.
+def _version_dir(version):
+    return os.path.join(VERSIONS_DIR, str(version))
+
+
+def version_root(version_info):
+    # The tree `version_info` (version file data) was published with. Scans and
+    # downloads read that fixed directory, which is never modified, so a
+    # publish swapping CURRENT_DIR meanwhile cannot mix two trees under one
+    # version. Without staged publish there is only the live tree.
+    if not STAGED_PUBLISH_ENABLED:
+        return CURRENT_DIR
+    tree = version_info.get("tree")
+    if tree and os.path.isdir(_version_dir(tree)):
+        return _version_dir(tree)
+    return os.path.realpath(CURRENT_DIR)  # Published before trees were recorded
+
+
+def journal_publish_link(journal, target):
+    # Atomically point CURRENT_DIR at `target`; a rollback swaps the old link back
+    tmp_path = f"{CURRENT_DIR}.tmp"
+    if os.path.lexists(tmp_path):
+        os.remove(tmp_path)
+    os.symlink(os.path.relpath(target, os.path.dirname(CURRENT_DIR)), tmp_path)
+    _journal_replace(journal, CURRENT_DIR, lambda: os.replace(tmp_path, CURRENT_DIR))
+
+
+def publish_stage(journal, version):
+    stage = journal["stage"]
+    published = os.path.realpath(CURRENT_DIR)
+    staged = [os.path.relpath(path, stage) for path in _scope_paths(journal["scopes"], stage)]
+
+    def is_staged(rel_path):
+        return any(rel_path == path or rel_path.startswith(path + os.sep) for path in staged)
+
+    def holds_staged(rel_dir):
+        return rel_dir == '.' or any(path.startswith(rel_dir + os.sep) for path in staged)
+
+    # Link everything outside the locked categories in from the published tree.
+    # Parents of staged paths only exist if something is left in them, so a
+    # deleted last sub-category takes its emptied main category along.
+    for root, dirs, files in os.walk(published):
+        rel_root = os.path.relpath(root, published)
+        dirs[:] = [name for name in dirs if not is_staged(os.path.normpath(os.path.join(rel_root, name)))]
+        if not holds_staged(rel_root):
+            os.makedirs(os.path.join(stage, rel_root), exist_ok=True)
+        for name in files:
+            rel_path = os.path.normpath(os.path.join(rel_root, name))
+            if not is_staged(rel_path):
+                os.makedirs(os.path.join(stage, rel_root), exist_ok=True)
+                _link_or_copy(os.path.join(root, name), os.path.join(stage, rel_path))
+
+    target = _version_dir(version)
+    if os.path.lexists(target):
+        shutil.rmtree(target)  # Built by a publish that was rolled back
+    os.rename(stage, target)
+    journal["stage"] = None
+    journal_publish_link(journal, target)
+    prune_versions()
+
+
+def tree_read_locks(root):
+    # Shared lock on a retained tree for as long as a request reads from it;
+    # prune_versions() leaves a locked tree to a later publish. [] for a
+    # tree outside ibgc_versions/ (the live tree without staged publish).
+    root = os.path.realpath(root)
+    if os.path.dirname(root) != os.path.realpath(VERSIONS_DIR):
+        return []
+    return [_lock_file(["tree", os.path.basename(root)], fcntl.LOCK_SH)]
+
+
+def prune_versions():
+    published = os.path.realpath(CURRENT_DIR)
+    versions = sorted((name for name in os.listdir(VERSIONS_DIR) if name.isdigit()), key=int)
+    for name in versions[:-VERSIONS_KEEP]:
+        path = _version_dir(name)
+        if os.path.realpath(path) == published:
+            continue
+        try:
+            locks = [_lock_file(["tree", name], fcntl.LOCK_EX | fcntl.LOCK_NB)]
+        except BlockingIOError:
+            continue  # A download is still streaming from it
+        try:
+            shutil.rmtree(path)
+        finally:
+            release_locks(locks)
+
+
+def ensure_staged_layout():
+    # First start with IBGC_STAGED_PUBLISH: the existing tree becomes the published version
+    if not STAGED_PUBLISH_ENABLED or os.path.islink(CURRENT_DIR):
+        return
+    version_lock = ibgc_version_lock()
+    try:
+        if os.path.islink(CURRENT_DIR):
+            return  # Another worker got here first
+        os.makedirs(VERSIONS_DIR, exist_ok=True)
+        target = _version_dir(get_current_version().get("current_version", 0))
+        if os.path.lexists(target):
+            shutil.rmtree(target)
+        if os.path.isdir(CURRENT_DIR):
+            os.rename(CURRENT_DIR, target)
+        else:
+            os.makedirs(os.path.join(target, "Json_Files"))
+        os.symlink(os.path.relpath(target, os.path.dirname(CURRENT_DIR)), CURRENT_DIR)
+    finally:
+        release_locks([version_lock])
+
+
+if SERVING_PROCESS:
+    ensure_staged_layout()
+
+
+# === WebP transcoding of IBGC uploads ===
+# Every stored IBGC image is named N.webp, so uploads are re-encoded before
+# anything is written. Batches go to a process pool; a single image is
+# encoded inline, where the pool round-trip would cost more than it saves.
+# Workers are spawned, not forked: a forked worker would inherit the flock()
+# descriptors of whatever requests were holding category or journal locks at
+# that moment and keep those locks alive for as long as it runs. They only
+# need transcode.py (see SERVING_PROCESS for a dev server run as a script).
+TRANSCODE_WORKERS = int(os.environ.get("IBGC_TRANSCODE_WORKERS", "0")) or os.cpu_count() or 1
+_transcode_pool = None
+_transcode_pool_lock = threading.Lock()
+
+
+def get_transcode_pool():
+    global _transcode_pool
+    with _transcode_pool_lock:
+        if _transcode_pool is None:
+            _transcode_pool = ProcessPoolExecutor(
+                max_workers=TRANSCODE_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _transcode_pool
+
+
+def transcode_uploads(files):
+    # Returns WebP bytes (None = keep the upload as-is) per upload, in order;
+    # raises ValueError naming the first unreadable file
+    payloads = [getattr(f.stream, "staged_path", None) or f.read() for f in files]
+    if len(payloads) == 1 or TRANSCODE_WORKERS == 1:
+        pending = [(f, None, p) for f, p in zip(files, payloads)]
+    else:
+        pool = get_transcode_pool()
+        pending = [(f, pool.submit(transcode_to_webp, p), p) for f, p in zip(files, payloads)]
+
+    encoded = []
+    for upload, future, payload in pending:
+        try:
+            encoded.append(future.result() if future else transcode_to_webp(payload))
+        except (OSError, ValueError, Image.DecompressionBombError) as e:
+            raise ValueError(f"File '{upload.filename}' is not a valid image.") from e
+    return encoded
+
+
+# === IBGC operations ===
+# Each mutation is a function that applies one editorial operation through an
+# open journal and returns the change_entry() list it made. The caller owns
+# the locks, the snapshot, journal_begin(), increment_version() and commit/rollback, so
+# the single-operation routes and /transaction_IBGC share one implementation.
+# All of them read and write the journal's tree (journal["root"]: CURRENT_DIR,
+# or the staging copy with IBGC_STAGED_PUBLISH), never the backup, so an
+# operation sees what earlier operations of the same transaction wrote.
+# Bad input raises ValueError, a missing category or image FileNotFoundError.
+def ibgc_paths(main_category, sub_category=None, root=CURRENT_DIR):
+    # (image folder, category JSON) of a category
+    json_dir = os.path.join(root, "Json_Files")
+    if sub_category:
+        return (
+            os.path.join(root, main_category, sub_category),
+            os.path.join(json_dir, main_category, f"{sub_category}.json")
+        )
+    return os.path.join(root, main_category), os.path.join(json_dir, f"{main_category}.json")
+
+
+def published_path(journal, path):
+    # Where a path of the journal's tree lives once published (for messages)
+    return os.path.join(CURRENT_DIR, os.path.relpath(path, journal["root"]))
+
+
+def ibgc_add_category(journal, category_name, sub_category_name, images, webp_images, prem_list):
+    category_path, category_json_file = ibgc_paths(category_name, sub_category_name, journal["root"])
+    journal_makedirs(journal, category_path)
+
+    image_json_data = {}
+    changes = []
+    order = read_order(category_path)
+
+    for idx, webp_data in enumerate(webp_images):
+        filename = f"{idx}.webp"
+        replaced = order[idx] if order is not None and idx < len(order) else None
+        img_path = store_position(category_path, order, idx, ".webp")
+        if webp_data is None:
+            journal_save_upload(journal, images[idx], img_path)
+        else:
+            journal_write_bytes(journal, img_path, webp_data)
+        ingest_image(img_path)
+        if replaced:
+            journal_remove(journal, os.path.join(category_path, replaced))
+
+        prem_flag = False
+        if idx < len(prem_list):
+            prem_flag = str(prem_list[idx]).lower() == 'true'
+
+        image_json_data[f"Image{idx}"] = {
+            "Name": str(idx),
+            "Prem": prem_flag,
+            "main_category": category_name,
+            "sub_category": sub_category_name if sub_category_name else None
+        }
+        changes.append(change_entry("added", category_name, sub_category_name, filename=filename, prem=prem_flag))
+
+    if order is not None:
+        save_order(category_path, order, journal)
+    journal_write_json(journal, category_json_file, image_json_data)
+    return changes
+
+
+# === Add Category Route ===
+@app.route('/add-category_IBGC', methods=['POST'])
+def add_category_IBGC():
+    journal = None
+    try:
+        # === Get form data ===
+        category_name = request.form.get('category_name')  # main category
+        sub_category_name = request.form.get('sub_category_name')  # optional
         images = request.files.getlist('images')
-        prem_list = request.form.getlist('prem')  # optional list of 'true'/'false' strings
+        prem_list = request.form.getlist('prem')  # 'true'/'false'
 
         if not category_name or not images:
-            return jsonify({"success": False, "error": "Missing category_name or images"}), 400
+            return jsonify({"error": "Missing category_name or images"}), 400
 
-        # === Step 1: Backup CURRENT_DIR -> BACKUP_DIR ===
-        if os.path.exists(BACKUP_DIR):
-            shutil.rmtree(BACKUP_DIR)
-        shutil.copytree(CURRENT_DIR, BACKUP_DIR)
+        try:
+            webp_images = transcode_uploads(images)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
 
-        # Rename Json_Files to Json_Files_Last inside backup
-        backup_json_path = os.path.join(BACKUP_DIR, "Json_Files")
-        backup_json_last_path = os.path.join(BACKUP_DIR, "Json_Files_Last")
-        if os.path.exists(backup_json_path):
-            if os.path.exists(backup_json_last_path):
-                shutil.rmtree(backup_json_last_path)
-            os.rename(backup_json_path, backup_json_last_path)
+        # === Step 1: Lock the category, then backup it (hardlink snapshot, Json_Files -> Json_Files_Last) ===
+        scopes = [(category_name, sub_category_name)]
+        journal = journal_begin(scopes)
+        snapshot_current_to_backup(scopes)
 
-        # === Step 2: Define category folder and JSON file paths ===
-        if sub_category:
-            category_folder_path = os.path.join(CURRENT_DIR, category_name, sub_category)
-            json_rel_path = os.path.join(category_name, f"{sub_category}.json")
-        else:
-            category_folder_path = os.path.join(CURRENT_DIR, category_name)
-            json_rel_path = f"{category_name}.json"
+        # === Step 2: Save images and build JSON ===
+        changes = ibgc_add_category(journal, category_name, sub_category_name, images, webp_images, prem_list)
 
-        if not os.path.exists(category_folder_path):
-            raise Exception(f"Category folder not found: {category_folder_path}")
+        # === Step 3: Update version ===
+        version_info = increment_version(journal, changes)
+        journal_commit(journal)
 
-        # === Step 3: Load existing JSON from backup Json_Files_Last if possible, else from current Json_Files, else reconstruct ===
-        existing_data = {}
-        backup_json_file_path = os.path.join(backup_json_last_path, json_rel_path) if os.path.exists(backup_json_last_path) else None
+        return jsonify({
+            "message": f"Category '{category_name}' added successfully.",
+            "sub_category": sub_category_name if sub_category_name else None,
+            "new_version": version_info
+        })
+
+    except Exception as e:
+        # === Rollback on failure (replay the journal backwards) ===
+        try:
+            if journal:
+                journal_rollback(journal)
 
-        if backup_json_file_path and os.path.exists(backup_json_file_path):
-            with open(backup_json_file_path, 'r', encoding='utf-8') as f:
-                existing_data = json.load(f)
+        except Exception as rollback_error:
+            return jsonify({
+                "error": "Rollback failed.",
+                "details": str(rollback_error)
+            }), 500
+
+        return jsonify({
+            "error": "Something went wrong.",
+            "details": str(e)
+        }), 500
+
+# === In-memory catalog index ===
+# Built once per process and keyed on current_version. When the version moves,
+# only the main categories named in the change log since the indexed version
+# are rescanned; a gap in the log falls back to a full rebuild. Each refresh
+# publishes a new snapshot dict, so readers never see a half-updated index.
+IMAGE_EXTENSIONS = ('.webp', '.jpg', '.jpeg', '.png')
+_catalog_index = {"key": None, "version": None, "root": None, "mains": {}, "categories": [], "json": {}}
+_catalog_lock = threading.Lock()
+
+
+def _index_category(main_cat, subcat, images, root):
+    json_path = ibgc_paths(main_cat, subcat, root)[1]
+    if subcat:
+        url_prefix = f"/static/Assets_IBGC/{main_cat}/{subcat}"
+        label = f"{main_cat}/{subcat}"
+    else:
+        url_prefix = f"/static/Assets_IBGC/{main_cat}"
+        label = main_cat
+
+    data = None
+    image_meta = {}
+    try:
+        with open(json_path, 'r') as f:
+            try:
+                data = json.load(f)
+                for key, meta in data.items():
+                    filename = meta.get("Name")
+                    prem_value = meta.get("Prem", False)
+                    if filename is not None:
+                        for ext in IMAGE_EXTENSIONS:
+                            image_meta[f"{filename}{ext}"] = prem_value
+            except Exception as e:
+                print(f"Failed to read JSON for {label}: {e}")
+                data = {}
+    except FileNotFoundError:
+        pass
+
+    image_list = []
+    for image in images:
+        entry = {
+            "filename": image.name,
+            "url": fingerprinted_url(f"{url_prefix}/{image.name}", image.path, image.stat()),
+            "prem": image_meta.get(image.name, False)
+        }
+        entry.update(image_catalog_fields(image.path, image.stat()))
+        image_list.append(entry)
+
+    return {
+        "main_category": main_cat,
+        "sub_category": subcat,
+        "images": image_list,
+        "sprite": sprite_urls(images)
+    }, data
+
+
+def _index_main_category(scanned, root):
+    main_cat = scanned.name
+    entry = {
+        "direct_images": len(scanned.images),
+        "categories": [],
+        "json": {}
+    }
+    if scanned.sub_categories:
+        groups = [(sub.name, sub.images) for sub in scanned.sub_categories]
+    else:
+        groups = [(None, scanned.images)]
+    for subcat, images in groups:
+        category, data = _index_category(main_cat, subcat, images, root)
+        entry["categories"].append(category)
+        entry["json"][(main_cat, subcat)] = data
+    return entry
+
+
+def _touched_main_categories(base, to_version):
+    # Main categories changed between the cached index's (version, date) and
+    # to_version; None (rescan everything) unless the change log vouches for
+    # that base, which a publish that rolled back after indexing does not
+    if base is None or base[0] > to_version:
+        return None
+    from_version, from_date = base
+    change_log = get_change_log()["versions"]
+    if not any(v["version"] == from_version and v.get("date") == from_date for v in change_log):
+        return None
+    covered = [v for v in change_log if from_version < v["version"] <= to_version]
+    if [v["version"] for v in covered] != list(range(from_version + 1, to_version + 1)):
+        return None
+
+    touched = set()
+    for v in covered:
+        if v.get("changes") is None:
+            return None
+        for entry in v["changes"]:
+            touched.add(entry.get("main_category"))
+            if entry.get("new_main_category"):
+                touched.add(entry["new_main_category"])
+    return touched
+
+
+def get_catalog_index(version_info=None):
+    # Index of the version `version_info` (version file data) describes, the
+    # current one by default. _publish_version() asks for the version it is
+    # about to announce, before the version file says so. The cache is keyed
+    # on the version's date as well as its number: a publish that rolls back
+    # frees its number for the next one, which must not get the failed
+    # attempt's index.
+    global _catalog_index
+    version_info = version_info or get_current_version()
+    version = version_info.get("current_version", 0)
+    key = (version, version_info.get("current_version_date"))
+    if _catalog_index["key"] == key:
+        return _catalog_index
+
+    with _catalog_lock:
+        if _catalog_index["key"] == key:
+            return _catalog_index
+
+        # Scan the version's own tree, not whatever CURRENT_DIR points at by
+        # the time the scan gets there
+        root = version_root(version_info)
+        touched = _touched_main_categories(_catalog_index["key"], version)
+        if touched is None:
+            mains = {
+                scanned.name: _index_main_category(scanned, root)
+                for scanned in scan_tree(root, IMAGE_EXTENSIONS)
+            }
         else:
-            current_json_file_path = os.path.join(CURRENT_JSON_DIR, json_rel_path)
-            if os.path.exists(current_json_file_path):
-                with open(current_json_file_path, 'r', encoding='utf-8') as f:
-                    existing_data = json.load(f)
-            else:
-                # Reconstruct from files
-                existing_data = {}
-                existing_files = []
-                for f in os.listdir(category_folder_path):
-                    name, ext = os.path.splitext(f)
-                    if name.isdigit():
-                        existing_files.append(int(name))
-                existing_files.sort()
-                for n in existing_files:
-                    key = f"Image{n}"
-                    existing_data[key] = {
-                        "Name": str(n),
-                        "Prem": False,
-                        "main_category": category_name,
-                        "sub_category": sub_category  # None if no sub_category
-                    }
-
-        # === Step 4: Shift existing images upward to make room at beginning ===
-        total_new = len(images)
-        # Map existing images by their integer index
-        existing_by_index = {}
-        for key, val in existing_data.items():
+            mains = dict(_catalog_index["mains"])
+            for main_cat in touched:
+                main_cat_path = os.path.join(root, main_cat) if main_cat else None
+                if main_cat_path and main_cat != "Json_Files" and os.path.isdir(main_cat_path):
+                    mains[main_cat] = _index_main_category(scan_category(main_cat_path, IMAGE_EXTENSIONS), root)
+                else:
+                    mains.pop(main_cat, None)
+
+        json_by_category = {}
+        for entry in mains.values():
+            json_by_category.update(entry["json"])
+
+        _catalog_index = {
+            "key": key,
+            "version": version,
+            "root": root,
+            "mains": mains,
+            "categories": [c for main_cat in sorted(mains) for c in mains[main_cat]["categories"]],
+            "json": json_by_category
+        }
+        return _catalog_index
+
+
+# === Materialized catalog payloads ===
+# increment_version() serializes the catalog once (plus a gzip variant), before
+# the version file announces the new version, and every worker serves those
+# bytes as-is; a missing pair (e.g. right after a deploy) is built lazily on
+# first request. The files can be rewritten for the same version by the
+# backfill commands, so the cached copy is keyed on their inodes and ETags
+# carry a digest of the bytes served.
+CATALOG_PAYLOADS_KEEP = 3
+_catalog_payload = {"version": None, "stamp": None, "raw": None, "gzip": None, "digest": None, "gzip_digest": None}
+
+
+def catalog_payload_paths(version):
+    return (
+        os.path.join(CATALOG_PAYLOAD_DIR, f"catalog_v{version}.json"),
+        os.path.join(CATALOG_PAYLOAD_DIR, f"catalog_v{version}.json.gz")
+    )
+
+
+def write_catalog_payload(version, index, journal=None):
+    # `index` is the catalog index of `version`; returns the (raw, gzip) bytes written.
+    # Same encoding jsonify() uses outside debug mode (compact, sorted keys)
+    raw = (app.json.dumps(index["categories"], separators=(",", ":")) + "\n").encode('utf-8')
+    compressed = gzip.compress(raw, compresslevel=9, mtime=0)
+    raw_path, gzip_path = catalog_payload_paths(version)
+    if journal:
+        journal_write_bytes(journal, raw_path, raw)
+        journal_write_bytes(journal, gzip_path, compressed)
+    else:
+        write_bytes_file(raw_path, raw)
+        write_bytes_file(gzip_path, compressed)
+
+    # Older payloads are only a cache; drop all but the newest few
+    for name in os.listdir(CATALOG_PAYLOAD_DIR):
+        match = re.match(r'catalog_v(\d+)\.json(\.gz)?$', name)
+        if match and int(match.group(1)) <= version - CATALOG_PAYLOADS_KEEP:
             try:
-                idx = int(val.get("Name", "0"))
-                existing_by_index[idx] = val
-            except:
-                continue
+                os.remove(os.path.join(CATALOG_PAYLOAD_DIR, name))
+            except FileNotFoundError:
+                pass  # Pruned by another worker
+    return raw, compressed
+
+
+def _payload_stamp(paths):
+    stamp = []
+    for path in paths:
+        st = os.stat(path)
+        stamp.append((st.st_ino, st.st_mtime_ns, st.st_size))
+    return tuple(stamp)
+
+
+def _read_catalog_payload(version):
+    paths = catalog_payload_paths(version)
+    stamp = _payload_stamp(paths)
+    if _catalog_payload["stamp"] == (version, stamp):
+        return _catalog_payload
+    raw_path, gzip_path = paths
+    with open(raw_path, 'rb') as f:
+        raw = f.read()
+    with open(gzip_path, 'rb') as f:
+        compressed = f.read()
+    return _cache_catalog_payload(version, stamp, raw, compressed)
+
+
+def _cache_catalog_payload(version, stamp, raw, compressed):
+    global _catalog_payload
+    _catalog_payload = {
+        "version": version,
+        "stamp": (version, stamp),
+        "raw": raw,
+        "gzip": compressed,
+        "digest": hashlib.sha1(raw).hexdigest()[:16],
+        "gzip_digest": hashlib.sha1(compressed).hexdigest()[:16]
+    }
+    return _catalog_payload
+
+
+def get_catalog_payload(version):
+    # The payload of `version`, or of the newer version the tree already holds
+    # when that one's files are gone (payload["version"] says which)
+    try:
+        return _read_catalog_payload(version)
+    except FileNotFoundError:
+        pass
+
+    # Not built yet (first request after a deploy) or already pruned: one
+    # thread per worker builds it from the index; files of other workers
+    # doing the same are replaced atomically, so any copy is complete
+    index = get_catalog_index()
+    with _catalog_lock:
+        try:
+            return _read_catalog_payload(index["version"])
+        except FileNotFoundError:
+            raw, compressed = write_catalog_payload(index["version"], index)
+        try:
+            stamp = _payload_stamp(catalog_payload_paths(index["version"]))
+        except FileNotFoundError:
+            stamp = None  # Pruned already; serve the bytes just built
+        return _cache_catalog_payload(index["version"], stamp, raw, compressed)
+
+
+def catalog_payload_response(version_info):
+    version = version_info.get("current_version", 0)
+    use_gzip = request.accept_encodings["gzip"] > 0
+    payload = get_catalog_payload(version)
+    # Each encoding is its own representation, so it gets its own strong ETag
+    etag = f"ibgc-catalog-v{payload['version']}-" + (f"{payload['gzip_digest']}-gz" if use_gzip else payload["digest"])
+
+    def build():
+        response = app.response_class(payload["gzip"] if use_gzip else payload["raw"], mimetype='application/json')
+        if use_gzip:
+            response.headers["Content-Encoding"] = "gzip"
+        return response
+
+    response = conditional_response(etag, version_last_modified(version_info), build)
+    response.vary.add("Accept-Encoding")
+    return response
+
+
+# === Sprite atlases ===
+# One image per category holding every thumbnail on a SPRITE_TILE_SIZE grid,
+# plus a JSON map of filename -> {x, y, w, h}. Atlases are named after the
+# digests of the images they contain, so a publish only re-packs categories
+# whose contents actually changed; everything else resolves to the same
+# files. The map is written last and marks the atlas as complete.
+def sprite_key(images):
+    h = hashlib.sha1(f"{SPRITE_TILE_SIZE}\n".encode())
+    for image in images:
+        h.update(f"{image.name}:{image_digest(image.path, image.stat())}\n".encode())
+    return h.hexdigest()
+
+
+def sprite_urls(images):
+    if not images:
+        return None
+    key = sprite_key(images)
+    if not os.path.exists(os.path.join(SPRITE_DIR, f"{key}.json")):
+        return None
+    return {"image": f"/static/Sprites_IBGC/{key}.webp", "map": f"/static/Sprites_IBGC/{key}.json"}
+
+
+def build_sprite(images):
+    # Returns the atlas key, packing it only if no atlas exists for these exact images
+    key = sprite_key(images)
+    map_path = os.path.join(SPRITE_DIR, f"{key}.json")
+    if os.path.exists(map_path):
+        return key
+
+    columns = math.isqrt(len(images) - 1) + 1  # ceil(sqrt(n)): a roughly square atlas
+    rows = (len(images) + columns - 1) // columns
+    atlas = Image.new("RGBA", (columns * SPRITE_TILE_SIZE, rows * SPRITE_TILE_SIZE), (0, 0, 0, 0))
+    tiles = {}
+    for position, image in enumerate(images):
+        try:
+            with Image.open(image.path) as img:
+                img.draft("RGB", (SPRITE_TILE_SIZE, SPRITE_TILE_SIZE))
+                tile = img.convert("RGBA")
+        except Exception as e:
+            print(f"Skipping {image.path} in sprite atlas: {e}")
+            continue
+        tile.thumbnail((SPRITE_TILE_SIZE, SPRITE_TILE_SIZE), Image.LANCZOS)
+        x = (position % columns) * SPRITE_TILE_SIZE
+        y = (position // columns) * SPRITE_TILE_SIZE
+        atlas.paste(tile, (x, y))
+        tiles[image.name] = {"x": x, "y": y, "w": tile.width, "h": tile.height}
+
+    buffer = io.BytesIO()
+    atlas.save(buffer, "WEBP", quality=RENDITION_QUALITY)
+    write_bytes_file(os.path.join(SPRITE_DIR, f"{key}.webp"), buffer.getvalue())
+    write_json_file(map_path, {
+        "tile_size": SPRITE_TILE_SIZE,
+        "width": atlas.width,
+        "height": atlas.height,
+        "images": tiles
+    }, indent=None)
+    return key
+
+
+def _changed_main_categories(changes):
+    if changes is None:
+        return None  # Unknown: consider everything
+    touched = set()
+    for entry in changes:
+        touched.add(entry.get("main_category"))
+        if entry.get("new_main_category"):
+            touched.add(entry["new_main_category"])
+    return touched
+
+
+def build_sprites(main_categories=None, root=CURRENT_DIR):
+    # Packs atlases for the given main categories of the tree at `root` (all
+    # when None); returns the keys in use
+    if main_categories is None:
+        scanned = scan_tree(root, IMAGE_EXTENSIONS) if os.path.isdir(root) else []
+    else:
+        scanned = [
+            scan_category(os.path.join(root, main_cat), IMAGE_EXTENSIONS)
+            for main_cat in sorted(m for m in main_categories if m)
+            if main_cat != "Json_Files" and os.path.isdir(os.path.join(root, main_cat))
+        ]
+
+    keys = set()
+    for category in scanned:
+        groups = [sub.images for sub in category.sub_categories] or [category.images]
+        for images in groups:
+            if images:
+                keys.add(build_sprite(images))
+    return keys
+
+
+@app.cli.command("ibgc-sprites-build")
+def sprites_build_command():
+    # Pack atlases for the whole current tree and drop the ones no category uses anymore
+    keys = build_sprites()
+    removed = 0
+    if os.path.isdir(SPRITE_DIR):
+        for name in os.listdir(SPRITE_DIR):
+            if os.path.splitext(name)[0] not in keys:
+                os.remove(os.path.join(SPRITE_DIR, name))
+                removed += 1
+    refresh_catalog_payload()
+    print(f"{len(keys)} sprite atlas(es) ready, removed {removed} stale file(s).")
+
+
+# === Paged / per-category variant of /view-category_IBGC ===
+# ?limit=&cursor= pages through categories; narrowing to exactly one category
+# with ?category=[&sub_category=] pages through that category's images
+# instead. ?include_images=false returns only the category strip.
+def _catalog_sort_key(category):
+    return [category["main_category"], category["sub_category"] or ""]
+
+
+def _build_catalog_page(version_info, limit, state, main_filter, sub_filter, include_images):
+    version = version_info.get("current_version", 0)
+    categories = get_catalog_index(version_info)["categories"]
+    if main_filter:
+        categories = [
+            c for c in categories
+            if c["main_category"] == main_filter and (not sub_filter or c["sub_category"] == sub_filter)
+        ]
+        if not categories:
+            return jsonify({"error": "Category not found."}), 404
+
+    response = {
+        "version": version,
+        "version_changed": "v" in state and state["v"] != version
+    }
+
+    if main_filter and len(categories) == 1:
+        category = categories[0]
+        page, has_more = paginate_after(category["images"], lambda img: img["filename"], state.get("after"), limit)
+        response.update({
+            "main_category": category["main_category"],
+            "sub_category": category["sub_category"],
+            "total_images": len(category["images"]),
+            "sprite": category["sprite"],
+            "images": page
+        })
+        next_after = page[-1]["filename"] if page else None
+    else:
+        page, has_more = paginate_after(categories, _catalog_sort_key, state.get("after"), limit)
+        if not include_images:
+            page = [
+                {
+                    "main_category": c["main_category"],
+                    "sub_category": c["sub_category"],
+                    "total_images": len(c["images"])
+                }
+                for c in page
+            ]
+        response["categories"] = page
+        next_after = _catalog_sort_key(page[-1]) if page else None
+
+    response["next_cursor"] = encode_cursor({"v": version, "after": next_after}) if has_more else None
+    return jsonify(response)
+
+
+# --------- View Categories ---------
+@app.route('/view-category_IBGC', methods=['GET'])
+def view_category_IBGC():
+    try:
+        if not os.path.exists(CURRENT_DIR):
+            return jsonify({"error": "Assets_IBGC directory not found."}), 404
+
+        version_info = get_current_version()
+        if any(param in request.args for param in PAGE_PARAMS):
+            try:
+                page_args = get_page_args()
+            except ValueError as e:
+                return jsonify({"error": f"Invalid pagination parameters: {e}"}), 400
+            try:
+                payload = get_catalog_payload(version_info.get("current_version", 0))
+                return conditional_response(
+                    f"ibgc-catalog-v{payload['version']}-{payload['digest']}-q{query_fingerprint()}",
+                    version_last_modified(version_info),
+                    lambda: _build_catalog_page(version_info, *page_args)
+                )
+            except CursorError as e:
+                return jsonify({"error": f"Invalid pagination parameters: {e}"}), 400
+
+        return catalog_payload_response(version_info)
 
-        # Rename existing image files from highest index down to avoid overwrite
-        for old_index in sorted(existing_by_index.keys(), reverse=True):
-            new_index = old_index + total_new
-            old_file = os.path.join(category_folder_path, f"{old_index}.webp")
-            new_file = os.path.join(category_folder_path, f"{new_index}.webp")
-            if os.path.exists(old_file):
-                os.rename(old_file, new_file)
-            existing_by_index[old_index]["Name"] = str(new_index)
-
-        # === Step 5: Save new images at indices 0..total_new-1 and build their JSON entries ===
-        os.makedirs(category_folder_path, exist_ok=True)
-        new_data = {}
-        for idx, img in enumerate(images):
-            filename = f"{idx}.webp"
-            img_path = os.path.join(category_folder_path, secure_filename(filename))
-            img.save(img_path)
-
-            prem_flag = False
-            if idx < len(prem_list):
-                prem_flag = str(prem_list[idx]).lower() == 'true'
-
-            new_data[f"Image{idx}"] = {
-                "Name": str(idx),
-                "Prem": prem_flag,
+    except Exception as e:
+        return jsonify({
+            "error": "Something went wrong while reading categories.",
+            "details": str(e)
+        }), 500
+
+# ---- Delete Full Category ---
+def ibgc_delete_category(journal, category_name, sub_category):
+    category_path, json_file_path = ibgc_paths(category_name, sub_category, journal["root"])
+
+    if os.path.exists(category_path) and os.path.isdir(category_path):
+        journal_remove(journal, category_path)
+    else:
+        raise FileNotFoundError(f"Category path '{published_path(journal, category_path)}' not found.")
+
+    if os.path.exists(json_file_path):
+        journal_remove(journal, json_file_path)
+
+        if sub_category:
+            journal_rmdir(journal, os.path.dirname(json_file_path))
+
+    if sub_category:
+        # Only the sub-category is locked exclusively; see journal_rmdir()
+        journal_rmdir(journal, os.path.join(journal["root"], category_name))
+
+    return [change_entry("removed", category_name, sub_category, filename=None)]
+
+
+@app.route('/delete-category_IBGC', methods=['POST'])
+def delete_category_IBGC():
+    journal = None
+    try:
+        category_name = request.form.get('category_name')  # required
+        sub_category = request.form.get('sub_category')     # optional
+
+        if not category_name:
+            return jsonify({"error": "Missing category_name"}), 400
+
+        # Step 1: Lock and backup the category (hardlink snapshot)
+        scopes = [(category_name, sub_category)]
+        journal = journal_begin(scopes)
+        snapshot_current_to_backup(scopes)
+
+        # Step 2: Remove folder and JSON
+        changes = ibgc_delete_category(journal, category_name, sub_category)
+
+        # Step 3: Versioning
+        version_info = increment_version(journal, changes)
+        journal_commit(journal)
+
+        return jsonify({
+            "message": f"{'Sub-category' if sub_category else 'Category'} deleted successfully.",
+            "new_version": version_info
+        })
+
+    except Exception as e:
+        # Step 5: Rollback
+        try:
+            if journal:
+                journal_rollback(journal)
+
+        except Exception as rollback_error:
+            return jsonify({
+                "error": "Rollback failed.",
+                "details": str(rollback_error)
+            }), 500
+
+        return jsonify({
+            "error": "Something went wrong.",
+            "details": str(e)
+        }), 500
+
+
+  #########################  ***  Update Existing Category  *** #########################
+def ibgc_add_images(journal, category_name, sub_category, images, webp_images, prem_list):
+    # Inserts the uploads at positions 0..n-1; existing images move back by n
+    category_folder_path, json_path = ibgc_paths(category_name, sub_category, journal["root"])
+    if not os.path.exists(category_folder_path):
+        raise FileNotFoundError(f"Category folder not found: {published_path(journal, category_folder_path)}")
+
+    # === Step 1: Load existing JSON, else reconstruct it from the files ===
+    if os.path.exists(json_path):
+        with open(json_path, 'r', encoding='utf-8') as f:
+            existing_data = json.load(f)
+    else:
+        # Reconstruct from files (one entry per position)
+        existing_data = {}
+        for n in range(len(load_order(category_folder_path, IMAGE_EXTENSIONS))):
+            key = f"Image{n}"
+            existing_data[key] = {
+                "Name": str(n),
+                "Prem": False,
                 "main_category": category_name,
-                "sub_category": sub_category  # will be None if no sub_category
+                "sub_category": sub_category  # None if no sub_category
             }
 
-        # === Step 6: Merge new + existing, reindex sequentially, and rename files if needed ===
-        merged_entries = list(new_data.values()) + list(existing_by_index.values())
-        merged_sorted = sorted(merged_entries, key=lambda x: int(x["Name"]))
-
-        final_data = {}
-        for i, item in enumerate(merged_sorted):
-            old_index = int(item["Name"])
-            if old_index != i:
-                old_path = os.path.join(category_folder_path, f"{old_index}.webp")
-                new_path = os.path.join(category_folder_path, f"{i}.webp")
-                if os.path.exists(old_path):
-                    os.rename(old_path, new_path)
-            item["Name"] = str(i)
-            final_data[f"Image{i}"] = item
-
-        # === Step 7: Save updated JSON to CURRENT_JSON_DIR ===
-        final_json_path = os.path.join(CURRENT_JSON_DIR, json_rel_path)
-        os.makedirs(os.path.dirname(final_json_path), exist_ok=True)
-        with open(final_json_path, 'w', encoding='utf-8') as f:
-            json.dump(final_data, f, indent=4)
-
-        # === Step 8: Update version ===
-        version_info = increment_version()
+    # === Step 2: Store new images under stable ids, in front of the current order ===
+    # Existing images keep their files; only the order manifest changes
+    total_new = len(images)
+    order = load_order(category_folder_path, IMAGE_EXTENSIONS)
+    new_ids = [new_image_id(".webp") for _ in images]
+    for idx, webp_data in enumerate(webp_images):
+        img_path = os.path.join(category_folder_path, new_ids[idx])
+        if webp_data is None:
+            journal_save_upload(journal, images[idx], img_path)
+        else:
+            journal_write_bytes(journal, img_path, webp_data)
+        ingest_image(img_path)
+    save_order(category_folder_path, new_ids + order, journal)
+
+    # === Step 3: Build JSON entries for the new images (positions 0..total_new-1) ===
+    new_data = {}
+    for idx in range(total_new):
+        prem_flag = False
+        if idx < len(prem_list):
+            prem_flag = str(prem_list[idx]).lower() == 'true'
+
+        new_data[f"Image{idx}"] = {
+            "Name": str(idx),
+            "Prem": prem_flag,
+            "main_category": category_name,
+            "sub_category": sub_category  # will be None if no sub_category
+        }
+
+    # === Step 4: Shift existing entries behind the new ones and reindex sequentially ===
+    existing_by_index = {}
+    for key, val in existing_data.items():
+        try:
+            idx = int(val.get("Name", "0"))
+            existing_by_index[idx] = val
+        except:
+            continue
+    original_index = {id(val): idx for idx, val in existing_by_index.items()}
+
+    merged_entries = list(new_data.values()) + [existing_by_index[i] for i in sorted(existing_by_index)]
+    final_data = {}
+    for i, item in enumerate(merged_entries):
+        item["Name"] = str(i)
+        final_data[f"Image{i}"] = item
+
+    journal_write_json(journal, json_path, final_data)
+
+    reorder = {
+        f"{original_index[id(item)]}.webp": f"{item['Name']}.webp"
+        for item in existing_by_index.values()
+        if str(original_index[id(item)]) != item["Name"]
+    }
+    changes = [change_entry("reordered", category_name, sub_category, order=reorder)] if reorder else []
+    changes += [
+        change_entry("added", category_name, sub_category, filename=f"{item['Name']}.webp", prem=item["Prem"])
+        for item in new_data.values()
+    ]
+    return changes
+
+
+@app.route('/add-images-to-category', methods=['POST'])
+def add_images_to_category():
+    journal = None
+    try:
+        category_name = request.form.get('category_name', '').strip()
+        sub_category = request.form.get('sub_category', '').strip() or None
+        images = request.files.getlist('images')
+        prem_list = request.form.getlist('prem')  # optional list of 'true'/'false' strings
+
+        if not category_name or not images:
+            return jsonify({"success": False, "error": "Missing category_name or images"}), 400
+
+        try:
+            webp_images = transcode_uploads(images)
+        except ValueError as e:
+            return jsonify({"success": False, "error": str(e)}), 400
+
+        # === Step 1: Lock the category, backup it -> BACKUP_DIR (hardlink snapshot) ===
+        scopes = [(category_name, sub_category)]
+        journal = journal_begin(scopes)
+        snapshot_current_to_backup(scopes)
+
+        # === Step 2: Store the images and shift the category behind them ===
+        total_new = len(images)
+        changes = ibgc_add_images(journal, category_name, sub_category, images, webp_images, prem_list)
+
+        # === Step 3: Update version ===
+        version_info = increment_version(journal, changes)
+        journal_commit(journal)
 
         return jsonify({
             "success": True,
@@ -1055,20 +2853,10 @@ def add_images_to_category():
         })
 
     except Exception as e:
-        # === Rollback ===
+        # === Rollback (replay the journal backwards) ===
         try:
-            if os.path.exists(CURRENT_DIR):
-                shutil.rmtree(CURRENT_DIR)
-            if os.path.exists(BACKUP_DIR):
-                shutil.copytree(BACKUP_DIR, CURRENT_DIR)
-
-            # Restore Json_Files_Last -> Json_Files if present
-            backup_json_last = os.path.join(CURRENT_DIR, "Json_Files_Last")
-            restored_path = os.path.join(CURRENT_DIR, "Json_Files")
-            if os.path.exists(backup_json_last):
-                if os.path.exists(restored_path):
-                    shutil.rmtree(restored_path)
-                os.rename(backup_json_last, restored_path)
+            if journal:
+                journal_rollback(journal)
 
             return jsonify({
                 "success": False,
@@ -1085,8 +2873,84 @@ def add_images_to_category():
             }), 500
 
 
+def ibgc_rename_scopes(old_main_name, new_main_name, old_sub_name=None, new_sub_name=None):
+    # A main-level rename locks both whole main categories, a sub rename both sub-categories
+    new_main_name = new_main_name or old_main_name
+    if old_main_name != new_main_name or not old_sub_name:
+        return [(old_main_name, None), (new_main_name, None)]
+    return [(old_main_name, old_sub_name), (old_main_name, new_sub_name or old_sub_name)]
+
+
+def ibgc_rename(journal, old_main_name, new_main_name, old_sub_name=None, new_sub_name=None):
+    new_main_name = new_main_name or old_main_name
+    new_sub_name = new_sub_name or old_sub_name
+
+    if old_main_name == "Frame Categories" and new_main_name != old_main_name:
+        raise ValueError("Main category 'Frame Categories' cannot be renamed.")
+
+    json_dir = os.path.join(journal["root"], "Json_Files")
+    old_main_path, old_main_json = ibgc_paths(old_main_name, None, journal["root"])
+    new_main_path, new_main_json = ibgc_paths(new_main_name, None, journal["root"])
+
+    if not os.path.exists(old_main_path):
+        raise FileNotFoundError(f"Main category '{old_main_name}' not found.")
+    if old_main_name != new_main_name and os.path.exists(new_main_path):
+        raise ValueError(f"Main category '{new_main_name}' already exists.")
+
+    changes = []
+
+    # MAIN rename
+    if old_main_name != new_main_name:
+        journal_rename(journal, old_main_path, new_main_path)
+        changes.append(change_entry("renamed", old_main_name, None, new_main_category=new_main_name, new_sub_category=None))
+        if os.path.exists(old_main_json):
+            journal_rename(journal, old_main_json, new_main_json)
+        old_main_json_dir = os.path.join(json_dir, old_main_name)
+        new_main_json_dir = os.path.join(json_dir, new_main_name)
+        if os.path.exists(old_main_json_dir):
+            journal_rename(journal, old_main_json_dir, new_main_json_dir)
+
+        # --- NEW PART: update "category" inside new_main_json ---
+        if os.path.exists(new_main_json):
+            with open(new_main_json, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            # Update the category name in all images if old_main_name appears
+            for img_key, img_val in data.items():
+                if not isinstance(img_val, dict):
+                    continue
+                for field in ("category", "main_category"):
+                    if img_val.get(field) == old_main_name:
+                        img_val[field] = new_main_name
+            journal_write_json(journal, new_main_json, data)
+
+    # SUB rename
+    if old_sub_name and old_sub_name != new_sub_name:
+        old_sub_path, old_sub_json = ibgc_paths(new_main_name, old_sub_name, journal["root"])
+        new_sub_path, new_sub_json = ibgc_paths(new_main_name, new_sub_name, journal["root"])
+
+        if not os.path.exists(old_sub_path):
+            raise FileNotFoundError(f"Subcategory '{old_sub_name}' not found in '{new_main_name}'")
+        if os.path.exists(new_sub_path):
+            raise ValueError(f"Subcategory '{new_sub_name}' already exists in '{new_main_name}'")
+
+        journal_rename(journal, old_sub_path, new_sub_path)
+        changes.append(change_entry("renamed", new_main_name, old_sub_name, new_main_category=new_main_name, new_sub_category=new_sub_name))
+        if os.path.exists(old_sub_json):
+            journal_rename(journal, old_sub_json, new_sub_json)
+            with open(new_sub_json, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            # --- Update "sub_category" field inside all images ---
+            for img_key, img_val in data.items():
+                if isinstance(img_val, dict) and img_val.get("sub_category") == old_sub_name:
+                    img_val["sub_category"] = new_sub_name
+            journal_write_json(journal, new_sub_json, data)
+
+    return changes
+
+
 @app.route('/rename-category', methods=['POST'])
 def rename_category():
+    journal = None
     try:
         old_main_name = request.form.get('old_main_name', '').strip()
         new_main_name = request.form.get('new_main_name', '').strip() or old_main_name
@@ -1096,74 +2960,21 @@ def rename_category():
         if not old_main_name:
             return jsonify({"success": False, "error": "Missing old_main_name"}), 400
 
-        if old_main_name == "Frame Categories" and new_main_name != old_main_name:
-            return jsonify({"success": False, "error": "Main category 'Frame Categories' cannot be renamed."}), 400
-
-        # Backup
-        if os.path.exists(BACKUP_DIR):
-            shutil.rmtree(BACKUP_DIR)
+        # Lock both names, then backup (hardlink snapshot)
+        scopes = ibgc_rename_scopes(old_main_name, new_main_name, old_sub_name, new_sub_name)
+        journal = journal_begin(scopes)
         if os.path.exists(CURRENT_DIR):
-            shutil.copytree(CURRENT_DIR, BACKUP_DIR)
-
-        old_main_path = os.path.join(CURRENT_DIR, old_main_name)
-        new_main_path = os.path.join(CURRENT_DIR, new_main_name)
-        old_main_json = os.path.join(CURRENT_JSON_DIR, f"{old_main_name}.json")
-        new_main_json = os.path.join(CURRENT_JSON_DIR, f"{new_main_name}.json")
-
-        if not os.path.exists(old_main_path):
-            return jsonify({"success": False, "error": f"Main category '{old_main_name}' not found."}), 404
-        if old_main_name != new_main_name and os.path.exists(new_main_path):
-            return jsonify({"success": False, "error": f"Main category '{new_main_name}' already exists."}), 400
-
-        # MAIN rename
-        if old_main_name != new_main_name:
-            os.rename(old_main_path, new_main_path)
-            if os.path.exists(old_main_json):
-                os.rename(old_main_json, new_main_json)
-            old_main_json_dir = os.path.join(CURRENT_JSON_DIR, old_main_name)
-            new_main_json_dir = os.path.join(CURRENT_JSON_DIR, new_main_name)
-            if os.path.exists(old_main_json_dir):
-                os.rename(old_main_json_dir, new_main_json_dir)
-
-            # --- NEW PART: update "category" inside new_main_json ---
-            if os.path.exists(new_main_json):
-                with open(new_main_json, 'r+', encoding='utf-8') as f:
-                    data = json.load(f)
-                    # Update "category" in all images if old_main_name appears
-                    for img_key, img_val in data.items():
-                        if img_val.get("category") == old_main_name:
-                            img_val["category"] = new_main_name
-                    f.seek(0)
-                    json.dump(data, f, indent=4)
-                    f.truncate()
-
-        # SUB rename
-        if old_sub_name and old_sub_name != new_sub_name:
-            old_sub_path = os.path.join(new_main_path, old_sub_name)
-            new_sub_path = os.path.join(new_main_path, new_sub_name)
-            old_sub_json = os.path.join(CURRENT_JSON_DIR, new_main_name, f"{old_sub_name}.json")
-            new_sub_json = os.path.join(CURRENT_JSON_DIR, new_main_name, f"{new_sub_name}.json")
-
-            if not os.path.exists(old_sub_path):
-                return jsonify({"success": False, "error": f"Subcategory '{old_sub_name}' not found in '{new_main_name}'"}), 404
-            if os.path.exists(new_sub_path):
-                return jsonify({"success": False, "error": f"Subcategory '{new_sub_name}' already exists in '{new_main_name}'"}), 400
-
-            os.rename(old_sub_path, new_sub_path)
-            if os.path.exists(old_sub_json):
-                os.rename(old_sub_json, new_sub_json)
-                with open(new_sub_json, 'r+', encoding='utf-8') as f:
-                    data = json.load(f)
-                    data["sub_category"] = new_sub_name
-                    # --- NEW PART: update "sub_category" field inside all images ---
-                    for img_key, img_val in data.items():
-                        if img_val.get("sub_category") == old_sub_name:
-                            img_val["sub_category"] = new_sub_name
-                    f.seek(0)
-                    json.dump(data, f, indent=4)
-                    f.truncate()
-
-        version_data = increment_version()
+            snapshot_current_to_backup(scopes)
+
+        try:
+            changes = ibgc_rename(journal, old_main_name, new_main_name, old_sub_name, new_sub_name)
+        except (FileNotFoundError, ValueError) as e:
+            journal_rollback(journal)
+            journal = None
+            return jsonify({"success": False, "error": str(e)}), 404 if isinstance(e, FileNotFoundError) else 400
+
+        version_data = increment_version(journal, changes)
+        journal_commit(journal)
 
         return jsonify({
             "success": True,
@@ -1173,15 +2984,68 @@ def rename_category():
 
     except Exception as e:
         # Rollback on error
-        if os.path.exists(CURRENT_DIR):
-            shutil.rmtree(CURRENT_DIR)
-        if os.path.exists(BACKUP_DIR):
-            shutil.copytree(BACKUP_DIR, CURRENT_DIR)
+        if journal:
+            journal_rollback(journal)
 
         return jsonify({"success": False, "error": str(e)}), 500
 
+def ibgc_replace_image(journal, main_category, sub_category, old_filename, new_image, new_image_data, prem_flag):
+    # new_image_data: transcoded bytes, or None to commit the upload as-is
+    category_path, json_path = ibgc_paths(main_category, sub_category, journal["root"])
+    if not os.path.exists(category_path):
+        raise FileNotFoundError(f"Category path '{published_path(journal, category_path)}' does not exist.")
+
+    # === Step 1: Load JSON, else reconstruct it from the folder ===
+    json_data = {}
+    if os.path.exists(json_path):
+        with open(json_path, 'r', encoding='utf-8') as jf:
+            json_data = json.load(jf)
+    else:
+        # fallback: reconstruct from folder (one entry per position)
+        for name in range(len(load_order(category_path, IMAGE_EXTENSIONS))):
+            key = f"Image{name}"
+            json_data[key] = {"Name": str(name), "Prem": False, "category": main_category}
+            if sub_category:
+                json_data[key]["sub_category"] = sub_category
+
+    # === Step 2: Replace file on disk ===
+    target_file_path = resolve_image(category_path, old_filename)
+    if not target_file_path or not os.path.exists(target_file_path):
+        raise FileNotFoundError(f"Image '{old_filename}' not found in '{published_path(journal, category_path)}'.")
+
+    # overwrite (breaks the hardlink shared with the backup)
+    if new_image_data is None:
+        journal_save_upload(journal, new_image, target_file_path)
+    else:
+        journal_write_bytes(journal, target_file_path, new_image_data)
+    ingest_image(target_file_path)
+
+    # === Step 3: Update JSON entry ===
+    image_index = os.path.splitext(old_filename)[0]
+    image_key = None
+    for key, val in json_data.items():
+        if str(val.get("Name")) == str(image_index):
+            image_key = key
+            break
+
+    if not image_key:
+        # create entry if not present (best-effort)
+        image_key = f"Image{image_index}"
+        json_data[image_key] = {"Name": str(image_index), "Prem": prem_flag, "category": main_category}
+        if sub_category:
+            json_data[image_key]["sub_category"] = sub_category
+    else:
+        json_data[image_key]["Prem"] = prem_flag
+        json_data[image_key]["category"] = main_category
+        json_data[image_key]["sub_category"] = sub_category
+
+    journal_write_json(journal, json_path, json_data)
+    return [change_entry("replaced", main_category, sub_category, filename=old_filename, prem=prem_flag)]
+
+
 @app.route('/replace-category-image', methods=['POST'])
 def replace_category_image():
+    journal = None
     try:
         main_category = request.form.get('main_category', '').strip()
         sub_category = request.form.get('sub_category', '').strip() or None
@@ -1189,95 +3053,33 @@ def replace_category_image():
         new_image = request.files.get('new_image')
         prem_flag = str(request.form.get('prem', 'false')).lower() == 'true'
 
-        if not main_category or not old_filename or new_image:
-            # Note: new_image can be present as FileStorage; we check not None below
-            pass
-
         if not main_category or not old_filename or new_image is None:
             return jsonify({"success": False, "error": "Missing required fields"}), 400
 
-        # === Step 1: Backup CURRENT_DIR -> BACKUP_DIR ===
-        if os.path.exists(BACKUP_DIR):
-            shutil.rmtree(BACKUP_DIR)
-        shutil.copytree(CURRENT_DIR, BACKUP_DIR)
-
-        # === Step 2: Rename Json_Files -> Json_Files_Last in backup ===
-        backup_json_path = os.path.join(BACKUP_DIR, "Json_Files")
-        backup_json_last_path = os.path.join(BACKUP_DIR, "Json_Files_Last")
-        if os.path.exists(backup_json_path):
-            if os.path.exists(backup_json_last_path):
-                shutil.rmtree(backup_json_last_path)
-            os.rename(backup_json_path, backup_json_last_path)
-
-        # === Step 3: Prepare category paths ===
-        if sub_category:
-            category_path = os.path.join(CURRENT_DIR, main_category, sub_category)
-            json_rel_path = os.path.join(main_category, f"{sub_category}.json")
-        else:
-            category_path = os.path.join(CURRENT_DIR, main_category)
-            json_rel_path = f"{main_category}.json"
+        new_image_data = None  # None: commit the upload as-is
+        if old_filename.lower().endswith('.webp'):
+            try:
+                new_image_data = transcode_uploads([new_image])[0]
+            except ValueError as e:
+                return jsonify({"success": False, "error": str(e)}), 400
 
-        if not os.path.exists(category_path):
-            return jsonify({"success": False, "error": f"Category path '{category_path}' does not exist."}), 404
+        # === Step 1: Lock the category, backup it -> BACKUP_DIR (hardlink snapshot) ===
+        scopes = [(main_category, sub_category)]
+        journal = journal_begin(scopes)
+        snapshot_current_to_backup(scopes)
+        category_path = ibgc_paths(main_category, sub_category)[0]
 
-        # Choose JSON source (prefer backup Json_Files_Last)
-        json_data = {}
-        backup_json_file = None
-        if os.path.exists(backup_json_last_path):
-            backup_json_file = os.path.join(backup_json_last_path, json_rel_path)
-        if backup_json_file and os.path.exists(backup_json_file):
-            with open(backup_json_file, 'r', encoding='utf-8') as jf:
-                json_data = json.load(jf)
-        else:
-            alt_current_json = os.path.join(CURRENT_JSON_DIR, json_rel_path)
-            if os.path.exists(alt_current_json):
-                with open(alt_current_json, 'r', encoding='utf-8') as jf:
-                    json_data = json.load(jf)
-            else:
-                # fallback: reconstruct from folder
-                for f in os.listdir(category_path):
-                    name, ext = os.path.splitext(f)
-                    if name.isdigit():
-                        key = f"Image{name}"
-                        json_data[key] = {"Name": str(name), "Prem": False, "category": main_category}
-                        if sub_category:
-                            json_data[key]["sub_category"] = sub_category
-
-        # === Step 4: Replace file on disk ===
-        target_file_path = os.path.join(category_path, old_filename)
-        if not os.path.exists(target_file_path):
-            return jsonify({"success": False, "error": f"Image '{old_filename}' not found in '{category_path}'."}), 404
-
-        # overwrite
-        new_image.save(target_file_path)
-
-        # === Step 5: Update JSON entry ===
-        image_index = os.path.splitext(old_filename)[0]
-        image_key = None
-        for key, val in json_data.items():
-            if str(val.get("Name")) == str(image_index):
-                image_key = key
-                break
-
-        if not image_key:
-            # create entry if not present (best-effort)
-            image_key = f"Image{image_index}"
-            json_data[image_key] = {"Name": str(image_index), "Prem": prem_flag, "category": main_category}
-            if sub_category:
-                json_data[image_key]["sub_category"] = sub_category
-        else:
-            json_data[image_key]["Prem"] = prem_flag
-            json_data[image_key]["category"] = main_category
-            json_data[image_key]["sub_category"] = sub_category
-
-        # === Step 6: Save JSON into CURRENT_JSON_DIR ===
-        current_json_path = os.path.join(CURRENT_JSON_DIR, json_rel_path)
-        os.makedirs(os.path.dirname(current_json_path), exist_ok=True)
-        with open(current_json_path, 'w', encoding='utf-8') as jf:
-            json.dump(json_data, jf, indent=4)
+        # === Step 2: Replace the file and its JSON entry ===
+        try:
+            changes = ibgc_replace_image(journal, main_category, sub_category, old_filename, new_image, new_image_data, prem_flag)
+        except FileNotFoundError as e:
+            journal_rollback(journal)
+            journal = None
+            return jsonify({"success": False, "error": str(e)}), 404
 
-        # === Step 7: Version ===
-        version_data = increment_version()
+        # === Step 3: Version ===
+        version_data = increment_version(journal, changes)
+        journal_commit(journal)
 
         return jsonify({
             "success": True,
@@ -1289,18 +3091,8 @@ def replace_category_image():
         # === Rollback ===
         rollback_error = None
         try:
-            if os.path.exists(CURRENT_DIR):
-                shutil.rmtree(CURRENT_DIR)
-            if os.path.exists(BACKUP_DIR):
-                shutil.copytree(BACKUP_DIR, CURRENT_DIR)
-
-            # Restore Json_Files_Last -> Json_Files
-            backup_json_last = os.path.join(CURRENT_DIR, "Json_Files_Last")
-            restored_path = os.path.join(CURRENT_DIR, "Json_Files")
-            if os.path.exists(backup_json_last):
-                if os.path.exists(restored_path):
-                    shutil.rmtree(restored_path)
-                os.rename(backup_json_last, restored_path)
+            if journal:
+                journal_rollback(journal)
 
         except Exception as re:
             rollback_error = str(re)
@@ -1320,87 +3112,82 @@ def extract_index(filename):
     match = re.search(r'(\d+)', filename)
     return int(match.group(1)) if match else -1
 
-@app.route('/delete-image-from-category', methods=['POST'])
-def deleteImageFromCategory():
-    try:
-        main_category = request.form.get('main_category')
-        sub_category = request.form.get('sub_category')  # optional
-        filename = request.form.get('filename')
-
-        if not main_category or not filename:
-            return jsonify({"success": False, "error": "Missing main_category or filename"}), 400
+def ibgc_delete_image(journal, main_category, sub_category, filename):
+    deleted_index = extract_index(filename)
+    if deleted_index == -1:
+        raise ValueError("Invalid filename format")
 
-        deleted_index = extract_index(filename)
-        if deleted_index == -1:
-            return jsonify({"success": False, "error": "Invalid filename format"}), 400
+    category_path, json_path = ibgc_paths(main_category, sub_category, journal["root"])
+    if not os.path.exists(category_path):
+        raise FileNotFoundError(f"Category path '{published_path(journal, category_path)}' not found.")
+    if not os.path.exists(json_path):
+        raise FileNotFoundError(f"JSON file not found at '{published_path(journal, json_path)}'.")
 
-        # === Step 1: Backup CURRENT_DIR -> BACKUP_DIR ===
-        if os.path.exists(BACKUP_DIR):
-            shutil.rmtree(BACKUP_DIR)
-        shutil.copytree(CURRENT_DIR, BACKUP_DIR)
+    # === Step 1: Delete image file; later images move up through the order manifest ===
+    order = load_order(category_path, IMAGE_EXTENSIONS)
+    file_path = resolve_image(category_path, filename)
+    if not file_path or os.path.basename(file_path) not in order or not os.path.exists(file_path):
+        raise FileNotFoundError(f"Image '{filename}' not found in '{published_path(journal, category_path)}'.")
+    journal_remove(journal, file_path)
+    order.remove(os.path.basename(file_path))
+    save_order(category_path, order, journal)
 
-        # === Step 2: Rename Json_Files -> Json_Files_Last in backup ===
-        backup_json_path = os.path.join(BACKUP_DIR, "Json_Files")
-        backup_json_last_path = os.path.join(BACKUP_DIR, "Json_Files_Last")
-        if os.path.exists(backup_json_path):
-            if os.path.exists(backup_json_last_path):
-                shutil.rmtree(backup_json_last_path)
-            os.rename(backup_json_path, backup_json_last_path)
+    # === Step 2: Load JSON and remove entry ===
+    with open(json_path, 'r', encoding='utf-8') as jf:
+        json_data = json.load(jf)
 
-        # === Step 3: Determine paths ===
-            if sub_category:
-                category_path = os.path.join(CURRENT_DIR, main_category, sub_category)
-                category_json_path = os.path.join(backup_json_last_path, main_category, f"{sub_category}.json")
-                current_json_path = os.path.join(CURRENT_JSON_DIR, main_category, f"{sub_category}.json")
-            
+    json_items = sorted(json_data.values(), key=lambda x: int(x['Name']))
 
-            else:
-                category_path = os.path.join(CURRENT_DIR, main_category)
-                category_json_path = os.path.join(backup_json_last_path, f"{main_category}.json")
-                current_json_path = os.path.join(CURRENT_JSON_DIR, f"{main_category}.json")
+    updated_json = {}
+    reorder = {}
+    new_index = 0
+    for item in json_items:
+        current_index = int(item["Name"])
+        if current_index == deleted_index:
+            continue  # Skip deleted image
 
+        if current_index != new_index:
+            reorder[f"{current_index}.webp"] = f"{new_index}.webp"
 
-        if not os.path.exists(category_path):
-            raise Exception(f"Category path '{category_path}' not found.")
-        if not os.path.exists(category_json_path):
-            raise Exception(f"JSON file not found at '{category_json_path}'.")
+        item["Name"] = str(new_index)
+        updated_json[f"Image{new_index}"] = item
+        new_index += 1
 
-        # === Step 4: Delete image file ===
-        file_path = os.path.join(category_path, filename)
-        if not os.path.exists(file_path):
-            raise Exception(f"Image '{filename}' not found in '{category_path}'.")
-        os.remove(file_path)
+    # === Step 3: Save updated JSON ===
+    journal_write_json(journal, json_path, updated_json)
 
-        # === Step 5: Load JSON and remove entry ===
-        with open(category_json_path, 'r', encoding='utf-8') as jf:
-            json_data = json.load(jf)
+    changes = [change_entry("removed", main_category, sub_category, filename=filename)]
+    if reorder:
+        changes.append(change_entry("reordered", main_category, sub_category, order=reorder))
+    return changes
 
-        json_items = sorted(json_data.values(), key=lambda x: int(x['Name']))
 
-        updated_json = {}
-        new_index = 0
-        for item in json_items:
-            current_index = int(item["Name"])
-            if current_index == deleted_index:
-                continue  # Skip deleted image
+@app.route('/delete-image-from-category', methods=['POST'])
+def deleteImageFromCategory():
+    journal = None
+    try:
+        main_category = request.form.get('main_category')
+        sub_category = request.form.get('sub_category')  # optional
+        filename = request.form.get('filename')
 
-            old_img_path = os.path.join(category_path, f"{current_index}.webp")
-            new_img_path = os.path.join(category_path, f"{new_index}.webp")
+        if not main_category or not filename:
+            return jsonify({"success": False, "error": "Missing main_category or filename"}), 400
 
-            if os.path.exists(old_img_path):
-                os.rename(old_img_path, new_img_path)
+        if extract_index(filename) == -1:
+            return jsonify({"success": False, "error": "Invalid filename format"}), 400
 
-            item["Name"] = str(new_index)
-            updated_json[f"Image{new_index}"] = item
-            new_index += 1
+        # === Step 1: Lock the category, backup it -> BACKUP_DIR (hardlink snapshot) ===
+        scopes = [(main_category, sub_category)]
+        journal = journal_begin(scopes)
+        snapshot_current_to_backup(scopes)
+        category_path = ibgc_paths(main_category, sub_category)[0]
 
-        # === Step 6: Save updated JSON ===
-        os.makedirs(os.path.dirname(current_json_path), exist_ok=True)
-        with open(current_json_path, 'w', encoding='utf-8') as jf:
-            json.dump(updated_json, jf, indent=4)
+        # === Step 2: Delete the image and reindex ===
+        changes = ibgc_delete_image(journal, main_category, sub_category, filename)
 
-        # === Step 7: Update version ===
-        version_info = increment_version()
+        # === Step 3: Update version ===
+        version_info = increment_version(journal, changes)
+        journal_commit(journal)
 
         return jsonify({
             "success": True,
@@ -1409,19 +3196,10 @@ def deleteImageFromCategory():
         })
 
     except Exception as e:
-        # === Rollback ===
+        # === Rollback (replay the journal backwards) ===
         try:
-            if os.path.exists(CURRENT_DIR):
-                shutil.rmtree(CURRENT_DIR)
-            if os.path.exists(BACKUP_DIR):
-                shutil.copytree(BACKUP_DIR, CURRENT_DIR)
-
-            backup_json_last = os.path.join(CURRENT_DIR, "Json_Files_Last")
-            restored_path = os.path.join(CURRENT_DIR, "Json_Files")
-            if os.path.exists(backup_json_last):
-                if os.path.exists(restored_path):
-                    shutil.rmtree(restored_path)
-                os.rename(backup_json_last, restored_path)
+            if journal:
+                journal_rollback(journal)
 
         except Exception as rollback_error:
             return jsonify({
@@ -1554,117 +3332,116 @@ def deleteImageFromCategory():
 #             "success": False,
 #             "error": str(e)
 #         }), 500
-@app.route('/update-prem-flag', methods=['POST'])
-def update_prem_flag():
-    try:
-        print("update-prem-flag called")
-        updates = request.get_json()
-        print("Received data:", updates)
-        updates = request.get_json()
-        if not isinstance(updates, list) or not updates:
-            return jsonify({"error": "Invalid or empty update list."}), 400
 
-        # Backup the entire CURRENT_DIR -> BACKUP_DIR
-        if os.path.exists(BACKUP_DIR):
-            shutil.rmtree(BACKUP_DIR)
-        shutil.copytree(CURRENT_DIR, BACKUP_DIR)
 
-        # Rename Json_Files -> Json_Files_Last inside BACKUP_DIR
-        backup_json_path = os.path.join(BACKUP_DIR, "Json_Files")
-        backup_json_last_path = os.path.join(BACKUP_DIR, "Json_Files_Last")
-        if os.path.exists(backup_json_path):
-            if os.path.exists(backup_json_last_path):
-                shutil.rmtree(backup_json_last_path)
-            os.rename(backup_json_path, backup_json_last_path)
+def ibgc_prem_scopes(updates):
+    return [
+        (item.get("main_category"), item.get("sub_category"))
+        for item in updates if isinstance(item, dict)
+    ]
 
-        # Recreate empty Json_Files
-        os.makedirs(CURRENT_JSON_DIR, exist_ok=True)
 
-        from collections import defaultdict
-        import re
+def ibgc_set_prem(journal, updates):
+    # Returns (changes, updated, failed); entries that cannot be applied are reported, not raised
+    from collections import defaultdict
 
-        def extract_index(filename):
-            match = re.search(r'(\d+)', filename)
-            return int(match.group(1)) if match else -1
+    # Group updates by (main_category, sub_category) tuple
+    updates_by_category = defaultdict(list)
+    for item in updates:
+        if not isinstance(item, dict):
+            continue
+        main_cat = item.get("main_category")
+        sub_cat = item.get("sub_category")  # optional, can be None
+        filename = item.get("filename")
+        prem = item.get("prem")
+        if main_cat and filename and prem is not None:
+            # Use tuple key
+            updates_by_category[(main_cat, sub_cat)].append((filename, prem))
+
+    if not updates_by_category:
+        raise ValueError("No valid updates found.")
+
+    failed_updates = []
+    success_updates = []
+    changes = []
+
+    # Process updates grouped by (main_category, sub_category)
+    for (main_cat, sub_cat), files in updates_by_category.items():
+        json_path = ibgc_paths(main_cat, sub_cat, journal["root"])[1]
+
+        if not os.path.exists(json_path):
+            failed_updates.append({
+                "category": main_cat,
+                "sub_category": sub_cat,
+                "reason": "JSON file not found"
+            })
+            continue
 
-        # Group updates by (main_category, sub_category) tuple
-        updates_by_category = defaultdict(list)
-        for item in updates:
-            if not isinstance(item, dict):
-                continue
-            main_cat = item.get("main_category")
-            sub_cat = item.get("sub_category")  # optional, can be None
-            filename = item.get("filename")
-            prem = item.get("prem")
-            if main_cat and filename and prem is not None:
-                # Use tuple key
-                updates_by_category[(main_cat, sub_cat)].append((filename, prem))
-
-        if not updates_by_category:
-            return jsonify({"error": "No valid updates found."}), 400
-
-        failed_updates = []
-        success_updates = []
-
-        # Process updates grouped by (main_category, sub_category)
-        for (main_cat, sub_cat), files in updates_by_category.items():
-            if sub_cat:
-                json_path = os.path.join(backup_json_last_path, main_cat, f"{sub_cat}.json")
-                new_json_path = os.path.join(CURRENT_JSON_DIR, main_cat, f"{sub_cat}.json")
-            else:
-                json_path = os.path.join(backup_json_last_path, f"{main_cat}.json")
-                new_json_path = os.path.join(CURRENT_JSON_DIR, f"{main_cat}.json")
+        try:
+            with open(json_path, 'r', encoding='utf-8') as jf:
+                json_data = json.load(jf)
+        except Exception as e:
+            failed_updates.append({
+                "category": main_cat,
+                "sub_category": sub_cat,
+                "reason": f"Failed to read JSON: {str(e)}"
+            })
+            continue
 
-            if not os.path.exists(json_path):
+        for filename, prem_value in files:
+            index = extract_index(filename)
+            image_key = f"Image{index}"
+            if image_key not in json_data:
                 failed_updates.append({
                     "category": main_cat,
                     "sub_category": sub_cat,
-                    "reason": "JSON file not found"
+                    "filename": filename,
+                    "reason": f"{image_key} not found in JSON"
                 })
                 continue
 
-            try:
-                with open(json_path, 'r', encoding='utf-8') as jf:
-                    json_data = json.load(jf)
-            except Exception as e:
-                failed_updates.append({
-                    "category": main_cat,
-                    "sub_category": sub_cat,
-                    "reason": f"Failed to read JSON: {str(e)}"
-                })
-                continue
+            # Update Prem flag (accept true/false string or boolean)
+            if isinstance(prem_value, str):
+                json_data[image_key]["Prem"] = prem_value.lower() == "true"
+            else:
+                json_data[image_key]["Prem"] = bool(prem_value)
 
-            for filename, prem_value in files:
-                index = extract_index(filename)
-                image_key = f"Image{index}"
-                if image_key not in json_data:
-                    failed_updates.append({
-                        "category": main_cat,
-                        "sub_category": sub_cat,
-                        "filename": filename,
-                        "reason": f"{image_key} not found in JSON"
-                    })
-                    continue
+            success_updates.append({
+                "category": main_cat,
+                "sub_category": sub_cat,
+                "filename": filename
+            })
+            changes.append(change_entry("prem_changed", main_cat, sub_cat, filename=filename, prem=json_data[image_key]["Prem"]))
 
-                # Update Prem flag (accept true/false string or boolean)
-                if isinstance(prem_value, str):
-                    json_data[image_key]["Prem"] = prem_value.lower() == "true"
-                else:
-                    json_data[image_key]["Prem"] = bool(prem_value)
+        journal_write_json(journal, json_path, json_data)
 
-                success_updates.append({
-                    "category": main_cat,
-                    "sub_category": sub_cat,
-                    "filename": filename
-                })
+    return changes, success_updates, failed_updates
+
+
+@app.route('/update-prem-flag', methods=['POST'])
+def update_prem_flag():
+    journal = None
+    try:
+        print("update-prem-flag called")
+        updates = request.get_json()
+        print("Received data:", updates)
+        if not isinstance(updates, list) or not updates:
+            return jsonify({"error": "Invalid or empty update list."}), 400
 
-            # Ensure directory exists before saving
-            os.makedirs(os.path.dirname(new_json_path), exist_ok=True)
+        # Lock every category named in the list, then backup them (hardlink snapshot, Json_Files -> Json_Files_Last)
+        scopes = ibgc_prem_scopes(updates)
+        journal = journal_begin(scopes)
+        snapshot_current_to_backup(scopes)
 
-            with open(new_json_path, 'w', encoding='utf-8') as jf:
-                json.dump(json_data, jf, indent=4)
+        try:
+            changes, success_updates, failed_updates = ibgc_set_prem(journal, updates)
+        except ValueError as e:
+            journal_rollback(journal)
+            journal = None
+            return jsonify({"error": str(e)}), 400
 
-        version_info = increment_version()
+        version_info = increment_version(journal, changes)
+        journal_commit(journal)
 
         return jsonify({
             "success": True,
@@ -1676,17 +3453,8 @@ def update_prem_flag():
     except Exception as e:
         # Rollback in case of global failure
         try:
-            if os.path.exists(CURRENT_DIR):
-                shutil.rmtree(CURRENT_DIR)
-            if os.path.exists(BACKUP_DIR):
-                shutil.copytree(BACKUP_DIR, CURRENT_DIR)
-
-            backup_json_last = os.path.join(CURRENT_DIR, "Json_Files_Last")
-            if os.path.exists(backup_json_last):
-                restored_path = os.path.join(CURRENT_DIR, "Json_Files")
-                if os.path.exists(restored_path):
-                    shutil.rmtree(restored_path)
-                os.rename(backup_json_last, restored_path)
+            if journal:
+                journal_rollback(journal)
 
         except Exception as rollback_error:
             return jsonify({
@@ -1702,8 +3470,54 @@ def update_prem_flag():
 
 
  # =======  * Rearrange Images * =======  
+def ibgc_swap(journal, category_name, sub_category, image1_name, image2_name):
+    category_path, json_file = ibgc_paths(category_name, sub_category, journal["root"])
+
+    # === Step 1: Ensure image files exist
+    img1_path = resolve_image(category_path, image1_name)
+    img2_path = resolve_image(category_path, image2_name)
+    if not (img1_path and img2_path and os.path.exists(img1_path) and os.path.exists(img2_path)):
+        raise FileNotFoundError("One or both image files not found.")
+
+    # === Step 2: Swap the two positions in the order manifest (files stay put)
+    order = load_order(category_path, IMAGE_EXTENSIONS)
+    position1, position2 = order.index(os.path.basename(img1_path)), order.index(os.path.basename(img2_path))
+    order[position1], order[position2] = order[position2], order[position1]
+    save_order(category_path, order, journal)
+
+    # === Step 3: Load and modify JSON
+    if not os.path.exists(json_file):
+        raise FileNotFoundError(f"JSON file not found for category '{category_name}'.")
+
+    with open(json_file, 'r') as jf:
+        json_data = json.load(jf)
+
+    index1 = extract_index(image1_name)
+    index2 = extract_index(image2_name)
+
+    item1_key = f"Image{index1}"
+    item2_key = f"Image{index2}"
+
+    if item1_key not in json_data or item2_key not in json_data:
+        raise Exception("One or both images not found in JSON data.")
+
+    # === Step 4: Swap entries in JSON
+    json_data[item1_key], json_data[item2_key] = (
+        json_data[item2_key],
+        json_data[item1_key],
+    )
+    json_data[item1_key]["Name"] = str(index1)
+    json_data[item2_key]["Name"] = str(index2)
+
+    # === Step 5: Save updated JSON
+    journal_write_json(journal, json_file, json_data)
+
+    return [change_entry("reordered", category_name, sub_category, order={image1_name: image2_name, image2_name: image1_name})]
+
+
 @app.route('/swap-images_IBGC', methods=['POST'])
 def swap_images_IBGC():
+    journal = None
     try:
         category_name = request.form.get('category_name')  # main category
         sub_category = request.form.get('sub_category')    # optional
@@ -1713,107 +3527,384 @@ def swap_images_IBGC():
         if not all([category_name, image1_name, image2_name]):
             return jsonify({"error": "Missing parameters"}), 400
 
-        # === Step 1: Backup CURRENT_DIR -> BACKUP_DIR
-        if os.path.exists(BACKUP_DIR):
-            shutil.rmtree(BACKUP_DIR)
-        shutil.copytree(CURRENT_DIR, BACKUP_DIR)
+        # === Step 1: Lock the category, backup it -> BACKUP_DIR (hardlink snapshot)
+        scopes = [(category_name, sub_category)]
+        journal = journal_begin(scopes)
+        snapshot_current_to_backup(scopes)
 
-        # === Step 2: Rename Json_Files -> Json_Files_Last inside backup
-        backup_json_path = os.path.join(BACKUP_DIR, "Json_Files")
-        backup_json_last_path = os.path.join(BACKUP_DIR, "Json_Files_Last")
-        if os.path.exists(backup_json_path):
-            if os.path.exists(backup_json_last_path):
-                shutil.rmtree(backup_json_last_path)
-            os.rename(backup_json_path, backup_json_last_path)
+        # === Step 2: Swap through the mutation journal
+        changes = ibgc_swap(journal, category_name, sub_category, image1_name, image2_name)
 
-        # === Step 3: Recreate empty Json_Files
-        os.makedirs(CURRENT_JSON_DIR, exist_ok=True)
+        # === Step 3: Update version
+        version_info = increment_version(journal, changes)
+        journal_commit(journal)
 
-        # === Step 4: Resolve folder and JSON paths
-        if sub_category:
-            # Subcategory case
-            category_path = os.path.join(CURRENT_DIR, category_name, sub_category)
-            backup_json_file = os.path.join(backup_json_last_path, category_name, f"{sub_category}.json")
-            new_json_path = os.path.join(CURRENT_JSON_DIR, category_name)
-            os.makedirs(new_json_path, exist_ok=True)
-            new_json_file = os.path.join(new_json_path, f"{sub_category}.json")
-        else:
-            # Main category case
-            category_path = os.path.join(CURRENT_DIR, category_name)
-            backup_json_file = os.path.join(backup_json_last_path, f"{category_name}.json")
-            new_json_file = os.path.join(CURRENT_JSON_DIR, f"{category_name}.json")
-
-        # === Step 5: Ensure image files exist
-        img1_path = os.path.join(category_path, image1_name)
-        img2_path = os.path.join(category_path, image2_name)
-        if not os.path.exists(img1_path) or not os.path.exists(img2_path):
-            raise FileNotFoundError("One or both image files not found.")
-
-        # === Step 6: Swap image files
-        temp_path = os.path.join(category_path, "__temp_swap__.webp")
-        os.rename(img1_path, temp_path)
-        os.rename(img2_path, img1_path)
-        os.rename(temp_path, img2_path)
-
-        # === Step 7: Load and modify JSON
-        if not os.path.exists(backup_json_file):
-            raise Exception(f"JSON file not found for category '{category_name}'.")
-
-        with open(backup_json_file, 'r') as jf:
-            json_data = json.load(jf)
+        return jsonify({
+            "success": True,
+            "message": f"Swapped '{image1_name}' and '{image2_name}' successfully.",
+            "version": version_info
+        })
+
+    except Exception as e:
+        try:
+            # === Rollback (replay the journal backwards)
+            if journal:
+                journal_rollback(journal)
+
+        except Exception as rollback_error:
+            return jsonify({
+                "error": "Rollback failed.",
+                "details": str(rollback_error)
+            }), 500
+
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500
+
+
+# =======  * Reorder a whole category * =======
+# Form: category_name, sub_category (optional), order (repeated: the current
+# image names in their new order). The permutation is applied to the order
+# manifest and the category JSON, under one snapshot and one version bump.
+def ibgc_reorder(journal, category_name, sub_category, requested):
+    category_path, json_file = ibgc_paths(category_name, sub_category, journal["root"])
+    if not os.path.isdir(category_path):
+        raise FileNotFoundError(f"Category path '{published_path(journal, category_path)}' not found.")
+    if not os.path.exists(json_file):
+        raise FileNotFoundError(f"JSON file not found for category '{category_name}'.")
+
+    old_order = load_order(category_path, IMAGE_EXTENSIONS)
+    order, moves = permute_order(old_order, requested)
+    if not moves:
+        return []
+
+    with open(json_file, 'r') as jf:
+        json_data = json.load(jf)
+
+    save_order(category_path, order, journal)
+    journal_write_json(journal, json_file, permute_json(json_data, moves))
 
-        def extract_index(filename):
-            match = re.search(r'(\d+)', filename)
-            return int(match.group(1)) if match else -1
+    reorder = {}
+    for old, new in moves.items():
+        ext = os.path.splitext(old_order[old])[1]
+        reorder[f"{old}{ext}"] = f"{new}{ext}"
+    return [change_entry("reordered", category_name, sub_category, order=reorder)]
 
-        index1 = extract_index(image1_name)
-        index2 = extract_index(image2_name)
 
-        item1_key = f"Image{index1}"
-        item2_key = f"Image{index2}"
+@app.route('/reorder_IBGC', methods=['POST'])
+def reorder_IBGC():
+    journal = None
+    try:
+        category_name = request.form.get('category_name')  # main category
+        sub_category = request.form.get('sub_category')    # optional
+        requested = request.form.getlist('order')
+
+        if not category_name or not requested:
+            return jsonify({"error": "Missing category_name or order"}), 400
+
+        # === One lock, one backup and one journal for the whole permutation
+        scopes = [(category_name, sub_category)]
+        journal = journal_begin(scopes)
+        snapshot_current_to_backup(scopes)
+
+        try:
+            changes = ibgc_reorder(journal, category_name, sub_category, requested)
+        except (FileNotFoundError, ValueError) as e:
+            journal_rollback(journal)
+            journal = None
+            return jsonify({"error": str(e)}), 404 if isinstance(e, FileNotFoundError) else 400
+
+        if not changes:
+            journal_commit(journal)
+            return jsonify({"success": True, "message": "Order unchanged.", "version": get_current_version()})
+
+        version_info = increment_version(journal, changes)
+        journal_commit(journal)
+
+        return jsonify({
+            "success": True,
+            "message": f"{len(changes[0]['order'])} image(s) moved in '{category_name}'" + (f"/{sub_category}" if sub_category else "") + ".",
+            "version": version_info
+        })
+
+    except Exception as e:
+        try:
+            # === Rollback (replay the journal backwards)
+            if journal:
+                journal_rollback(journal)
+
+        except Exception as rollback_error:
+            return jsonify({
+                "error": "Rollback failed.",
+                "details": str(rollback_error)
+            }), 500
+
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500
 
-        if item1_key not in json_data or item2_key not in json_data:
-            raise Exception("One or both images not found in JSON data.")
 
-        # === Step 8: Swap entries in JSON
-        json_data[item1_key], json_data[item2_key] = (
-            json_data[item2_key],
-            json_data[item1_key],
+# =======  * Transactions (several operations, one version) * =======
+# POST /transaction_IBGC applies an ordered list of operations all-or-nothing
+# under one snapshot, one journal and one new version. Send JSON
+# {"operations": [...]}, or multipart with the list as JSON in an
+# `operations` form field when images are uploaded; uploads are referenced
+# by their form field name:
+#   [{"op": "add_images", "category_name": "Autumn", "images": ["img0", "img1"], "prem": ["true", "false"]},
+#    {"op": "set_prem", "updates": [{"main_category": "Autumn", "filename": "3.webp", "prem": true}]},
+#    {"op": "delete_image", "main_category": "Autumn", "filename": "7.webp"},
+#    {"op": "rename", "old_main_name": "Frame Categories", "old_sub_name": "love", "new_sub_name": "Love"}]
+# Parameters are named like the form fields of the single-operation routes.
+MAX_TRANSACTION_OPERATIONS = 200
+IBGC_TRANSACTION_OPS = (
+    "add_category", "delete_category", "add_images", "rename", "replace_image",
+    "delete_image", "set_prem", "swap", "reorder"
+)
+
+
+def _require(operation, *fields):
+    missing = [field for field in fields if not operation.get(field)]
+    if missing:
+        raise ValueError(f"Missing {', '.join(missing)}")
+
+
+def _transaction_uploads(operation):
+    # (form field names, transcode to WebP?) of the uploads an operation uses
+    op = operation.get("op")
+    if op in ("add_category", "add_images"):
+        return list(operation.get("images") or []), True
+    if op == "replace_image" and operation.get("new_image"):
+        return [operation["new_image"]], str(operation.get("old_filename", "")).lower().endswith('.webp')
+    return [], False
+
+
+def ibgc_operation_scopes(operation):
+    # The (main_category, sub_category) scopes an operation writes, for journal_begin()
+    op = operation["op"]
+    if op == "add_category":
+        return [(operation.get("category_name"), operation.get("sub_category_name"))]
+    if op == "rename":
+        old_main_name = (operation.get("old_main_name") or "").strip()
+        old_sub_name = (operation.get("old_sub_name") or "").strip() or None
+        return ibgc_rename_scopes(
+            old_main_name,
+            (operation.get("new_main_name") or "").strip() or old_main_name,
+            old_sub_name,
+            (operation.get("new_sub_name") or "").strip() or old_sub_name
         )
-        json_data[item1_key]["Name"] = str(index1)
-        json_data[item2_key]["Name"] = str(index2)
+    if op == "set_prem":
+        updates = operation.get("updates")
+        return ibgc_prem_scopes(updates) if isinstance(updates, list) else []
+    if op in ("replace_image", "delete_image"):
+        return [(operation.get("main_category"), operation.get("sub_category"))]
+    return [(operation.get("category_name"), operation.get("sub_category"))]
+
+
+def apply_ibgc_operation(journal, operation, uploads):
+    # uploads: form field name -> (FileStorage, WebP bytes or None to keep it as-is)
+    op = operation["op"]
+    main_category = operation.get("main_category")
+    sub_category = operation.get("sub_category") or None
+
+    if op in ("add_category", "add_images"):
+        _require(operation, "category_name", "images")
+        fields = operation["images"]
+        images = [uploads[field][0] for field in fields]
+        webp_images = [uploads[field][1] for field in fields]
+        prem_list = operation.get("prem") or []
+        if op == "add_category":
+            return ibgc_add_category(
+                journal, operation["category_name"], operation.get("sub_category_name"), images, webp_images, prem_list
+            )
+        return ibgc_add_images(journal, operation["category_name"], sub_category, images, webp_images, prem_list)
+
+    if op == "delete_category":
+        _require(operation, "category_name")
+        return ibgc_delete_category(journal, operation["category_name"], sub_category)
+
+    if op == "rename":
+        _require(operation, "old_main_name")
+        old_main_name = operation["old_main_name"].strip()
+        old_sub_name = (operation.get("old_sub_name") or "").strip() or None
+        return ibgc_rename(
+            journal,
+            old_main_name,
+            (operation.get("new_main_name") or "").strip() or old_main_name,
+            old_sub_name,
+            (operation.get("new_sub_name") or "").strip() or old_sub_name
+        )
+
+    if op == "replace_image":
+        _require(operation, "main_category", "old_filename", "new_image")
+        new_image, new_image_data = uploads[operation["new_image"]]
+        prem_flag = str(operation.get("prem", "false")).lower() == 'true'
+        return ibgc_replace_image(
+            journal, main_category, sub_category, operation["old_filename"], new_image, new_image_data, prem_flag
+        )
+
+    if op == "delete_image":
+        _require(operation, "main_category", "filename")
+        return ibgc_delete_image(journal, main_category, sub_category, operation["filename"])
+
+    if op == "set_prem":
+        updates = operation.get("updates")
+        if not isinstance(updates, list) or not updates:
+            raise ValueError("Invalid or empty update list.")
+        changes, updated, failed = ibgc_set_prem(journal, updates)
+        if failed:
+            raise ValueError(f"Prem update failed: {failed}")
+        return changes
+
+    if op == "swap":
+        _require(operation, "category_name", "image1_name", "image2_name")
+        return ibgc_swap(journal, operation["category_name"], sub_category, operation["image1_name"], operation["image2_name"])
+
+    _require(operation, "category_name", "order")  # reorder
+    return ibgc_reorder(journal, operation["category_name"], sub_category, operation["order"])
 
-        # === Step 9: Save updated JSON
-        with open(new_json_file, 'w') as jf:
-            json.dump(json_data, jf, indent=4)
 
-        # === Step 10: Update version
-        version_info = increment_version()
+@app.route('/transaction_IBGC', methods=['POST'])
+def transaction_IBGC():
+    journal = None
+    position = None
+    try:
+        if request.is_json:
+            operations = (request.get_json(silent=True) or {}).get("operations")
+        else:
+            try:
+                operations = json.loads(request.form.get("operations", "null"))
+            except ValueError:
+                return jsonify({"success": False, "error": "operations must be a JSON list"}), 400
+
+        if not isinstance(operations, list) or not operations:
+            return jsonify({"success": False, "error": "Missing operations list"}), 400
+        if len(operations) > MAX_TRANSACTION_OPERATIONS:
+            return jsonify({"success": False, "error": f"At most {MAX_TRANSACTION_OPERATIONS} operations per transaction"}), 400
+        for index, operation in enumerate(operations):
+            if not isinstance(operation, dict) or operation.get("op") not in IBGC_TRANSACTION_OPS:
+                return jsonify({
+                    "success": False,
+                    "error": f"Operation {index}: op must be one of {', '.join(IBGC_TRANSACTION_OPS)}",
+                    "failed_operation": index
+                }), 400
+
+        # === Step 1: Resolve and transcode every upload before anything is touched ===
+        wanted = {}
+        for index, operation in enumerate(operations):
+            fields, transcode = _transaction_uploads(operation)
+            for field in fields:
+                if field not in request.files:
+                    return jsonify({
+                        "success": False,
+                        "error": f"Operation {index}: upload '{field}' not found",
+                        "failed_operation": index
+                    }), 400
+                wanted[field] = wanted.get(field, False) or transcode
+
+        uploads = {field: (request.files[field], None) for field in wanted}
+        to_transcode = [field for field, transcode in wanted.items() if transcode]
+        if to_transcode:
+            try:
+                encoded = transcode_uploads([request.files[field] for field in to_transcode])
+            except ValueError as e:
+                return jsonify({"success": False, "error": str(e)}), 400
+            uploads.update({field: (request.files[field], data) for field, data in zip(to_transcode, encoded)})
+
+        # === Step 2: One set of locks, one backup and one journal for the whole transaction ===
+        scopes = [scope for operation in operations for scope in ibgc_operation_scopes(operation)]
+        journal = journal_begin(scopes)
+        snapshot_current_to_backup(scopes)
+
+        # === Step 3: Apply the operations in order ===
+        results = []
+        changes = []
+        for position, operation in enumerate(operations):
+            op_changes = apply_ibgc_operation(journal, operation, uploads)
+            results.append({"op": operation["op"], "changes": op_changes})
+            changes += op_changes
+        position = None
+
+        # === Step 4: Publish exactly one version ===
+        version_info = increment_version(journal, changes)
+        journal_commit(journal)
 
         return jsonify({
             "success": True,
-            "message": f"Swapped '{image1_name}' and '{image2_name}' successfully.",
+            "results": results,
+            "version": version_info
+        })
+
+    except Exception as e:
+        # === Rollback every operation (replay the journal backwards) ===
+        rollback_error = None
+        try:
+            if journal:
+                journal_rollback(journal)
+
+        except Exception as rollback_exc:
+            rollback_error = str(rollback_exc)
+
+        error_response = {
+            "success": False,
+            "error": str(e)
+        }
+        if position is not None:
+            error_response["failed_operation"] = position
+        if rollback_error:
+            error_response["rollback_error"] = rollback_error
+
+        if isinstance(e, FileNotFoundError):
+            return jsonify(error_response), 404
+        if isinstance(e, ValueError):
+            return jsonify(error_response), 400
+        return jsonify(error_response), 500
+
+
+# =======  * Rollback to a retained version (IBGC_STAGED_PUBLISH) * =======
+# Points Assets_IBGC back at ibgc_versions/<version> and publishes that tree
+# as a new version; nothing is copied. Clients resync in full.
+@app.route('/rollback_IBGC', methods=['POST'])
+def rollback_IBGC():
+    journal = None
+    try:
+        if not STAGED_PUBLISH_ENABLED:
+            return jsonify({"success": False, "error": "Rollback needs IBGC_STAGED_PUBLISH=true"}), 400
+
+        version = request.form.get('version', type=int)
+        if version is None:
+            return jsonify({"success": False, "error": "Missing version"}), 400
+        target = _version_dir(version)
+        if not os.path.isdir(target):
+            return jsonify({"success": False, "error": f"Version {version} is not retained"}), 404
+
+        # Wait for writers of every main category in either tree
+        names = set()
+        for root in (CURRENT_DIR, target):
+            names.update(name for name in os.listdir(root) if name != "Json_Files")
+            if os.path.isdir(os.path.join(root, "Json_Files")):
+                names.update(os.path.splitext(name)[0] for name in os.listdir(os.path.join(root, "Json_Files")))
+        journal = journal_begin([(name, None) for name in names], staged=False)
+
+        journal_publish_link(journal, target)
+        version_info = increment_version(journal, None)
+        journal_commit(journal)
+
+        return jsonify({
+            "success": True,
+            "published": version,
             "version": version_info
         })
 
     except Exception as e:
         try:
-            # === Rollback
-            if os.path.exists(CURRENT_DIR):
-                shutil.rmtree(CURRENT_DIR)
-            if os.path.exists(BACKUP_DIR):
-                shutil.copytree(BACKUP_DIR, CURRENT_DIR)
-
-            # Restore Json_Files_Last
-            backup_json_last = os.path.join(CURRENT_DIR, "Json_Files_Last")
-            if os.path.exists(backup_json_last):
-                restored_path = os.path.join(CURRENT_DIR, "Json_Files")
-                if os.path.exists(restored_path):
-                    shutil.rmtree(restored_path)
-                os.rename(backup_json_last, restored_path)
+            if journal:
+                journal_rollback(journal)
 
         except Exception as rollback_error:
             return jsonify({
+                "success": False,
                 "error": "Rollback failed.",
                 "details": str(rollback_error)
             }), 500
@@ -1834,24 +3925,15 @@ def category_summary_IBGC():
         if not os.path.exists(CURRENT_DIR):
             return jsonify({"error": "Assets_IBGC directory not found."}), 404
 
-        for folder in sorted(os.listdir(CURRENT_DIR)):
-            folder_path = os.path.join(CURRENT_DIR, folder)
-
-            # Skip the JSON directory and the "Frame Categories" folder
-            if (not os.path.isdir(folder_path) or
-                folder == "Json_Files" or
-                folder == "Frame Categories"):
+        mains = get_catalog_index()["mains"]
+        for folder in sorted(mains):
+            # Skip the "Frame Categories" folder (Json_Files is never indexed)
+            if folder == "Frame Categories":
                 continue
 
-            # Count image files (adjust allowed extensions if needed)
-            image_count = len([
-                file for file in os.listdir(folder_path)
-                if file.lower().endswith(('.png', '.jpg', '.jpeg', '.webp'))
-            ])
-
             response[str(count)] = {
                 "category_name": folder,
-                "total_assets": image_count
+                "total_assets": mains[folder]["direct_images"]
             }
             count += 1
 
@@ -1866,6 +3948,38 @@ def category_summary_IBGC():
 
 
 # ================================  Get Url of Image of any Category ===============================
+def template_info(data, category_path, template_number, root, names):
+    # ImageUrl/Name/Prem for one template of a category's JSON (from the catalog
+    # index of the tree at `root`), or None if it is not listed. `names` is the
+    # category folder's order_map(), read once per category by the caller
+    image_data = data.get(f"Image{template_number}")
+    if image_data is None:
+        return None
+
+    base_url = request.host_url.rstrip('/')
+    image_url = f"{base_url}/static/Assets_IBGC/{category_path}/{template_number}.webp"
+    image_path = resolve_image(os.path.join(root, category_path), f"{template_number}.webp", names)
+    meta = None
+    if image_path and os.path.exists(image_path):
+        image_url = fingerprinted_url(image_url, image_path)
+        meta = get_image_meta(image_path)
+
+    info = {
+        "ImageUrl": image_url,
+        "Name": image_data.get("Name"),
+        "Prem": image_data.get("Prem")
+    }
+    if meta:
+        info.update({
+            "Width": meta["width"],
+            "Height": meta["height"],
+            "Bytes": meta["bytes"],
+            "Format": meta["format"],
+            "Hash": meta["hash"]
+        })
+    return info
+
+
 @app.route('/get-template-info_IBGC', methods=['GET'])
 def get_template_info_IBGC():
     try:
@@ -1875,29 +3989,18 @@ def get_template_info_IBGC():
         if not category_name or template_number is None:
             return jsonify({"error": "Missing category_name or template_number"}), 400
 
-        image_filename = f"{template_number}.webp"
-        json_file_path = os.path.join(CURRENT_JSON_DIR, f"{category_name}.json")
+        index = get_catalog_index()
+        data = index["json"].get((category_name, None))
 
-        if not os.path.exists(json_file_path):
+        if data is None:
             return jsonify({"error": "JSON for category not found."}), 404
 
-        with open(json_file_path, 'r') as jf:
-            data = json.load(jf)
-
-        image_key = f"Image{template_number}"
-        if image_key not in data:
+        names = order_map(os.path.join(index["root"], category_name))
+        info = template_info(data, category_name, template_number, index["root"], names)
+        if info is None:
             return jsonify({"error": f"Template number {template_number} not found in JSON."}), 404
 
-        image_data = data[image_key]
-
-        base_url = request.host_url.rstrip('/') 
-        image_url = f"{base_url}/static/Assets_IBGC/{category_name}/{image_filename}"
-
-        return jsonify({
-            "ImageUrl": image_url,
-            "Name": image_data.get("Name"),
-            "Prem": image_data.get("Prem")
-        })
+        return jsonify(info)
 
     except Exception as e:
         return jsonify({
@@ -1912,24 +4015,17 @@ def frame_categories_summary_IBGC():
         response = {}
         count = 0
 
-        frame_categories_dir = os.path.join(CURRENT_DIR, "Frame Categories")
-        if not os.path.exists(frame_categories_dir):
+        frame_categories = get_catalog_index()["mains"].get("Frame Categories")
+        if not frame_categories:
             return jsonify({"error": "'Frame Categories' directory not found."}), 404
 
-        for folder in sorted(os.listdir(frame_categories_dir)):
-            folder_path = os.path.join(frame_categories_dir, folder)
-
-            if not os.path.isdir(folder_path):
+        for category in frame_categories["categories"]:
+            if category["sub_category"] is None:
                 continue
 
-            image_count = len([
-                file for file in os.listdir(folder_path)
-                if file.lower().endswith(('.png', '.jpg', '.jpeg', '.webp'))
-            ])
-
             response[str(count)] = {
-                "category_name": folder,
-                "total_assets": image_count
+                "category_name": category["sub_category"],
+                "total_assets": len(category["images"])
             }
             count += 1
 
@@ -1954,33 +4050,92 @@ def get_template_info_frame_IBGC():
         if not category_name or template_number is None:
             return jsonify({"error": "Missing category_name or template_number"}), 400
 
-        image_filename = f"{template_number}.webp"
-        json_file_path = os.path.join(CURRENT_JSON_DIR, "Frame Categories", f"{category_name}.json")
+        index = get_catalog_index()
+        data = index["json"].get(("Frame Categories", category_name))
 
-        if not os.path.exists(json_file_path):
+        if data is None:
             return jsonify({"error": "JSON for category not found in 'Frame Categories'."}), 404
 
-        with open(json_file_path, 'r') as jf:
-            data = json.load(jf)
-
-        image_key = f"Image{template_number}"
-        if image_key not in data:
+        category_path = f"Frame Categories/{category_name}"
+        names = order_map(os.path.join(index["root"], category_path))
+        info = template_info(data, category_path, template_number, index["root"], names)
+        if info is None:
             return jsonify({"error": f"Template number {template_number} not found in JSON."}), 404
 
-        image_data = data[image_key]
-
-        base_url = request.host_url.rstrip('/')
-        image_url = f"{base_url}/static/Assets_IBGC/Frame Categories/{category_name}/{image_filename}"
+        return jsonify(info)
 
+    except Exception as e:
         return jsonify({
-            "ImageUrl": image_url,
-            "Name": image_data.get("Name"),
-            "Prem": image_data.get("Prem")
-        })
+            "error": "Something went wrong while fetching frame category template info.",
+            "details": str(e)
+        }), 500
+
+
+# ---- Batch template lookup (regular and Frame Categories) ----
+# Body: {"templates": [{"category_name": "Autumn", "template_number": 3},
+#                      {"category_name": "love", "template_number": 2, "frame": true}, ...]}
+# Results come back in request order; lookups are grouped so each category's
+# metadata is resolved once per request.
+MAX_BATCH_TEMPLATES = 500
+
+
+@app.route('/get-template-info-batch_IBGC', methods=['POST'])
+def get_template_info_batch_IBGC():
+    try:
+        body = request.get_json(silent=True) or {}
+        templates = body.get("templates")
+
+        if not isinstance(templates, list) or not templates:
+            return jsonify({"error": "Missing templates list"}), 400
+        if len(templates) > MAX_BATCH_TEMPLATES:
+            return jsonify({"error": f"At most {MAX_BATCH_TEMPLATES} templates per request"}), 400
+
+        groups = {}
+        for position, item in enumerate(templates):
+            if not isinstance(item, dict):
+                return jsonify({"error": f"Template entry {position} must be an object"}), 400
+            category_name = item.get("category_name")
+            template_number = item.get("template_number")
+            if not category_name or template_number is None:
+                return jsonify({"error": f"Missing category_name or template_number in entry {position}"}), 400
+            frame = item.get("frame", False)
+            if isinstance(frame, str) and frame.lower() in ("true", "false"):
+                frame = frame.lower() == "true"
+            if not isinstance(frame, bool):
+                return jsonify({"error": f"frame must be true or false in entry {position}"}), 400
+            groups.setdefault((category_name, frame), []).append((position, template_number))
+
+        index = get_catalog_index()
+        json_by_category = index["json"]
+        results = [None] * len(templates)
+
+        for (category_name, frame), entries in groups.items():
+            if frame:
+                data = json_by_category.get(("Frame Categories", category_name))
+                category_path = f"Frame Categories/{category_name}"
+                missing = "JSON for category not found in 'Frame Categories'."
+            else:
+                data = json_by_category.get((category_name, None))
+                category_path = category_name
+                missing = "JSON for category not found."
+
+            names = order_map(os.path.join(index["root"], category_path)) if data is not None else None
+            for position, template_number in entries:
+                result = {"category_name": category_name, "template_number": template_number, "frame": frame}
+                info = template_info(data, category_path, template_number, index["root"], names) if data is not None else None
+                if info is not None:
+                    result.update(info)
+                elif data is None:
+                    result["error"] = missing
+                else:
+                    result["error"] = f"Template number {template_number} not found in JSON."
+                results[position] = result
+
+        return jsonify({"results": results})
 
     except Exception as e:
         return jsonify({
-            "error": "Something went wrong while fetching frame category template info.",
+            "error": "Something went wrong while fetching template info.",
             "details": str(e)
         }), 500
 
@@ -1989,8 +4144,472 @@ def get_template_info_frame_IBGC():
 @app.route("/check-version_IBGC", methods=["GET"])
 def check_version_IBGC():
     data = get_current_version()
-    return jsonify(data)
+    return conditional_response(
+        f"ibgc-version-v{data.get('current_version', 0)}",
+        version_last_modified(data),
+        lambda: jsonify(data)
+    )
+
+
+# ============================ DELTA SYNC ===============================
+# Folds the change log entries after `since` into the smallest set of
+# per-category instructions. Clients apply `renamed` first, then per category:
+# `moved` as one simultaneous permutation of local files, drop `removed`,
+# fetch `download` and apply `prem`. Files not mentioned are unchanged.
+def _new_category_state():
+    return {"slots": {}, "vacated": set(), "existed": set(), "removed": False}
+
+
+def _slot_origin(state, filename):
+    if filename in state["slots"]:
+        return state["slots"][filename]
+    if filename in state["vacated"] or state["removed"]:
+        return None
+    state["existed"].add(filename)  # Untouched so far: the client still has it as-is
+    return {"from": filename}
+
+
+def _place_slot(state, filename, value):
+    state["vacated"].discard(filename)
+    state["slots"][filename] = value
+
+
+def _vacate_slot(state, filename):
+    _slot_origin(state, filename)
+    state["slots"].pop(filename, None)
+    state["vacated"].add(filename)
+
+
+def fold_changes(entries):
+    categories = {}
+    renamed = []
+
+    for entry in entries:
+        change_type = entry.get("type")
+        key = (entry.get("main_category"), entry.get("sub_category"))
+
+        if change_type == "renamed":
+            new_key = (entry.get("new_main_category"), entry.get("new_sub_category"))
+            # A main-category rename (sub_category None) carries its subcategories along
+            for k in list(categories):
+                if k == key or (key[1] is None and k[0] == key[0]):
+                    moved_key = (new_key[0], k[1] if key[1] is None else new_key[1])
+                    categories[moved_key] = categories.pop(k)
+
+            composed = False
+            for r in renamed:
+                if r["to"] == key:
+                    r["to"] = new_key
+                    composed = True
+                elif key[1] is None and r["to"][0] == key[0]:
+                    r["to"] = (new_key[0], r["to"][1])
+            if not composed:
+                renamed.append({"from": key, "to": new_key})
+            continue
+
+        state = categories.setdefault(key, _new_category_state())
+        filename = entry.get("filename")
+
+        if change_type == "removed" and filename is None:
+            state.update(_new_category_state())
+            state["removed"] = True
+        elif change_type in ("added", "replaced"):
+            value = {"from": None}
+            if "prem" in entry:
+                value["prem"] = entry["prem"]
+            _place_slot(state, filename, value)
+        elif change_type == "removed":
+            _vacate_slot(state, filename)
+        elif change_type == "reordered":
+            moves = entry.get("order", {})
+            carried = {src: _slot_origin(state, src) for src in moves}
+            for src in moves:
+                _vacate_slot(state, src)
+            for src, dst in moves.items():
+                if carried[src] is not None:
+                    _place_slot(state, dst, carried[src])
+        elif change_type == "prem_changed":
+            value = dict(_slot_origin(state, filename) or {"from": None})
+            value["prem"] = entry.get("prem")
+            _place_slot(state, filename, value)
+
+    result = []
+    for (main_cat, sub_cat), state in sorted(categories.items(), key=lambda kv: (str(kv[0][0]), str(kv[0][1]))):
+        slots = state["slots"]
+        kept = {v["from"] for v in slots.values() if v.get("from")}
+        diff = {
+            "main_category": main_cat,
+            "sub_category": sub_cat,
+            "removed": sorted(state["existed"] - kept - set(slots), key=extract_index),
+            "moved": {v["from"]: f for f, v in slots.items() if v.get("from") and v["from"] != f},
+            "download": sorted((f for f, v in slots.items() if v.get("from") is None), key=extract_index),
+            "prem": {f: v["prem"] for f, v in slots.items() if "prem" in v}
+        }
+        if state["removed"]:
+            # Client drops its local copy of the category first
+            diff["category_removed"] = not slots
+            diff["reset"] = bool(slots)
+        result.append(diff)
+
+    renames = [
+        {
+            "from": {"main_category": r["from"][0], "sub_category": r["from"][1]},
+            "to": {"main_category": r["to"][0], "sub_category": r["to"][1]}
+        }
+        for r in renamed if r["from"] != r["to"]
+    ]
+    return renames, result
+
+
+def changes_between(since, to_version):
+    # Change entries of versions since+1..to_version, or None if the log has a gap
+    covered = [v for v in get_change_log()["versions"] if since < v["version"] <= to_version]
+    if ([v["version"] for v in covered] != list(range(since + 1, to_version + 1)) or
+            any(v.get("changes") is None for v in covered)):
+        return None
+    return [entry for v in covered for entry in v["changes"]]
+
+
+@app.route("/changes_IBGC", methods=["GET"])
+def changes_IBGC():
+    try:
+        since = request.args.get('since', type=int)
+        if since is None:
+            return jsonify({"error": "Missing or invalid 'since' version"}), 400
+
+        current_version = get_current_version().get("current_version", 0)
+        response = {
+            "since": since,
+            "current_version": current_version,
+            "full_resync": False,
+            "renamed": [],
+            "categories": []
+        }
+        if since >= current_version:
+            return jsonify(response)
+
+        entries = changes_between(since, current_version)
+        if entries is None:
+            # Too old (or unknown history): the client has to re-fetch /view-category_IBGC
+            response["full_resync"] = True
+            return jsonify(response)
+
+        response["renamed"], response["categories"] = fold_changes(entries)
+        return jsonify(response)
+
+    except Exception as e:
+        return jsonify({
+            "error": "Something went wrong while computing changes.",
+            "details": str(e)
+        }), 500
+
+
+# ============================ ASSET PACK (ZIP) ===============================
+# /pack_IBGC streams a ZIP of one category (?category=[&sub_category=]) or the
+# whole catalog. Entries are STORED (webp is already compressed) and written
+# through zipfile's non-seekable mode, so the archive leaves in chunks and is
+# never held in memory. manifest.json goes last and lists exactly what was
+# packed, together with each category's JSON metadata.
+#
+# With ?from=N[&to=M] the pack is a delta: only the images added or replaced
+# after version N (the `download` lists of fold_changes()), plus a manifest
+# carrying the renames and per-category removed/moved/prem instructions the
+# client applies exactly as for /changes_IBGC. Only the live tree has bytes,
+# so `to` has to be the current version.
+PACK_CHUNK_SIZE = 64 * 1024
+
+
+class _ZipChunkStream(io.RawIOBase):
+    # Write-only sink for zipfile; the generator drains it between entries
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _pack_arcname(category, filename):
+    if category["sub_category"]:
+        return f"{category['main_category']}/{category['sub_category']}/{filename}"
+    return f"{category['main_category']}/{filename}"
+
+
+def generate_pack(manifest, categories, json_by_category, root=CURRENT_DIR):
+    stream = _ZipChunkStream()
+    manifest["categories"] = []
+
+    with zipfile.ZipFile(stream, 'w', compression=zipfile.ZIP_STORED) as zf:
+        for category in categories:
+            folder = os.path.join(root, category["main_category"], category["sub_category"] or "")
+            names = order_map(folder)
+            packed = []
+            for image in category["images"]:
+                physical = image["filename"] if names is None else names.get(image["filename"])
+                if physical is None:
+                    continue  # Position vanished in a newer version while we were streaming (live tree only)
+                path = os.path.join(folder, physical)
+                try:
+                    src = open(path, 'rb')
+                except FileNotFoundError:
+                    continue  # Removed by a newer version while we were streaming (live tree only)
+                with src:
+                    info = zipfile.ZipInfo.from_file(path, _pack_arcname(category, image["filename"]))
+                    info.compress_type = zipfile.ZIP_STORED
+                    with zf.open(info, 'w') as dest:
+                        for chunk in iter(lambda: src.read(PACK_CHUNK_SIZE), b''):
+                            dest.write(chunk)
+                            yield stream.drain()
+                packed.append({"filename": image["filename"], "prem": image["prem"]})
+                yield stream.drain()
+
+            manifest["categories"].append({
+                "main_category": category["main_category"],
+                "sub_category": category["sub_category"],
+                "images": packed,
+                "json": json_by_category.get((category["main_category"], category["sub_category"])) or {}
+            })
+
+        manifest_info = zipfile.ZipInfo("manifest.json", date_time=(1980, 1, 1, 0, 0, 0))
+        zf.writestr(manifest_info, json.dumps(manifest, indent=2), compress_type=zipfile.ZIP_STORED)
+
+    yield stream.drain()
+
 
+@app.route("/pack_IBGC", methods=["GET"])
+def pack_IBGC():
+    try:
+        if not os.path.exists(CURRENT_DIR):
+            return jsonify({"error": "Assets_IBGC directory not found."}), 404
+
+        main_filter = request.args.get("category")
+        sub_filter = request.args.get("sub_category")
+
+        def in_scope(main_cat, sub_cat):
+            return not main_filter or (main_cat == main_filter and (not sub_filter or sub_cat == sub_filter))
+
+        index = get_catalog_index()
+        version = index["version"]
+        root = index["root"]  # Streamed from the tree the index was built from
+        categories = [c for c in index["categories"] if in_scope(c["main_category"], c["sub_category"])]
+        manifest = {"version": version}
+
+        if "from" in request.args:
+            from_version = request.args.get("from", type=int)
+            to_version = request.args.get("to", default=version, type=int)
+            if from_version is None or to_version is None:
+                return jsonify({"error": "Missing or invalid 'from'/'to' version"}), 400
+            if to_version != version:
+                return jsonify({
+                    "error": f"Delta packs can only be built up to the current version ({version}).",
+                    "current_version": version
+                }), 409
+
+            entries = changes_between(from_version, to_version) if from_version < to_version else []
+            if entries is None:
+                return jsonify({
+                    "error": f"Version {from_version} is too old for a delta; download the full pack.",
+                    "full_resync": True,
+                    "current_version": version
+                }), 409
+
+            renamed, changes = fold_changes(entries)
+            changes = [d for d in changes if in_scope(d["main_category"], d["sub_category"])]
+            by_key = {(c["main_category"], c["sub_category"]): c for c in categories}
+            categories = []
+            for diff in changes:
+                current = by_key.get((diff["main_category"], diff["sub_category"]))
+                if current and diff["download"]:
+                    wanted = set(diff["download"])
+                    categories.append(dict(current, images=[i for i in current["images"] if i["filename"] in wanted]))
+            manifest.update({"from": from_version, "to": to_version, "renamed": renamed, "changes": changes})
+
+        elif not categories:
+            return jsonify({"error": "Category not found."}), 404
+
+        scope = "-".join(sanitize_name(part) for part in (main_filter, sub_filter) if part) or "all"
+        if "from" in manifest:
+            scope = f"{scope}_v{manifest['from']}-to"
+        filename = f"IBGC_{scope}_v{version}.zip"
+
+        # A retained tree stays on disk until the last byte is sent
+        locks = tree_read_locks(root)
+        if not os.path.isdir(root):
+            release_locks(locks)
+            return jsonify({
+                "error": f"Version {version} was pruned while the pack was being prepared; retry.",
+                "current_version": get_current_version().get("current_version", 0)
+            }), 409
+
+        def build_response():
+            response = Response(generate_pack(manifest, categories, index["json"], root), mimetype="application/zip")
+            response.headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+            response.call_on_close(lambda: release_locks(locks))
+            return response
+
+        # Same version + same scope => same archive, so clients can revalidate with a 304
+        try:
+            response = conditional_response(
+                f"ibgc-pack-v{version}-{query_fingerprint()}",
+                version_last_modified(get_current_version()),
+                build_response
+            )
+        except BaseException:
+            release_locks(locks)
+            raise
+        if response.status_code == 304:
+            release_locks(locks)
+        return response
+
+    except Exception as e:
+        return jsonify({
+            "error": "Something went wrong while building the asset pack.",
+            "details": str(e)
+        }), 500
+
+
+# ============================ ON-DEMAND RENDER ===============================
+# /render/<app>/<category>/<file>?w=&h=&fmt= resizes any catalog image to fit
+# inside w x h (never upscaling) on first request. Results are cached under
+# RENDER_CACHE_DIR keyed by the source's content digest, so a replaced source
+# misses the cache instead of serving a stale size. The cache is capped at
+# RENDER_CACHE_MAX_BYTES with least-recently-used eviction (a hit bumps the
+# file's mtime). A flock on a per-rendition lock file collapses concurrent
+# requests for the same rendition, across threads and gunicorn workers, into
+# a single encode. Lock files are never removed (a waiter must lock the same
+# inode a new request creates), eviction skips renditions whose lock is held,
+# and /render serves a file it opened before any eviction could unlink it.
+RENDER_CACHE_DIR = os.path.join(BASE_DIR, 'render_cache')
+RENDER_CACHE_MAX_BYTES = int(os.environ.get("RENDER_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+RENDER_MAX_DIMENSION = 4096
+RENDER_FORMATS = {"webp": ("WEBP", "image/webp"), "jpeg": ("JPEG", "image/jpeg"), "png": ("PNG", "image/png")}
+RENDER_ROOTS = {"imagine": BASE_PATH, "ibgc": CURRENT_DIR}
+
+
+def _render_image(source_path, width, height, fmt):
+    pil_format = RENDER_FORMATS[fmt][0]
+    with Image.open(source_path) as img:
+        img.load()
+        box = (width or img.width, height or img.height)
+        img.thumbnail(box, Image.LANCZOS)
+        if pil_format == "JPEG" and img.mode != "RGB":
+            img = img.convert("RGB")
+        elif img.mode not in ("RGB", "RGBA", "L", "LA"):
+            img = img.convert("RGBA")
+        buffer = io.BytesIO()
+        img.save(buffer, pil_format, quality=RENDITION_QUALITY)
+        return buffer.getvalue()
+
+
+def render_cache_evict(keep=None):
+    # keep: the rendition about to be served, never evicted by its own write
+    entries = []
+    total = 0
+    for dir_path, dirs, files in os.walk(RENDER_CACHE_DIR):
+        for name in files:
+            if name.endswith('.lock'):
+                continue
+            path = os.path.join(dir_path, name)
+            st = os.stat(path)
+            total += st.st_size
+            if path != keep:
+                entries.append((st.st_mtime, st.st_size, path))
+
+    removed = 0
+    for mtime, size, path in sorted(entries):
+        if total <= RENDER_CACHE_MAX_BYTES:
+            break
+        with open(f"{path}.lock", 'a') as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                continue  # Being encoded or opened for serving right now
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        total -= size
+        removed += 1
+    return removed
+
+
+def get_rendition(source_path, width, height, fmt):
+    # Returns (open cache file, cache key); encodes at most once per key at a
+    # time. An eviction after the open only unlinks the name, never what we serve
+    key = hashlib.sha1(
+        f"{image_digest(source_path)}:{width}:{height}:{fmt}:{RENDITION_QUALITY}".encode()
+    ).hexdigest()
+    cache_path = os.path.join(RENDER_CACHE_DIR, key[:2], f"{key}.{fmt}")
+
+    try:
+        rendition = open(cache_path, 'rb')
+        os.utime(rendition.fileno())  # LRU bump
+        return rendition, key
+    except FileNotFoundError:
+        pass
+
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    with open(f"{cache_path}.lock", 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            rendition = open(cache_path, 'rb')  # Produced while we waited
+        except FileNotFoundError:
+            write_bytes_file(cache_path, _render_image(source_path, width, height, fmt))
+            rendition = open(cache_path, 'rb')
+            render_cache_evict(keep=cache_path)
+    return rendition, key
+
+
+@app.route('/render/<app_name>/<path:image_path>', methods=['GET'])
+def render_image(app_name, image_path):
+    try:
+        root = RENDER_ROOTS.get(app_name)
+        if root is None:
+            return jsonify({"error": f"Unknown app '{app_name}'. Use one of: {', '.join(RENDER_ROOTS)}."}), 404
+
+        try:
+            width = int(request.args['w']) if request.args.get('w') else None
+            height = int(request.args['h']) if request.args.get('h') else None
+        except ValueError:
+            return jsonify({"error": "w and h must be integers."}), 400
+        if width is None and height is None:
+            return jsonify({"error": "At least one of w or h is required."}), 400
+        if any(d is not None and not 1 <= d <= RENDER_MAX_DIMENSION for d in (width, height)):
+            return jsonify({"error": f"w and h must be between 1 and {RENDER_MAX_DIMENSION}."}), 400
+
+        fmt = request.args.get('fmt', 'webp').lower()
+        if fmt == 'jpg':
+            fmt = 'jpeg'
+        if fmt not in RENDER_FORMATS:
+            return jsonify({"error": f"Unsupported fmt '{fmt}'. Use one of: {', '.join(RENDER_FORMATS)}."}), 400
+
+        source_path = os.path.join(root, image_path)
+        if _is_under(source_path, root):
+            source_path = resolve_image(*os.path.split(source_path))
+        if (not source_path or not _is_under(source_path, root) or image_path.split('/')[0] == "Json_Files"
+                or not image_path.lower().endswith(IMAGE_EXTENSIONS) or not os.path.isfile(source_path)):
+            return jsonify({"error": "Image not found."}), 404
+
+        rendition, key = get_rendition(source_path, width, height, fmt)
+        response = send_file(rendition, mimetype=RENDER_FORMATS[fmt][1], etag=key, conditional=True)
+        if response.status_code == 200:
+            response.content_length = os.fstat(rendition.fileno()).st_size
+        response.headers["Cache-Control"] = "no-cache"  # the same URL follows source replacements
+        return response
+
+    except Exception as e:
+        return jsonify({
+            "error": "Something went wrong while rendering the image.",
+            "details": str(e)
+        }), 500
 
 
 # --- Runing :))) ---
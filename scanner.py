@@ -0,0 +1,135 @@
+# Single-pass scanner for the category -> sub category -> image folder layout
+# shared by every listing endpoint. Only reads: no Flask, no side effects on
+# import, so it can be used (and measured) on its own.
+import os
+import json
+import hashlib
+from datetime import datetime, timezone
+from typing import NamedTuple
+
+
+# A category folder may hold an ORDER_MANIFEST listing its image files in
+# display order; see the order helpers in assets.py for how it is written.
+ORDER_MANIFEST = "_order.json"
+
+
+def read_order(folder):
+    # File names in display order, or None for a legacy folder
+    try:
+        with open(os.path.join(folder, ORDER_MANIFEST), 'r') as f:
+            return json.load(f)["order"]
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+
+
+# --- Single-pass category tree scanner ---
+# Every listing endpoint reads the same category -> sub category -> image
+# layout. scan_tree() walks it with one os.scandir per directory: DirEntry
+# carries the file type from readdir, so telling folders from images costs no
+# extra syscall, and size/mtime are only stat'ed (once) when a caller asks.
+class ImageEntry:
+    __slots__ = ("name", "path", "_entry")
+
+    def __init__(self, entry, name=None):
+        self.name = name or entry.name  # public (logical) name; path is the file on disk
+        self.path = entry.path
+        self._entry = entry
+
+    def stat(self):
+        return self._entry.stat()  # cached by DirEntry after the first call
+
+    @property
+    def size(self):
+        return self.stat().st_size
+
+    @property
+    def mtime(self):
+        return self.stat().st_mtime
+
+    @property
+    def mtime_ns(self):
+        return self.stat().st_mtime_ns
+
+
+class SubCategoryEntry(NamedTuple):
+    name: str
+    images: list
+    manifest: object = None  # DirEntry of the folder's ORDER_MANIFEST, if any
+
+
+class CategoryEntry(NamedTuple):
+    name: str
+    images: list           # images stored directly in the category folder
+    sub_categories: list   # SubCategoryEntry, sorted by name
+    manifest: object = None
+
+
+def _scan_dir(path, extensions):
+    # Returns (sorted sub-directory DirEntries, ImageEntries sorted by public name, manifest DirEntry or None)
+    dirs, files, manifest = [], {}, None
+    with os.scandir(path) as it:
+        for entry in it:
+            if entry.is_dir():
+                dirs.append(entry)
+            elif entry.name == ORDER_MANIFEST:
+                manifest = entry
+            elif entry.name.lower().endswith(extensions):
+                files[entry.name] = entry
+    dirs.sort(key=lambda e: e.name)
+    if manifest is None:
+        images = [ImageEntry(entry) for entry in files.values()]
+    else:
+        images = [
+            ImageEntry(files[name], f"{position}{os.path.splitext(name)[1]}")
+            for position, name in enumerate(read_order(path) or []) if name in files
+        ]
+    images.sort(key=lambda e: e.name)
+    return dirs, images, manifest
+
+
+def scan_category(path, extensions):
+    dirs, images, manifest = _scan_dir(path, extensions)
+    sub_categories = [SubCategoryEntry(d.name, *_scan_dir(d.path, extensions)[1:]) for d in dirs]
+    return CategoryEntry(os.path.basename(path), images, sub_categories, manifest)
+
+
+def scan_tree(root, extensions, skip=("Json_Files",)):
+    # Returns a CategoryEntry per top-level folder of root, sorted by name
+    with os.scandir(root) as it:
+        folders = sorted((e for e in it if e.is_dir() and e.name not in skip), key=lambda e: e.name)
+    return [scan_category(folder.path, extensions) for folder in folders]
+
+
+# --- Fingerprint of a scanned tree plus its JSON folder, for ETags ---
+def scan_fingerprint(categories, json_root):
+    h = hashlib.sha1()
+    latest = 0
+
+    def add(rel_path, st):
+        nonlocal latest
+        h.update(f"{rel_path}:{st.st_size}:{st.st_mtime_ns}\n".encode())
+        latest = max(latest, st.st_mtime)
+
+    for category in categories:
+        for image in category.images:
+            add(f"{category.name}/{image.name}", image.stat())
+        if category.manifest:
+            add(f"{category.name}/{ORDER_MANIFEST}", category.manifest.stat())
+        for sub in category.sub_categories:
+            for image in sub.images:
+                add(f"{category.name}/{sub.name}/{image.name}", image.stat())
+            if sub.manifest:
+                add(f"{category.name}/{sub.name}/{ORDER_MANIFEST}", sub.manifest.stat())
+
+    stack = [(json_root, "Json_Files")] if os.path.isdir(json_root) else []
+    while stack:
+        path, rel = stack.pop()
+        with os.scandir(path) as it:
+            for entry in sorted(it, key=lambda e: e.name):
+                if entry.is_dir():
+                    stack.append((entry.path, f"{rel}/{entry.name}"))
+                else:
+                    add(f"{rel}/{entry.name}", entry.stat())
+
+    last_modified = datetime.fromtimestamp(latest, timezone.utc) if latest else None
+    return h.hexdigest(), last_modified
@@ -0,0 +1,35 @@
+import importlib
+import os
+import shutil
+import sys
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_MODULES = ("assets", "scanner", "transcode")
+
+# The app is a flat set of modules at the repository root
+sys.path.insert(0, REPO_DIR)
+
+
+@pytest.fixture
+def load_app(tmp_path, monkeypatch):
+    # assets.py keeps its journal, locks and versions next to itself and reads
+    # its IBGC_* switches on import, so each test imports a fresh copy of the
+    # app over a copy of the shipped IBGC tree
+    def load(**env):
+        for key, value in env.items():
+            monkeypatch.setenv(key, value)
+        for name in APP_MODULES:
+            shutil.copy(os.path.join(REPO_DIR, f"{name}.py"), tmp_path)
+            monkeypatch.delitem(sys.modules, name, raising=False)
+        static_dir = tmp_path / "static"
+        shutil.copytree(os.path.join(REPO_DIR, "static", "Assets_IBGC"), static_dir / "Assets_IBGC")
+        shutil.copy(os.path.join(REPO_DIR, "static", "version_IBGC.json"), static_dir)
+        os.makedirs(static_dir / "Imagine-New")
+        monkeypatch.syspath_prepend(str(tmp_path))
+        return importlib.import_module("assets")
+
+    yield load
+    for name in APP_MODULES:
+        sys.modules.pop(name, None)
@@ -0,0 +1,140 @@
+# Delta sync: a client at any version N that applies /changes_IBGC?since=N the
+# way fold_changes() documents it ends up with exactly the published catalog.
+import hashlib
+import io
+import random
+
+import pytest
+from PIL import Image
+
+CATEGORIES = [("Autumn", None), ("Frame Categories", "love")]
+
+
+def client_state(assets):
+    # What a synced client holds: every published file's content and prem flag
+    index = assets.get_catalog_index()
+    state = {}
+    for category in index["categories"]:
+        key = (category["main_category"], category["sub_category"])
+        folder = assets.ibgc_paths(*key, index["root"])[0]
+        state[key] = {}
+        for image in category["images"]:
+            with open(assets.resolve_image(folder, image["filename"]), 'rb') as f:
+                state[key][image["filename"]] = (hashlib.md5(f.read()).hexdigest(), image["prem"])
+    return state
+
+
+def apply_delta(state, delta, server):
+    # Client side of /changes_IBGC: renames, then per category the moves as one
+    # permutation, the removals, the downloads and the prem flags
+    state = {key: dict(files) for key, files in state.items()}
+    for rename in delta["renamed"]:
+        old = (rename["from"]["main_category"], rename["from"]["sub_category"])
+        new = (rename["to"]["main_category"], rename["to"]["sub_category"])
+        for key in list(state):
+            if key == old or (old[1] is None and key[0] == old[0]):
+                state[(new[0], key[1] if old[1] is None else new[1])] = state.pop(key)
+
+    for category in delta["categories"]:
+        key = (category["main_category"], category["sub_category"])
+        files = {} if category.get("category_removed") or category.get("reset") else state.get(key, {})
+        moved = {dst: files[src] for src, dst in category["moved"].items()}
+        files = {name: value for name, value in files.items() if name not in category["moved"]}
+        files.update(moved)
+        for name in category["removed"]:
+            del files[name]
+        for name in category["download"]:
+            files[name] = (server[key][name][0], None)
+        for name, prem in category["prem"].items():
+            files[name] = (files[name][0], prem)
+        if category.get("category_removed"):
+            state.pop(key, None)
+        else:
+            state[key] = files
+    return state
+
+
+def png(rng):
+    buffer = io.BytesIO()
+    Image.new('RGB', (16, 16), tuple(rng.randrange(256) for _ in range(3))).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def random_update(client, rng, state):
+    main_category, sub_category = key = rng.choice(CATEGORIES)
+    names = sorted(state[key], key=lambda name: int(name.split('.')[0]))
+    form = {"sub_category": sub_category} if sub_category else {}
+    op = rng.choice(["add", "delete", "swap", "reorder", "replace"] if len(names) > 2 else ["add"])
+
+    if op == "add":
+        count = rng.randint(1, 2)
+        form.update({
+            "category_name": main_category,
+            "images": [(io.BytesIO(png(rng)), f"new{i}.png") for i in range(count)],
+            "prem": [rng.choice(["true", "false"]) for _ in range(count)]
+        })
+        return client.post('/add-images-to-category', data=form, content_type='multipart/form-data')
+    if op == "delete":
+        form.update({"main_category": main_category, "filename": rng.choice(names)})
+        return client.post('/delete-image-from-category', data=form)
+    if op == "swap":
+        image1_name, image2_name = rng.sample(names, 2)
+        form.update({"category_name": main_category, "image1_name": image1_name, "image2_name": image2_name})
+        return client.post('/swap-images_IBGC', data=form)
+    if op == "reorder":
+        order = list(names)
+        rng.shuffle(order)
+        form.update({"category_name": main_category, "order": order})
+        return client.post('/reorder_IBGC', data=form)
+    form.update({
+        "main_category": main_category,
+        "old_filename": rng.choice(names),
+        "new_image": (io.BytesIO(png(rng)), "replacement.png"),
+        "prem": rng.choice(["true", "false"])
+    })
+    return client.post('/replace-category-image', data=form, content_type='multipart/form-data')
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_changes_since_every_version_replay_to_the_final_catalog(load_app, seed):
+    assets = load_app(IBGC_TRANSCODE_WORKERS="1")
+    client = assets.app.test_client()
+    rng = random.Random(seed)
+
+    first_version = assets.get_current_version()["current_version"]
+    states = {first_version: client_state(assets)}
+    for _ in range(20):
+        response = random_update(client, rng, states[max(states)])
+        assert response.status_code == 200, response.get_json()
+        states[assets.get_current_version()["current_version"]] = client_state(assets)
+
+    final_version = max(states)
+    assert sorted(states) == list(range(first_version, final_version + 1))
+    for since, state in states.items():
+        delta = client.get(f'/changes_IBGC?since={since}').get_json()
+        assert delta["current_version"] == final_version
+        assert not delta["full_resync"]
+        assert apply_delta(state, delta, states[final_version]) == states[final_version], f"since={since}"
+
+
+def test_changes_ask_for_a_full_resync_across_unknown_history(load_app):
+    assets = load_app()
+    client = assets.app.test_client()
+    shipped_version = assets.get_current_version()["current_version"]
+
+    response = client.post('/delete-image-from-category', data={"main_category": "Autumn", "filename": "0.webp"})
+    assert response.status_code == 200
+
+    # The shipped tree predates the change log: nothing to fold from before it
+    delta = client.get(f'/changes_IBGC?since={shipped_version - 1}').get_json()
+    assert delta["full_resync"] and delta["categories"] == []
+    delta = client.get(f'/changes_IBGC?since={shipped_version}').get_json()
+    assert not delta["full_resync"]
+    assert delta["categories"][0]["main_category"] == "Autumn"
+
+    # An update whose changes are unknown forces everyone behind it to resync
+    assets.increment_version()
+    assert client.get(f'/changes_IBGC?since={shipped_version}').get_json()["full_resync"]
+    current_version = assets.get_current_version()["current_version"]
+    delta = client.get(f'/changes_IBGC?since={current_version}').get_json()
+    assert not delta["full_resync"] and delta["categories"] == []
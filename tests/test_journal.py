@@ -0,0 +1,83 @@
+# Write-ahead journal: a request that dies halfway is rolled back by
+# recover_journals(), and a failed mutation rolls back through its own journal,
+# in both the in-place and the staged publish layouts.
+import os
+
+import pytest
+
+STAGED = [pytest.param("false", id="in-place"), pytest.param("true", id="staged")]
+
+
+def snapshot(assets):
+    tree = {}
+    for dir_path, dirs, files in os.walk(assets.CURRENT_DIR):
+        for name in files:
+            path = os.path.join(dir_path, name)
+            with open(path, 'rb') as f:
+                tree[os.path.relpath(path, assets.CURRENT_DIR)] = f.read()
+    return tree, assets.get_current_version()
+
+
+@pytest.mark.parametrize("staged", STAGED)
+def test_recover_journals_undoes_a_request_that_died_mid_sequence(load_app, staged):
+    assets = load_app(IBGC_STAGED_PUBLISH=staged)
+    before = snapshot(assets)
+
+    journal = assets.journal_begin([("Autumn", None)])
+    category_path, json_path = assets.ibgc_paths("Autumn", None, journal["root"])
+    assets.journal_write_bytes(journal, os.path.join(category_path, "0.webp"), b"overwritten")
+    assets.journal_remove(journal, os.path.join(category_path, "1.webp"))
+    assets.journal_rename(journal, os.path.join(category_path, "2.webp"), os.path.join(category_path, "1.webp"))
+    assets.journal_makedirs(journal, os.path.join(category_path, "new", "nested"))
+    assets.journal_write_json(journal, json_path, {"Image0": {"Name": "0"}})
+    assets.increment_version(journal, [assets.change_entry("removed", "Autumn", filename="1.webp")])
+    assert assets.get_current_version()["current_version"] == before[1]["current_version"] + 1
+    assert snapshot(assets)[0] != before[0]
+
+    # The process dies before journal_commit(): its flocks go with it
+    journal["log_file"].close()
+    assets.release_locks(journal["locks"])
+
+    assert assets.recover_journals() == [journal["id"]]
+    assert snapshot(assets) == before
+    assert not os.path.exists(os.path.join(assets.CURRENT_DIR, "Autumn", "new"))
+    assert os.listdir(assets.JOURNAL_DIR) == []
+
+
+def test_recover_journals_skips_a_live_journal(load_app):
+    assets = load_app()
+    journal = assets.journal_begin([("Autumn", None)])
+    assets.journal_write_bytes(journal, os.path.join(assets.CURRENT_DIR, "Autumn", "0.webp"), b"in progress")
+
+    assert assets.recover_journals() == []
+    assert os.path.exists(journal["log_path"])
+    assets.journal_rollback(journal)
+
+
+@pytest.mark.parametrize("staged", STAGED)
+def test_failed_mutation_rolls_back_with_the_version_unchanged(load_app, monkeypatch, staged):
+    assets = load_app(IBGC_STAGED_PUBLISH=staged)
+    before = snapshot(assets)
+
+    def failing_payload(*args, **kwargs):
+        raise OSError("disk full")
+
+    # Fails inside the version bump, after the image is gone and the folder reindexed
+    write_catalog_payload = assets.write_catalog_payload
+    monkeypatch.setattr(assets, "write_catalog_payload", failing_payload)
+    response = assets.app.test_client().post(
+        '/delete-image-from-category', data={"main_category": "Autumn", "filename": "3.webp"}
+    )
+
+    assert response.status_code == 500
+    assert response.get_json()["error"] == "disk full"
+    assert snapshot(assets) == before
+    assert os.listdir(assets.JOURNAL_DIR) == []
+
+    # The counter is free for the next writer and moves by exactly one
+    monkeypatch.setattr(assets, "write_catalog_payload", write_catalog_payload)
+    response = assets.app.test_client().post(
+        '/delete-image-from-category', data={"main_category": "Autumn", "filename": "3.webp"}
+    )
+    assert response.status_code == 200
+    assert response.get_json()["version"]["current_version"] == before[1]["current_version"] + 1
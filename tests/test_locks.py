@@ -0,0 +1,88 @@
+# Category write locks: writers of unrelated categories run side by side,
+# writers of the same category run one after the other.
+import threading
+import time
+
+import pytest
+
+WAIT = 5
+
+
+def acquire_in_thread(assets, scopes):
+    # Returns (acquired event, release function) for ibgc_lock(scopes) taken by a new thread
+    acquired, release = threading.Event(), threading.Event()
+
+    def run():
+        locks = assets.ibgc_lock(scopes)
+        acquired.set()
+        release.wait(WAIT)
+        assets.release_locks(locks)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+
+    def finish():
+        release.set()
+        thread.join(WAIT)
+    return acquired, finish
+
+
+def test_sub_category_lock_leaves_other_categories_free(load_app):
+    assets = load_app()
+    held = assets.ibgc_lock([("Frame Categories", "love")])
+    try:
+        for scopes in ([("Autumn", None)], [("Frame Categories", "birthday")]):
+            acquired, finish = acquire_in_thread(assets, scopes)
+            assert acquired.wait(WAIT), f"{scopes} waited on the Frame Categories/love lock"
+            finish()
+
+        # The whole main category does wait for its sub-category writer
+        acquired, finish = acquire_in_thread(assets, [("Frame Categories", None)])
+        assert not acquired.wait(0.3)
+    finally:
+        assets.release_locks(held)
+    assert acquired.wait(WAIT)
+    finish()
+
+
+@pytest.mark.parametrize("second, overlap", [
+    (("Autumn", None), False),
+    (("Fire", None), True),
+], ids=["same-category", "other-category"])
+def test_writers_of_one_category_are_serialized(load_app, monkeypatch, second, overlap):
+    assets = load_app()
+    active, peak = [0], [0]
+    counter = threading.Lock()
+    ibgc_swap = assets.ibgc_swap
+
+    def slow_swap(*args, **kwargs):
+        with counter:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.3)
+        try:
+            return ibgc_swap(*args, **kwargs)
+        finally:
+            with counter:
+                active[0] -= 1
+
+    monkeypatch.setattr(assets, "ibgc_swap", slow_swap)
+    statuses = []
+
+    def swap(category_name):
+        response = assets.app.test_client().post('/swap-images_IBGC', data={
+            "category_name": category_name, "image1_name": "0.webp", "image2_name": "1.webp"
+        })
+        statuses.append(response.status_code)
+
+    threads = [threading.Thread(target=swap, args=(name,)) for name in ("Autumn", second[0])]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(WAIT)
+
+    assert statuses == [200, 200]
+    assert peak[0] == (2 if overlap else 1)
+    # Both publishes landed, one version each
+    assert assets.get_current_version()["current_version"] == assets.get_change_log()["versions"][-1]["version"]
+    assert len(assets.get_change_log()["versions"]) == 2
@@ -0,0 +1,88 @@
+# Cursor pagination of /view-category_IBGC: cursors round-trip, a tampered or
+# misplaced cursor is a 400, and a cursor from an older version keeps going.
+import base64
+import json
+
+import pytest
+
+
+def fetch_all(client, query):
+    items, cursor = [], None
+    while True:
+        response = client.get(f'/view-category_IBGC?{query}' + (f'&cursor={cursor}' if cursor else ''))
+        assert response.status_code == 200, response.get_json()
+        body = response.get_json()
+        items += body.get("categories", body.get("images"))
+        cursor = body["next_cursor"]
+        if cursor is None:
+            return items
+
+
+@pytest.mark.parametrize("data", [
+    {"v": 3, "after": "10.webp"},
+    {"v": 3, "after": ["Frame Categories", "love"]},
+    {"v": 0, "after": None},
+    {"v": 7, "after": "Été ✓"},
+])
+def test_cursor_round_trip(load_app, data):
+    assets = load_app()
+    cursor = assets.encode_cursor(data)
+    assert "=" not in cursor and "+" not in cursor and "/" not in cursor
+    assert assets.decode_cursor(cursor) == data
+
+
+@pytest.mark.parametrize("cursor", [
+    "not a cursor!",
+    base64.urlsafe_b64encode(b"{truncated").decode(),
+    base64.urlsafe_b64encode(json.dumps([1, 2]).encode()).decode(),
+    base64.urlsafe_b64encode(json.dumps({"v": 1, "after": 5}).encode()).decode(),
+    base64.urlsafe_b64encode(json.dumps({"v": 1, "after": ["Autumn"]}).encode()).decode(),
+    base64.urlsafe_b64encode(json.dumps({"v": 1, "after": ["Autumn", None]}).encode()).decode(),
+], ids=["not-base64", "not-json", "not-an-object", "int-after", "short-pair", "null-sub"])
+def test_tampered_cursor_is_a_400(load_app, cursor):
+    assets = load_app()
+    with pytest.raises(ValueError):
+        assets.decode_cursor(cursor)
+    response = assets.app.test_client().get(f'/view-category_IBGC?limit=2&cursor={cursor}')
+    assert response.status_code == 400
+    assert response.get_json()["error"].startswith("Invalid pagination parameters")
+
+
+def test_pages_cover_the_listing_exactly_once(load_app):
+    assets = load_app()
+    client = assets.app.test_client()
+    whole = client.get('/view-category_IBGC?category=Autumn').get_json()["images"]
+    assert fetch_all(client, 'category=Autumn&limit=3') == whole
+
+    categories = fetch_all(client, 'limit=4&include_images=false')
+    keys = [[c["main_category"], c["sub_category"] or ""] for c in categories]
+    assert keys == sorted(keys) and len(keys) == len(assets.get_catalog_index()["categories"])
+
+
+def test_cursor_from_a_different_listing_is_a_400(load_app):
+    assets = load_app()
+    client = assets.app.test_client()
+    category_cursor = client.get('/view-category_IBGC?limit=2').get_json()["next_cursor"]
+    image_cursor = client.get('/view-category_IBGC?category=Autumn&limit=2').get_json()["next_cursor"]
+
+    for query, cursor in (("category=Autumn&limit=2", category_cursor), ("limit=2", image_cursor)):
+        response = client.get(f'/view-category_IBGC?{query}&cursor={cursor}')
+        assert response.status_code == 400
+        assert "different listing" in response.get_json()["error"]
+
+
+def test_stale_cursor_resumes_after_its_name_and_flags_the_new_version(load_app):
+    assets = load_app()
+    client = assets.app.test_client()
+    first = client.get('/view-category_IBGC?category=Autumn&limit=4').get_json()
+    assert [image["filename"] for image in first["images"]] == ["0.webp", "1.webp", "10.webp", "2.webp"]
+
+    # An image before the cursor goes away: the names after it shift down by one
+    response = client.post('/delete-image-from-category', data={"main_category": "Autumn", "filename": "0.webp"})
+    assert response.status_code == 200
+
+    second = client.get(f'/view-category_IBGC?category=Autumn&limit=4&cursor={first["next_cursor"]}').get_json()
+    assert second["version"] == first["version"] + 1
+    assert second["version_changed"]
+    assert [image["filename"] for image in second["images"]] == ["3.webp", "4.webp", "5.webp", "6.webp"]
+    assert assets.decode_cursor(second["next_cursor"])["v"] == second["version"]
@@ -0,0 +1,39 @@
+# /rename-category rewrites the per-image category fields of the renamed JSON
+# and leaves its shape alone.
+import json
+
+import pytest
+
+
+def read_json(assets, main_category, sub_category=None):
+    with open(assets.ibgc_paths(main_category, sub_category)[1], 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+@pytest.mark.parametrize("staged", ["false", "true"], ids=["in-place", "staged"])
+def test_sub_rename_updates_each_image_entry(load_app, staged):
+    assets = load_app(IBGC_STAGED_PUBLISH=staged)
+    before = read_json(assets, "Frame Categories", "birthday")
+
+    response = assets.app.test_client().post('/rename-category', data={
+        "old_main_name": "Frame Categories", "old_sub_name": "birthday", "new_sub_name": "Birthday"
+    })
+
+    assert response.status_code == 200, response.get_json()
+    after = read_json(assets, "Frame Categories", "Birthday")
+    assert list(after) == list(before)
+    assert all(isinstance(entry, dict) and entry["sub_category"] == "Birthday" for entry in after.values())
+
+
+def test_main_rename_updates_each_image_entry(load_app):
+    assets = load_app()
+    before = read_json(assets, "Autumn")
+
+    response = assets.app.test_client().post('/rename-category', data={
+        "old_main_name": "Autumn", "new_main_name": "Fall"
+    })
+
+    assert response.status_code == 200, response.get_json()
+    after = read_json(assets, "Fall")
+    assert list(after) == list(before)
+    assert all(entry["main_category"] == "Fall" for entry in after.values())
@@ -0,0 +1,106 @@
+# Syscall counts of scan_tree() against the os.listdir + os.path.isdir loops the
+# listing endpoints ran before it, on the trees the repo ships in static/.
+import os
+
+import pytest
+
+import scanner
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TREES = [
+    pytest.param(os.path.join(REPO_DIR, "static", "Imagine-New"), ('.jpg', '.png'), id="imagine"),
+    pytest.param(os.path.join(REPO_DIR, "static", "Assets_IBGC"), ('.webp', '.jpg', '.jpeg', '.png'), id="ibgc"),
+]
+
+
+class SyscallCounter:
+    def __init__(self, monkeypatch):
+        self.calls = {"scandir": 0, "listdir": 0, "stat": 0, "entry_stat": 0}
+        self._statted = set()
+        for name in ("scandir", "listdir", "stat"):
+            monkeypatch.setattr(os, name, self._counting(name, getattr(os, name)))
+        entry_stat = scanner.ImageEntry.stat
+
+        def counting_entry_stat(image):
+            # DirEntry.stat() hits the disk once, then serves its cache
+            if id(image._entry) not in self._statted:
+                self._statted.add(id(image._entry))
+                self.calls["entry_stat"] += 1
+            return entry_stat(image)
+
+        monkeypatch.setattr(scanner.ImageEntry, "stat", counting_entry_stat)
+
+    def _counting(self, name, fn):
+        def wrapper(*args, **kwargs):
+            self.calls[name] += 1
+            return fn(*args, **kwargs)
+        return wrapper
+
+    @property
+    def total(self):
+        return sum(self.calls.values())
+
+
+def legacy_walk(root, extensions, with_stat):
+    # The pre-scanner loop: listdir per folder, an isdir() per entry, getsize()/getmtime() per image
+    def images_in(folder):
+        images = []
+        for name in sorted(os.listdir(folder)):
+            path = os.path.join(folder, name)
+            if name.lower().endswith(extensions) and not os.path.isdir(path):
+                images.append((name, os.path.getsize(path), os.path.getmtime(path)) if with_stat else (name,))
+        return images
+
+    tree = []
+    for main_cat in sorted(os.listdir(root)):
+        main_path = os.path.join(root, main_cat)
+        if main_cat == "Json_Files" or not os.path.isdir(main_path):
+            continue
+        subs = [
+            (sub, images_in(os.path.join(main_path, sub)))
+            for sub in sorted(os.listdir(main_path)) if os.path.isdir(os.path.join(main_path, sub))
+        ]
+        tree.append((main_cat, images_in(main_path), subs))
+    return tree
+
+
+def scanner_walk(root, extensions, with_stat):
+    def images_of(images):
+        return [(img.name, img.size, img.mtime) if with_stat else (img.name,) for img in images]
+
+    return [
+        (category.name, images_of(category.images), [(sub.name, images_of(sub.images)) for sub in category.sub_categories])
+        for category in scanner.scan_tree(root, extensions)
+    ]
+
+
+@pytest.mark.parametrize("root, extensions", TREES)
+@pytest.mark.parametrize("with_stat", [False, True], ids=["names", "size+mtime"])
+def test_scan_tree_makes_fewer_syscalls_than_listdir_loops(monkeypatch, root, extensions, with_stat):
+    if not os.path.isdir(root) or os.path.islink(root):
+        pytest.skip(f"{root} is not a plain folder here")
+
+    legacy_counter = SyscallCounter(monkeypatch)
+    legacy = legacy_walk(root, extensions, with_stat)
+    monkeypatch.undo()
+
+    scanner_counter = SyscallCounter(monkeypatch)
+    scanned = scanner_walk(root, extensions, with_stat)
+    monkeypatch.undo()
+
+    # Same tree either way
+    assert scanned == legacy
+
+    folders = 1 + sum(1 + len(subs) for _, _, subs in legacy)
+    images = sum(len(imgs) + sum(len(sub_imgs) for _, sub_imgs in subs) for _, imgs, subs in legacy)
+
+    # One scandir per folder, and one stat per image only when size/mtime is read
+    assert scanner_counter.calls["scandir"] == folders
+    assert scanner_counter.calls["listdir"] == 0
+    assert scanner_counter.calls["stat"] == 0
+    assert scanner_counter.calls["entry_stat"] == (images if with_stat else 0)
+
+    print(f"\n{os.path.basename(root)} ({'size+mtime' if with_stat else 'names'}): "
+          f"listdir loops {legacy_counter.total} syscalls {legacy_counter.calls}, "
+          f"scan_tree {scanner_counter.total} syscalls {scanner_counter.calls}")
+    assert scanner_counter.total < legacy_counter.total
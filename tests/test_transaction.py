@@ -0,0 +1,77 @@
+# /transaction_IBGC is all-or-nothing: a failing step rolls back every earlier
+# step, names the failed operation and leaves the version where it was.
+import io
+import json
+import os
+
+import pytest
+from PIL import Image
+
+STAGED = [pytest.param("false", id="in-place"), pytest.param("true", id="staged")]
+
+
+def snapshot(assets):
+    tree = {}
+    for dir_path, dirs, files in os.walk(assets.CURRENT_DIR):
+        for name in files:
+            path = os.path.join(dir_path, name)
+            with open(path, 'rb') as f:
+                tree[os.path.relpath(path, assets.CURRENT_DIR)] = f.read()
+    return tree, assets.get_current_version()
+
+
+def post_transaction(client, operations):
+    buffer = io.BytesIO()
+    Image.new('RGB', (16, 16), (200, 30, 30)).save(buffer, 'PNG')
+    return client.post('/transaction_IBGC', data={
+        "operations": json.dumps(operations),
+        "img0": (io.BytesIO(buffer.getvalue()), "new.png")
+    }, content_type='multipart/form-data')
+
+
+SUCCEEDING = [
+    {"op": "add_images", "category_name": "Autumn", "images": ["img0"], "prem": ["true"]},
+    {"op": "swap", "category_name": "Autumn", "image1_name": "0.webp", "image2_name": "5.webp"},
+    {"op": "delete_image", "main_category": "Frame Categories", "sub_category": "love", "filename": "0.webp"},
+    {"op": "rename", "old_main_name": "Frame Categories", "old_sub_name": "birthday", "new_sub_name": "Birthday"},
+]
+
+
+@pytest.mark.parametrize("staged", STAGED)
+@pytest.mark.parametrize("failing, status", [
+    ({"op": "delete_image", "main_category": "Autumn", "filename": "99.webp"}, 404),
+    ({"op": "rename", "old_main_name": "Fire", "new_main_name": "Summer"}, 400),
+], ids=["missing-image", "rename-collision"])
+def test_failing_step_rolls_back_the_whole_transaction(load_app, staged, failing, status):
+    assets = load_app(IBGC_STAGED_PUBLISH=staged, IBGC_TRANSCODE_WORKERS="1")
+    client = assets.app.test_client()
+    before = snapshot(assets)
+
+    response = post_transaction(client, SUCCEEDING + [failing])
+
+    assert response.status_code == status
+    body = response.get_json()
+    assert body["success"] is False
+    assert body["failed_operation"] == len(SUCCEEDING)
+    assert "rollback_error" not in body
+    assert snapshot(assets) == before
+    assert os.listdir(assets.JOURNAL_DIR) == []
+
+
+@pytest.mark.parametrize("staged", STAGED)
+def test_transaction_publishes_exactly_one_version(load_app, staged):
+    assets = load_app(IBGC_STAGED_PUBLISH=staged, IBGC_TRANSCODE_WORKERS="1")
+    client = assets.app.test_client()
+    before_version = assets.get_current_version()["current_version"]
+
+    response = post_transaction(client, SUCCEEDING)
+
+    assert response.status_code == 200, response.get_json()
+    assert [result["op"] for result in response.get_json()["results"]] == [op["op"] for op in SUCCEEDING]
+    assert assets.get_current_version()["current_version"] == before_version + 1
+    assert os.path.isdir(os.path.join(assets.CURRENT_DIR, "Frame Categories", "Birthday"))
+    delta = client.get(f'/changes_IBGC?since={before_version}').get_json()
+    assert delta["renamed"] == [{
+        "from": {"main_category": "Frame Categories", "sub_category": "birthday"},
+        "to": {"main_category": "Frame Categories", "sub_category": "Birthday"}
+    }]
@@ -0,0 +1,24 @@
+# WebP encoder for IBGC uploads. Kept out of assets.py so transcode pool
+# workers can import it without the app: no Flask, no side effects on import.
+import io
+import os
+from PIL import Image
+
+
+WEBP_QUALITY = int(os.environ.get("IBGC_WEBP_QUALITY", "85"))
+WEBP_LOSSLESS = os.environ.get("IBGC_WEBP_LOSSLESS", "false").lower() == "true"
+WEBP_METHOD = int(os.environ.get("IBGC_WEBP_METHOD", "4"))  # 0 (fast) .. 6 (smallest)
+
+
+def transcode_to_webp(source):
+    # source is a staged file path (or raw bytes); returns WebP bytes, or None
+    # for an upload that already is WebP and is kept byte-for-byte
+    with Image.open(source if isinstance(source, str) else io.BytesIO(source)) as img:
+        if img.format == "WEBP":
+            return None
+        img.load()
+        if img.mode not in ("RGB", "RGBA"):
+            img = img.convert("RGBA" if img.has_transparency_data else "RGB")
+        buffer = io.BytesIO()
+        img.save(buffer, "WEBP", quality=WEBP_QUALITY, lossless=WEBP_LOSSLESS, method=WEBP_METHOD)
+        return buffer.getvalue()